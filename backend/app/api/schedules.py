@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from typing import List
+
+from fastapi import APIRouter, HTTPException
+
+from engine.executor import Schedule, scheduler
+
+from ..models.schemas import ScheduleLimitsModel, ScheduleModel
+
+router = APIRouter(prefix="/api/schedules")
+
+
+@router.get("/", response_model=List[ScheduleModel])
+def list_schedules():
+    return [ScheduleModel(**s.to_dict()) for s in scheduler.list()]
+
+
+@router.get("/state")
+def scheduler_state():
+    """Limits, running tasks, queued runs (highest priority first) and all schedules."""
+    return scheduler.state()
+
+
+@router.post("/", response_model=ScheduleModel)
+def save_schedule(schedule: ScheduleModel):
+    data = schedule.dict(exclude={"next_run", "last_run", "last_status"})
+    try:
+        saved = scheduler.upsert(Schedule(**data))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return ScheduleModel(**saved.to_dict())
+
+
+@router.delete("/{schedule_id}")
+def delete_schedule(schedule_id: str):
+    if not scheduler.remove(schedule_id):
+        raise HTTPException(status_code=404, detail="schedule not found")
+    return {"status": "deleted"}
+
+
+@router.post("/{schedule_id}/run")
+def run_schedule_now(schedule_id: str):
+    if not scheduler.run_now(schedule_id):
+        raise HTTPException(status_code=404, detail="schedule or task not found")
+    return {"status": "queued"}
+
+
+@router.put("/limits")
+def set_limits(limits: ScheduleLimitsModel):
+    scheduler.set_limits(max_running=limits.max_running, max_per_window=limits.max_per_window)
+    return {"max_running": scheduler.max_running, "max_per_window": scheduler.max_per_window}
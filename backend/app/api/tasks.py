@@ -2,13 +2,13 @@
 
 import json
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 import yaml
 
 from fastapi import APIRouter, HTTPException, Body
 
 from engine import config as engine_config
-from engine.executor import TaskDefinition, executor
+from engine.executor import TaskDefinition, executor, module_cache
 from engine.window import TargetWindowConfig
 
 from ..models.schemas import TaskDefinitionModel, TaskListResponse
@@ -103,6 +103,7 @@ def _discover_tasks_from_disk() -> List[Dict]:
                     "path": str(sub),
                     "templates_path": str(sub / data.get("templates", "templates.yaml")),
                     "target_window": data.get("target_window") or {},
+                    "mode": data.get("mode", "thread"),
                 }
             )
         except Exception:
@@ -127,6 +128,7 @@ def list_tasks():
                         "entry": data.get("entry", merged.get("entry")),
                         "templates_path": str((task_dir / data.get("templates", "templates.yaml")).as_posix()),
                         "target_window": data.get("target_window", merged.get("target_window")),
+                        "mode": data.get("mode", merged.get("mode", "thread")),
                     }
                 )
             except Exception:
@@ -139,7 +141,8 @@ def list_tasks():
 def save_task(task: TaskDefinitionModel):
     try:
         tasks = _load_tasks()
-        # upsert
+        # upsert; keys the model does not carry (capture, watchdog, reuse_instance...) are kept
+        previous = next((t for t in tasks if t["id"] == task.id), {})
         tasks = [t for t in tasks if t["id"] != task.id]
 
         # Ensure task directory
@@ -147,16 +150,23 @@ def save_task(task: TaskDefinitionModel):
         task_path = Path(task_dir)
         task_path.mkdir(parents=True, exist_ok=True)
 
-        # Write task.yaml
-        task_yaml = {
-            "id": task.id,
-            "name": task.name,
-            "script": task.script or "main.py",
-            "entry": task.entry or "MainTask",
-            "templates": task.templates_path or "templates.yaml",
-            "target_window": task.target_window.dict() if task.target_window else {},
-        }
-        (task_path / "task.yaml").write_text(yaml.safe_dump(task_yaml, allow_unicode=True), encoding="utf-8")
+        # Write task.yaml, updating only the fields the model carries
+        yaml_path = task_path / "task.yaml"
+        task_yaml = {}
+        if yaml_path.exists():
+            task_yaml = yaml.safe_load(yaml_path.read_text(encoding="utf-8")) or {}
+        task_yaml.update(
+            {
+                "id": task.id,
+                "name": task.name,
+                "script": task.script or "main.py",
+                "entry": task.entry or "MainTask",
+                "templates": task.templates_path or "templates.yaml",
+                "target_window": task.target_window.dict() if task.target_window else {},
+                "mode": task.mode,
+            }
+        )
+        yaml_path.write_text(yaml.safe_dump(task_yaml, allow_unicode=True), encoding="utf-8")
         # Ensure templates.yaml exists
         templates_file = task_path / (task.templates_path or "templates.yaml")
         if not templates_file.exists():
@@ -176,7 +186,8 @@ def save_task(task: TaskDefinitionModel):
             if task.script_content:
                 script_file.write_text(task.script_content, encoding="utf-8")
 
-        tasks.append(
+        entry = dict(previous)
+        entry.update(
             {
                 "id": task.id,
                 "name": task.name,
@@ -185,20 +196,22 @@ def save_task(task: TaskDefinitionModel):
                 "path": str(task_path),
                 "templates_path": str(templates_file),
                 "target_window": task.target_window.dict() if task.target_window else {},
+                "mode": task.mode,
             }
         )
+        tasks.append(entry)
         _write_tasks(tasks)
         return TaskDefinitionModel(**tasks[-1])
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"save_task error: {exc}") from exc
 
 
-@router.post("/{task_id}/run")
-def run_task(task_id: str):
+def build_task_definition(task_id: str) -> Optional[TaskDefinition]:
+    """Resolve a task id from tasks.json / task.yaml into a runnable TaskDefinition."""
     tasks = refresh_tasks_cache()
     target = next((t for t in tasks if t["id"] == task_id), None)
     if not target:
-        raise HTTPException(status_code=404, detail="任务不存在")
+        return None
 
     task_dir = Path(target.get("path") or engine_config.get_tasks_root() / target["id"])
     task_yaml = task_dir / "task.yaml"
@@ -206,13 +219,21 @@ def run_task(task_id: str):
     entry = target["entry"]
     templates_path = target.get("templates_path") or (task_dir / "templates.yaml")
     cfg = target.get("target_window") or {}
+    capture = target.get("capture")
+    mode = target.get("mode", "thread")
+    reuse_instance = bool(target.get("reuse_instance", False))
+    watchdog = target.get("watchdog") or {}
     if task_yaml.exists():
         data = yaml.safe_load(task_yaml.read_text(encoding="utf-8")) or {}
         script = data.get("script", script)
         entry = data.get("entry", entry)
         templates_path = task_dir / data.get("templates", "templates.yaml")
         cfg = data.get("target_window") or cfg
-    task_def = TaskDefinition(
+        capture = data.get("capture", capture)
+        mode = data.get("mode", mode)
+        reuse_instance = bool(data.get("reuse_instance", reuse_instance))
+        watchdog = data.get("watchdog") or watchdog
+    return TaskDefinition(
         id=target["id"],
         name=target["name"],
         script=str(task_dir / script),
@@ -220,17 +241,69 @@ def run_task(task_id: str):
         path=str(task_dir),
         templates_path=str(templates_path),
         target_window=TargetWindowConfig(
-            title_contains=cfg.get("title_contains"), process_name=cfg.get("process_name"), hwnd=cfg.get("hwnd")
+            title_contains=cfg.get("title_contains"),
+            process_name=cfg.get("process_name"),
+            hwnd=cfg.get("hwnd"),
+            multi=bool(cfg.get("multi", False)),
+            max_windows=cfg.get("max_windows"),
         ),
+        capture=capture,
+        mode=mode,
+        reuse_instance=reuse_instance,
+        max_runtime=watchdog.get("max_runtime"),
+        progress_timeout=watchdog.get("progress_timeout"),
+        watchdog_action=watchdog.get("action", "stop"),
     )
-    executor.run_task(task_def)
+
+
+@router.post("/{task_id}/run")
+def run_task(task_id: str):
+    task_def = build_task_definition(task_id)
+    if not task_def:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    try:
+        executor.run_task(task_def)
+    except (ValueError, RuntimeError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return {"status": "started"}
+
+
+@router.post("/{task_id}/warm")
+def warm_task(task_id: str):
+    """Load the script and decode its templates now, so the next run starts from a warm instance."""
+    task_def = build_task_definition(task_id)
+    if not task_def:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if task_def.mode == "process":
+        raise HTTPException(status_code=400, detail="process tasks are warmed inside their worker")
+    try:
+        executor.warm_up(task_def)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"warm_task error: {exc}") from exc
+    return {"status": "warm", **module_cache.stats()}
+
+
 @router.post("/{task_id}/stop")
 def stop_task(task_id: str):
     stopped = executor.stop_task(task_id)
     if not stopped:
         raise HTTPException(status_code=404, detail="task not running")
-    return {"status": "stopping"}
+    return {"status": "stopping" if executor.is_running(task_id) else "stopped"}
+
+
+@router.get("/{task_id}/status")
+def task_status(task_id: str):
+    """
+    Latest run of a task: mode, running/finished/failed/stopped/killed, CPU seconds, worker pid, watchdog findings.
+
+    Multi-window tasks also list their per-window instances (task_id@hwnd) under "instances".
+    """
+    status = executor.status(task_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="task has not been run")
+    return status
 
 
 @router.get("/{task_id}/script")
@@ -1,20 +1,26 @@
 ﻿from __future__ import annotations
 
-import time
+import io
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional
 
+import numpy as np
 import yaml
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from fastapi.responses import Response
-from PIL import Image
+from PIL import Image, ImageDraw
 
 from engine import config as engine_config
 from engine.logging import log_store
-from engine.templates import load_templates
-from engine.vision import match_template
+from engine.hotzones import hot_zones
+from engine.persist import load_image, persister, thumbnail_path, write_thumbnail
+from engine.registry import scale_cache, template_registry
+from engine.store import GC_GRACE, image_store, resolve_configs
+from engine.store import ref as store_ref
+from engine.vision import match_memo, run_match_job
 
 from ..models.schemas import SaveTemplateRequest, TemplateDefinitionModel, TemplateTestRequest
+from .tasks import build_task_definition, refresh_tasks_cache
 
 router = APIRouter(prefix="/api/templates")
 
@@ -30,14 +36,21 @@ def list_templates(task_id: Optional[str] = None):
     config_path = None
     if task_id:
         config_path = engine_config.get_tasks_root() / task_id / "templates.yaml"
-    templates = load_templates(config_path=config_path)
+    templates = template_registry.templates(config_path)
     result: Dict[str, TemplateDefinitionModel] = {}
     for key, tpl in templates.items():
         result[key] = TemplateDefinitionModel(
             key=key,
             file=str(Path(tpl.file).as_posix()),
             description=tpl.description,
-            match={"threshold": tpl.threshold, "method": tpl.method},
+            match={
+                "threshold": tpl.threshold,
+                "method": tpl.method,
+                "pyramid": tpl.pyramid,
+                "scale_range": list(tpl.scale_range) if tpl.scale_range else None,
+                "scale_step": tpl.scale_step,
+                "max_results": tpl.max_results,
+            },
             search_region=tpl.search_region,
             click={
                 "mode": tpl.click_mode,
@@ -49,6 +62,7 @@ def list_templates(task_id: Optional[str] = None):
                 },
             },
             type=tpl.__class__.__name__.replace("Template", "").lower() or "click",
+            mask=str(Path(tpl.mask_file).as_posix()) if tpl.mask_file else None,
         )
     return result
 
@@ -59,7 +73,7 @@ def save_template(request: SaveTemplateRequest):
     if not base_image_path.exists():
         raise HTTPException(status_code=404, detail="base image not found")
 
-    base_image = Image.open(base_image_path)
+    base_image = load_image(base_image_path)
     width, height = base_image.size
 
     def _rect_to_box(rect):
@@ -72,26 +86,45 @@ def save_template(request: SaveTemplateRequest):
     crop_box = _rect_to_box(request.template_rect)
     cropped = base_image.crop(crop_box)
 
-    output_name = f"{request.key}.png"
     subdir = request.task_id.strip() if request.task_id else None
-    base_dir = engine_config.get_images_dir()
-    if subdir:
-        base_dir = engine_config.get_tasks_root() / subdir / "images"
-    save_dir = base_dir
-    save_path = save_dir / output_name
-    save_path.parent.mkdir(parents=True, exist_ok=True)
-    cropped.save(save_path)
+    # Crops are stored by content: identical crops of several tasks share one file.
+    file_digest, _ = image_store.put_image(cropped)
+
+    mask_digest = None
+    if request.mask_exclude:
+        # White = compared, black = ignored (e.g. animated background behind a button).
+        mask = Image.new("L", cropped.size, 255)
+        draw = ImageDraw.Draw(mask)
+        cw, ch = cropped.size
+        for rect in request.mask_exclude:
+            if rect.width <= 0 or rect.height <= 0:
+                continue
+            x0, y0 = max(0, int(rect.x * cw)), max(0, int(rect.y * ch))
+            # At least one pixel, clipped to the crop.
+            x1 = min(cw, x0 + max(1, int(rect.width * cw))) - 1
+            y1 = min(ch, y0 + max(1, int(rect.height * ch))) - 1
+            if x0 > x1 or y0 > y1:
+                continue
+            draw.rectangle((x0, y0, x1, y1), fill=0)
+        mask_digest, _ = image_store.put_image(mask)
 
     config_path = engine_config.get_templates_config_path()
     if subdir:
         config_path = engine_config.get_tasks_root() / subdir / "templates.yaml"
 
+    previous = template_registry.templates(config_path).get(request.key)
     data = _load_config(config_path)
     data.setdefault("templates", {})
     data["templates"][request.key] = {
-        "file": str(Path(save_path).relative_to(config_path.parent).as_posix()),
+        "file": store_ref(file_digest),
         "description": request.description,
-        "match": {"threshold": request.threshold, "method": request.match_method},
+        "match": {
+            "threshold": request.threshold,
+            "method": request.match_method,
+            "pyramid": request.pyramid,
+            "scale_range": request.scale_range,
+            "scale_step": request.scale_step,
+        },
         "search_region": request.search_region.dict() if request.search_region else None,
         "click": {
             "mode": request.click_mode,
@@ -100,43 +133,45 @@ def save_template(request: SaveTemplateRequest):
         "type": "click",
         "task_id": request.task_id,
     }
+    if mask_digest:
+        data["templates"][request.key]["mask"] = store_ref(mask_digest)
+    # The base the crop came from, so gc keeps it for re-cropping.
+    base_digest = image_store.digest_of(base_image_path)
+    if base_digest:
+        data["templates"][request.key]["base"] = store_ref(base_digest)
     config_path.write_text(yaml.safe_dump(data, allow_unicode=True), encoding="utf-8")
+    template_registry.invalidate(config_path)
+    if previous:
+        scale_cache.forget(config_path, previous.file)
+    hot_zones.reset(config_path, request.key)
 
     return TemplateDefinitionModel(
         key=request.key,
-        file=str(Path(save_path).relative_to(config_path.parent).as_posix()),
+        file=store_ref(file_digest),
         description=request.description,
-        match={"threshold": request.threshold, "method": request.match_method},
+        match={
+            "threshold": request.threshold,
+            "method": request.match_method,
+            "pyramid": request.pyramid,
+            "scale_range": request.scale_range,
+            "scale_step": request.scale_step,
+        },
         search_region=request.search_region,
         click={"mode": request.click_mode, "padding": request.padding},
         type="click",
+        mask=store_ref(mask_digest) if mask_digest else None,
     )
 
 
 @router.post("/upload-base")
 def upload_base(task_id: Optional[str] = Form(None), file: UploadFile = File(...)):
-    base_dir = engine_config.get_images_dir() / "base_uploads"
-    if task_id:
-        base_dir = engine_config.get_tasks_root() / task_id / "images"
-    base_dir.mkdir(parents=True, exist_ok=True)
-    filename = f"base_{int(time.time())}_{file.filename}"
-    save_path = base_dir / filename
+    """Store an uploaded base in the shared image store; task_id is accepted for older clients."""
     content = file.file.read()
-    save_path.write_bytes(content)
-    return {"path": str(save_path)}
-
-
-def _abs_region(search_region, size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
-    if not search_region:
-        return None
-    if search_region.get("type") != "relative":
-        return None
-    return (
-        int(search_region["x"] * size[0]),
-        int(search_region["y"] * size[1]),
-        int(search_region["width"] * size[0]),
-        int(search_region["height"] * size[1]),
-    )
+    try:
+        digest, save_path = image_store.put_bytes(content, Path(file.filename or "").suffix)
+    except (OSError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=f"invalid image: {exc}")
+    return {"path": str(save_path), "digest": digest}
 
 
 @router.post("/test")
@@ -144,23 +179,16 @@ def test_template(request: TemplateTestRequest, task_id: Optional[str] = None):
     config_path = None
     if task_id:
         config_path = engine_config.get_tasks_root() / task_id / "templates.yaml"
-    templates = load_templates(config_path=config_path)
+    templates = template_registry.templates(config_path)
     tpl = templates.get(request.key)
     if not tpl:
         raise HTTPException(status_code=404, detail="template not found")
     base_image_path = Path(request.base_image_path)
     if not base_image_path.exists():
         raise HTTPException(status_code=404, detail="test base image not found")
-    base_image = Image.open(base_image_path)
+    base_image = load_image(base_image_path)
     size = base_image.size
-    region = _abs_region(tpl.search_region, size)
-    result = match_template(
-        image=base_image,
-        template=tpl.load_image(),
-        threshold=tpl.threshold,
-        region=region,
-        method=tpl.method,
-    )
+    result = run_match_job(base_image, tpl.match_job(size))
     if not result:
         log_store.log(f"[TEST] {request.key} not matched in {request.base_image_path}", level="TEST", task_id="template_test")
         return {"matched": False}
@@ -173,16 +201,74 @@ def test_template(request: TemplateTestRequest, task_id: Optional[str] = None):
     return {
         "matched": True,
         "confidence": result.confidence,
+        "scale": result.scale,
         "rect": {"x": result.rect[0], "y": result.rect[1], "width": result.rect[2], "height": result.rect[3]},
         "click_point": {"x": click_point[0], "y": click_point[1]},
         "image_size": {"width": size[0], "height": size[1]},
     }
 
 
+@router.get("/registry/stats")
+def registry_stats():
+    data = template_registry.stats()
+    data.update(hot_zones.stats())
+    data.update(match_memo.stats())
+    return data
+
+
+@router.get("/store/stats")
+def store_stats():
+    return image_store.stats()
+
+
+@router.post("/store/gc")
+def store_gc(dry_run: bool = False, grace_hours: float = GC_GRACE / 3600, legacy: bool = False):
+    """Remove stored images (and with legacy, old base_* files) no templates.yaml references."""
+    configs, problems = resolve_configs()
+    # Also every config the task API itself resolves, e.g. custom templates: names.
+    for task in refresh_tasks_cache():
+        try:
+            task_def = build_task_definition(task["id"])
+        except Exception as exc:
+            problems.append(f"{task.get('id')}: {exc}")
+            continue
+        if task_def and Path(task_def.templates_path).exists():
+            configs.append(Path(task_def.templates_path))
+    if problems:
+        raise HTTPException(status_code=409, detail=f"无法解析全部任务的模板配置，未删除任何图片: {problems}")
+    try:
+        return image_store.gc(configs=configs, grace=grace_hours * 3600, dry_run=dry_run, legacy=legacy)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+@router.get("/hotzones")
+def suggest_search_regions(task_id: Optional[str] = None):
+    """Tighter search_region suggestions learned from recent hit locations."""
+    config_path = engine_config.get_templates_config_path()
+    if task_id:
+        config_path = engine_config.get_tasks_root() / task_id / "templates.yaml"
+    return hot_zones.suggest(config_path)
+
+
+_MEDIA_TYPES = {".png": "image/png", ".webp": "image/webp", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".bmp": "image/bmp"}
+
+
 @router.get("/base-image")
-def get_base_image(path: str):
+def get_base_image(path: str, thumbnail: bool = False):
     p = Path(path)
-    if not p.exists():
+    # A screenshot may still be encoding in the background.
+    if not persister.wait(p) or not p.exists():
         raise HTTPException(status_code=404, detail="image not found")
+    if thumbnail:
+        thumb = thumbnail_path(p)
+        if not thumb.exists():
+            write_thumbnail(np.asarray(load_image(p).convert("RGB")), p)
+        return Response(content=thumb.read_bytes(), media_type="image/jpeg")
+    if p.suffix.lower() == ".npy":
+        # Raw arrays are stored for speed; the browser needs an encoded image.
+        buf = io.BytesIO()
+        load_image(p).save(buf, format="PNG", compress_level=1)
+        return Response(content=buf.getvalue(), media_type="image/png")
     data = p.read_bytes()
-    return Response(content=data, media_type="image/png")
+    return Response(content=data, media_type=_MEDIA_TYPES.get(p.suffix.lower(), "image/png"))
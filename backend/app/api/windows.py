@@ -1,14 +1,13 @@
 from __future__ import annotations
 
-import time
-from pathlib import Path
 from typing import List
 
 from fastapi import APIRouter, HTTPException
 
-from engine import config as engine_config
 from engine import window as window_engine
-from engine.capture import capture_window
+from engine.capture import get_capture_backend
+from engine.persist import DEFAULT_CODEC, PNG_COMPRESS_LEVEL, persister
+from engine.store import image_store
 from engine.window import TargetWindowConfig
 
 from ..models.schemas import TargetWindowConfigModel
@@ -34,13 +33,41 @@ def select_window(cfg: TargetWindowConfigModel):
     return TargetWindowConfigModel(title_contains=cfg.title_contains, process_name=cfg.process_name, hwnd=hwnd)
 
 
+@router.post("/window/select-all", response_model=List[int])
+def select_windows(cfg: TargetWindowConfigModel):
+    """Every window a multi-window task with this selector would run on."""
+    target = TargetWindowConfig(title_contains=cfg.title_contains, process_name=cfg.process_name, hwnd=cfg.hwnd)
+    hwnds = window_engine.find_windows(target)
+    return hwnds[: cfg.max_windows] if cfg.max_windows else hwnds
+
+
 @router.post("/window/{hwnd}/screenshot-base")
-def screenshot_base(hwnd: int):
-    if not window_engine.window_exists(hwnd):
+def screenshot_base(
+    hwnd: int,
+    codec: str = DEFAULT_CODEC,
+    compress_level: int = PNG_COMPRESS_LEVEL,
+    thumbnail: bool = True,
+):
+    """Capture now and encode in the background; poll /api/screenshots/{job_id} for completion."""
+    backend = get_capture_backend()
+    if backend.needs_window and not window_engine.window_exists(hwnd):
         raise HTTPException(status_code=404, detail="窗口不存在")
-    image = capture_window(hwnd)
-    filename = f"base_{hwnd}_{int(time.time())}.png"
-    save_path: Path = engine_config.get_images_dir() / filename
-    save_path.parent.mkdir(parents=True, exist_ok=True)
-    image.save(save_path)
-    return {"path": str(save_path)}
+    frame = backend.grab(hwnd)
+    try:
+        digest, save_path, job = image_store.put_frame(
+            frame, codec=codec, compress_level=compress_level, thumbnail=thumbnail
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if job is None:
+        # The same pixels are already stored, nothing to encode.
+        return {"job_id": None, "status": "done", "path": str(save_path), "digest": digest}
+    return {**job.to_dict(), "digest": digest}
+
+
+@router.get("/screenshots/{job_id}")
+def screenshot_status(job_id: str):
+    job = persister.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.to_dict()
@@ -15,9 +15,10 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
 from engine import config as engine_config
+from engine.executor import executor, scheduler
 from engine.logging import log_store
 
-from .api import logs, tasks, templates, windows
+from .api import logs, schedules, tasks, templates, windows
 
 app = FastAPI(title="WinAutoClick Framework", version="0.1.0")
 
@@ -25,6 +26,7 @@ app.include_router(windows.router)
 app.include_router(templates.router)
 app.include_router(tasks.router)
 app.include_router(logs.router)
+app.include_router(schedules.router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,6 +47,13 @@ async def startup():
     # Clear in-memory logs and refresh tasks cache from disk on each start.
     log_store.clear()
     tasks.refresh_tasks_cache()
+    scheduler.start(resolver=tasks.build_task_definition)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    scheduler.stop()
+    executor.shutdown()
 
 
 frontend_dir: Path = engine_config.get_frontend_dir()
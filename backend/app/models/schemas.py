@@ -9,6 +9,8 @@ class TargetWindowConfigModel(BaseModel):
     title_contains: Optional[str] = Field(default=None, description="窗口标题包含的关键字")
     process_name: Optional[str] = Field(default=None, description="可选进程名")
     hwnd: Optional[int] = Field(default=None, description="指定窗口句柄")
+    multi: bool = Field(default=False, description="匹配所有符合条件的窗口，每个窗口运行一个任务实例")
+    max_windows: Optional[int] = Field(default=None, description="多窗口模式下最多运行的实例数")
 
 
 class RectModel(BaseModel):
@@ -34,6 +36,10 @@ class TemplateClickModel(BaseModel):
 class TemplateMatchModel(BaseModel):
     threshold: float = 0.85
     method: str = "TM_CCOEFF_NORMED"
+    pyramid: int = Field(default=1, description="金字塔粗匹配缩放倍数，1 表示仅全分辨率匹配")
+    scale_range: Optional[List[float]] = Field(default=None, description="多尺度匹配的缩放范围 [min, max]")
+    scale_step: float = 0.05
+    max_results: int = Field(default=50, description="列表模板 find_all 返回的最大命中数")
 
 
 class TemplateDefinitionModel(BaseModel):
@@ -44,6 +50,7 @@ class TemplateDefinitionModel(BaseModel):
     search_region: Optional[RectModel] = None
     click: TemplateClickModel = Field(default_factory=TemplateClickModel)
     type: str = "click"
+    mask: Optional[str] = None
 
 
 class SaveTemplateRequest(BaseModel):
@@ -57,6 +64,10 @@ class SaveTemplateRequest(BaseModel):
     click_mode: str = "center"
     padding: TemplateClickPaddingModel = Field(default_factory=TemplateClickPaddingModel)
     match_method: str = "TM_CCOEFF_NORMED"
+    pyramid: int = 1
+    scale_range: Optional[List[float]] = None
+    scale_step: float = 0.05
+    mask_exclude: List[RectModel] = Field(default_factory=list, description="模板内需忽略的区域（相对模板裁剪区域 0~1），用于动态背景")
 
 
 class TemplateTestRequest(BaseModel):
@@ -73,6 +84,8 @@ class TaskDefinitionModel(BaseModel):
     templates_path: Optional[str] = None
     script_content: Optional[str] = None
     target_window: Optional[TargetWindowConfigModel] = None
+    # "thread" (default) or "process" for CPU-heavy tasks isolated in a worker process.
+    mode: str = "thread"
 
 
 class LogRecordModel(BaseModel):
@@ -84,3 +97,23 @@ class LogRecordModel(BaseModel):
 
 class TaskListResponse(BaseModel):
     tasks: List[TaskDefinitionModel]
+
+
+class ScheduleModel(BaseModel):
+    id: str
+    task_id: str
+    trigger: str = "interval"  # interval | cron
+    interval: float = 60.0
+    cron: Optional[str] = None  # "*/5 9-18 * * 1-5"
+    priority: int = 0
+    misfire: str = "run_once"  # run_once | skip | run_all
+    misfire_grace: float = 30.0
+    enabled: bool = True
+    next_run: Optional[float] = None
+    last_run: Optional[float] = None
+    last_status: Optional[str] = None
+
+
+class ScheduleLimitsModel(BaseModel):
+    max_running: Optional[int] = None
+    max_per_window: Optional[int] = None
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import multiprocessing
 import threading
 import webbrowser
 
@@ -22,4 +23,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Process-mode tasks spawn workers from the frozen executable too.
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from PIL import Image
+
+from .task_base import PollPacer, TaskBase, TaskStopped
+from .templates import Template
+from .vision import MatchResult
+
+T = TypeVar("T")
+
+# Threads shared by every async task for blocking capture/match/input work.
+BLOCKING_WORKERS = min(32, (os.cpu_count() or 4) + 4)
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_blocking_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="task-io")
+        return _pool
+
+
+class AsyncTaskBase(TaskBase):
+    """
+    TaskBase whose run() is a coroutine, for many mostly-idle watchers on one event loop.
+
+    wait_match/wait_appear/disappear/appear/match_many/appear_any/find_all,
+    click_template/appear_then_click and sleep are awaitable: waiting happens
+    on the loop, only the capture/match work of a tick runs on the shared
+    blocking pool and clicks are awaited on the input dispatcher. The
+    synchronous helpers of TaskBase stay available.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_stop: Optional[asyncio.Event] = None
+
+    def reset_for_run(self) -> None:
+        super().reset_for_run()
+        self._loop = None
+        self._async_stop = None
+
+    def _bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach to the loop the task runs on; called from inside that loop."""
+        self._loop = loop
+        self._async_stop = asyncio.Event()
+        if self.should_stop():
+            self._async_stop.set()
+
+    async def _blocking(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_blocking_pool(), functools.partial(fn, *args, **kwargs))
+
+    def request_stop(self) -> None:
+        super().request_stop()
+        loop, event = self._loop, self._async_stop
+        if loop is not None and event is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(event.set)
+
+    async def sleep(self, sec: float) -> None:
+        """Sleep without holding a thread; raises TaskStopped as soon as the task is stopped."""
+        self._mark_progress(time.time() + max(0.0, sec))
+        await self._wait_async(sec)
+
+    async def _wait_async(self, seconds: float) -> None:
+        if self._async_stop is None:
+            self._bind_loop(asyncio.get_running_loop())
+        if seconds > 0:
+            try:
+                await asyncio.wait_for(self._async_stop.wait(), timeout=seconds)
+            except asyncio.TimeoutError:
+                pass
+        if self.should_stop():
+            raise TaskStopped()
+
+    async def _budget(self) -> None:
+        # Respect max_fps on the loop instead of blocking a pool thread.
+        await self._wait_async(self._capture_budget_wait())
+
+    async def _poll_async(
+        self,
+        check: Callable[[Any], Optional[T]],
+        timeout: float,
+        interval: float,
+        templates: List[Template],
+    ) -> Optional[T]:
+        """Async counterpart of TaskBase._poll: same pacing, one pool hop per tick."""
+
+        def _tick():
+            frame = self._capture_for(templates)
+            return frame, self._checked(check(frame))
+
+        deadline = time.monotonic() + timeout
+        pacer = PollPacer(interval)
+        while True:
+            await self._budget()
+            frame, value = await self._blocking(_tick)
+            if value:
+                self._mark_progress()
+                return value
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await self._wait_async(min(pacer.next_delay(frame.digest()), remaining))
+
+    async def _click_async(self, template: Template, match: MatchResult, interval: float) -> None:
+        # The dispatcher performs the click; only the loop waits for it, no pool thread.
+        future = self._submit_click(template, match, interval)
+        try:
+            finished = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        self._last_action_at = max(self._last_action_at, finished)
+        await self._wait_async(interval)
+
+    # Awaitable API
+    async def screenshot(self) -> Image.Image:
+        await self._budget()
+        frame = await self._blocking(self.capture)
+        return frame.image
+
+    async def match_many(
+        self, templates_or_keys: Iterable, threshold: Optional[float] = None, first_hit: bool = False
+    ) -> Dict[str, Optional[MatchResult]]:
+        templates = [self.resolve_template(item) for item in templates_or_keys]
+        await self._budget()
+        return await self._blocking(self._match_many, templates, threshold, first_hit)
+
+    async def appear_any(self, templates_or_keys: Iterable, threshold: Optional[float] = None) -> Optional[str]:
+        return self._best_key(await self.match_many(templates_or_keys, threshold=threshold, first_hit=True))
+
+    async def appear(self, template_or_key, threshold: Optional[float] = None) -> bool:
+        template = self.resolve_template(template_or_key)
+        await self._budget()
+        return await self._blocking(self._match, template, threshold) is not None
+
+    async def find_all(
+        self, template_or_key, threshold: Optional[float] = None, max_results: Optional[int] = None
+    ) -> List[MatchResult]:
+        template = self.resolve_template(template_or_key)
+        await self._budget()
+        frame = await self._blocking(self._capture_for, [template])
+        return self._checked(
+            await self._blocking(template.find_all, frame, frame.size, threshold=threshold, max_results=max_results)
+        )
+
+    async def wait_match(
+        self, template_or_key, timeout: float = 10, interval: float = 0.5, threshold: Optional[float] = None
+    ) -> Optional[MatchResult]:
+        template = self.resolve_template(template_or_key)
+        return await self._poll_async(
+            lambda frame: template.find(frame, frame.size, threshold=threshold, should_stop=self.should_stop),
+            timeout,
+            interval,
+            [template],
+        )
+
+    async def wait_appear(
+        self, template_or_key, timeout: float = 10, interval: float = 0.5, threshold: Optional[float] = None
+    ) -> bool:
+        return await self.wait_match(template_or_key, timeout=timeout, interval=interval, threshold=threshold) is not None
+
+    async def disappear(self, template_or_key, timeout: float = 10, interval: float = 0.5) -> bool:
+        template = self.resolve_template(template_or_key)
+        return bool(
+            await self._poll_async(
+                lambda frame: template.find(frame, frame.size, should_stop=self.should_stop) is None,
+                timeout,
+                interval,
+                [template],
+            )
+        )
+
+    async def click_template(self, template_or_key, threshold: Optional[float] = None, interval: float = 0.2) -> bool:
+        template = self.resolve_template(template_or_key)
+        await self._budget()
+        match = await self._blocking(self._match, template, threshold)
+        if not match:
+            self.log(f"未匹配到模板: {template.key}", level="WARN")
+            return False
+        await self._click_async(template, match, interval)
+        return True
+
+    async def submit_click(
+        self, template_or_key, threshold: Optional[float] = None, interval: float = 0.2
+    ) -> Optional[Future]:
+        """Awaitable TaskBase.submit_click: matches on the blocking pool, does not wait for the click."""
+        template = self.resolve_template(template_or_key)
+        await self._budget()
+        match = await self._blocking(self._match, template, threshold)
+        if not match:
+            self.log(f"未匹配到模板: {template.key}", level="WARN")
+            return None
+        future = self._submit_click(template, match, interval)
+        self._pending_input = [f for f in self._pending_input if not f.done()] + [future]
+        return future
+
+    async def wait_input(self) -> None:
+        """Await every click queued with submit_click() on the loop, without holding a thread."""
+        pending, self._pending_input = self._pending_input, []
+        for future in pending:
+            if future.cancelled():
+                continue
+            try:
+                finished = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            self._last_action_at = max(self._last_action_at, finished)
+        if self.should_stop():
+            raise TaskStopped()
+
+    async def appear_then_click(
+        self, template_or_key, timeout: float = 5, interval: float = 0.5, threshold: Optional[float] = None
+    ) -> bool:
+        template = self.resolve_template(template_or_key)
+        match = await self.wait_match(template, timeout=timeout, interval=interval, threshold=threshold)
+        if not match:
+            return False
+        await self._click_async(template, match, interval)
+        return True
+
+    async def run(self, context: Optional[Dict[str, Any]] = None) -> None:
+        raise NotImplementedError("AsyncTaskBase subclasses must implement async run()")
+
+
+class AsyncTaskHandle:
+    """Thread-like handle (is_alive/join) for a task running on the shared event loop."""
+
+    def __init__(self, future: Future) -> None:
+        self.future = future
+
+    def is_alive(self) -> bool:
+        return not self.future.done()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        try:
+            self.future.result(timeout=timeout)
+        except Exception:
+            pass
+
+
+class AsyncTaskLoop:
+    """One background event loop thread hosting every AsyncTaskBase task of an executor."""
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self._thread or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="task-loop", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro) -> AsyncTaskHandle:
+        return AsyncTaskHandle(asyncio.run_coroutine_threadsafe(coro, self._ensure()))
+
+    def stop(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
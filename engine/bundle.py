@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from .config import get_tasks_root, get_templates_config_path
+from .logging import log_store
+from .registry import FileStamp, _stat, decode_image
+from .store import image_digest
+
+BUNDLE_VERSION = 2
+# Every array in the blob starts on this boundary.
+ALIGN = 64
+# Compile bundles on first load and whenever the sources changed.
+AUTO_BUILD = True
+# A blob replaced by a rebuild is deleted by the first rebuild at least this many seconds later.
+BLOB_GRACE = 600.0
+
+# libyaml parses large templates.yaml files several times faster when installed.
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# (offset, shape) of an array in the blob.
+ArrayRef = Tuple[int, Tuple[int, ...]]
+
+
+def index_path(config_path: Path) -> Path:
+    return config_path.with_name(f"{config_path.stem}.bundle.json")
+
+
+def _digest(path: Path) -> str:
+    return hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+
+
+def _aligned(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+@dataclass
+class BundledImage:
+    stamp: FileStamp
+    digest: str
+    color: ArrayRef
+    gray: ArrayRef
+    mask: Optional[ArrayRef] = None
+    # Pixel digest (engine.store.image_digest), shared with identical images of other bundles.
+    pixels: str = ""
+
+    def to_dict(self) -> Dict:
+        return {
+            "stamp": list(self.stamp),
+            "digest": self.digest,
+            "color": self.color,
+            "gray": self.gray,
+            "mask": self.mask,
+            "pixels": self.pixels,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BundledImage":
+        def _ref(raw) -> Optional[ArrayRef]:
+            return (int(raw[0]), tuple(int(v) for v in raw[1])) if raw else None
+
+        return cls(
+            stamp=tuple(data["stamp"]),
+            digest=data["digest"],
+            color=_ref(data["color"]),
+            gray=_ref(data["gray"]),
+            mask=_ref(data.get("mask")),
+            pixels=data.get("pixels", ""),
+        )
+
+
+class TemplateBundle:
+    """
+    Compiled form of a templates.yaml and its images.
+
+    <stem>.bundle.json holds the parsed templates.yaml and, per image, the
+    offsets of its pre-converted RGB, gray and mask arrays in a blob file that
+    is memory-mapped read-only when the bundle loads, so loading a template
+    reads only its own pages and never decodes a PNG. Blobs are named by
+    content hash, so a rebuild never overwrites a blob another process has
+    mapped, and a replaced blob is kept for BLOB_GRACE seconds.
+    """
+
+    def __init__(self, config_path: Path, index: Dict) -> None:
+        self.config_path = config_path
+        self.index = index
+        self.data: Dict = index["data"]
+        base = config_path.parent
+        self.images: Dict[Path, BundledImage] = {
+            base / rel: BundledImage.from_dict(entry) for rel, entry in index["images"].items()
+        }
+        self.blob_path = base / index["blob"]
+        self._blob: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        # Images verified unchanged on disk, with their current stamps.
+        self.verified: Dict[Path, FileStamp] = {}
+
+    def _map(self) -> np.ndarray:
+        with self._lock:
+            if self._blob is None:
+                if self.blob_path.stat().st_size == 0:
+                    self._blob = np.zeros(0, dtype=np.uint8)
+                else:
+                    self._blob = np.memmap(self.blob_path, dtype=np.uint8, mode="r")
+            return self._blob
+
+    def array(self, ref: ArrayRef) -> np.ndarray:
+        offset, shape = ref
+        count = int(np.prod(shape))
+        return self._map()[offset : offset + count].reshape(shape)
+
+    def arrays(self, path: Path) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        entry = self.images[path]
+        return self.array(entry.color), self.array(entry.gray), self.array(entry.mask) if entry.mask else None
+
+    def is_fresh(self) -> bool:
+        """
+        Whether templates.yaml and every image still match the bundle.
+
+        Files are compared by (mtime, size) first and by content hash only when
+        that differs, so copying a task folder does not force a rebuild.
+        """
+        if self.index.get("version") != BUNDLE_VERSION or not self.blob_path.exists():
+            return False
+        config = self.index["config"]
+        stamp = _stat(self.config_path)
+        if stamp is None:
+            return False
+        if list(stamp) != config["stamp"] and _digest(self.config_path) != config["digest"]:
+            return False
+        verified: Dict[Path, FileStamp] = {}
+        for path, entry in self.images.items():
+            stamp = _stat(path)
+            if stamp is None:
+                return False
+            if stamp != entry.stamp and _digest(path) != entry.digest:
+                return False
+            verified[path] = stamp
+        # A referenced image that did not exist at compile time may exist now.
+        for path in self.index.get("missing", []):
+            if (self.config_path.parent / path).exists():
+                return False
+        self.verified = verified
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            self._blob = None
+
+
+def _image_paths(data: Dict, config_path: Path) -> List[Path]:
+    from .templates import template_from_definition
+
+    paths: List[Path] = []
+    for key, definition in (data.get("templates") or {}).items():
+        try:
+            tpl = template_from_definition(key, definition, assets_dir=config_path.parent, config_path=config_path)
+        except Exception:
+            continue
+        for path in (tpl.file, tpl.mask_file):
+            if path and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _relative(path: Path, base: Path) -> str:
+    try:
+        return path.relative_to(base).as_posix()
+    except ValueError:
+        # Absolute template paths outside the task folder.
+        return Path(os.path.relpath(path, base)).as_posix()
+
+
+def compile_bundle(config_path: Path | str, previous: Optional[TemplateBundle] = None) -> TemplateBundle:
+    """
+    Compile templates.yaml and its images into a bundle next to it.
+
+    Arrays of images unchanged since previous are copied from its blob
+    instead of being decoded again, and an unchanged templates.yaml is not
+    parsed again.
+    """
+    config_path = Path(config_path)
+    base = config_path.parent
+    raw = config_path.read_bytes()
+    config_digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    if previous is not None and previous.index.get("config", {}).get("digest") == config_digest:
+        data = previous.data
+    else:
+        data = yaml.load(raw.decode("utf-8"), Loader=_YAML_LOADER) or {}
+    arrays: List[np.ndarray] = []
+    entries: Dict[str, Dict] = {}
+    missing: List[str] = []
+    offset = 0
+
+    def _add(arr: np.ndarray) -> ArrayRef:
+        nonlocal offset
+        ref = (offset, tuple(int(v) for v in arr.shape))
+        arrays.append(np.ascontiguousarray(arr, dtype=np.uint8))
+        offset = _aligned(offset + arr.nbytes)
+        return ref
+
+    reused = 0
+    for path in _image_paths(data, config_path):
+        stamp = _stat(path)
+        if stamp is None:
+            missing.append(_relative(path, base))
+            continue
+        digest = _digest(path)
+        old = previous.images.get(path) if previous else None
+        color = None
+        if old is not None and old.digest == digest and old.pixels:
+            try:
+                color, gray, mask = previous.arrays(path)
+                pixels = old.pixels
+                reused += 1
+            except OSError:
+                # The previous blob is gone; decode the image again.
+                color = None
+        if color is None:
+            color, gray, mask = decode_image(path)
+            pixels = image_digest(color, mask)
+        entry = BundledImage(stamp=stamp, digest=digest, color=_add(color), gray=_add(gray), pixels=pixels)
+        if mask is not None:
+            entry.mask = _add(mask)
+        entries[_relative(path, base)] = entry.to_dict()
+
+    content = hashlib.blake2b(digest_size=8)
+    for arr in arrays:
+        content.update(arr.data)
+    blob_name = f"{config_path.stem}.bundle.{content.hexdigest()}.bin"
+    blob_path = base / blob_name
+    if not blob_path.exists():
+        # Unique per writer: concurrent compiles of one config must not share a temp file.
+        tmp = blob_path.with_name(f".{blob_name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "wb") as fh:
+            position = 0
+            for arr, ref in zip(arrays, _refs(entries)):
+                fh.write(b"\0" * (ref[0] - position))
+                fh.write(arr.data)
+                position = ref[0] + arr.nbytes
+        os.replace(tmp, blob_path)
+    retired = _retire_blobs(config_path, blob_name, previous.index.get("retired", {}) if previous else {})
+    index = {
+        "version": BUNDLE_VERSION,
+        "config": {"stamp": list(_stat(config_path) or (0, 0)), "digest": config_digest},
+        "data": data,
+        "images": entries,
+        "missing": missing,
+        "blob": blob_name,
+        # Replaced blob -> time (time.time) it was replaced, kept for BLOB_GRACE seconds.
+        "retired": retired,
+    }
+    target = index_path(config_path)
+    tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False, default=str), encoding="utf-8")
+    os.replace(tmp, target)
+    log_store.log(
+        f"[bundle] compiled {target.name}: {len(entries)} images ({reused} reused), {offset} bytes", level="INFO"
+    )
+    bundle = TemplateBundle(config_path, index)
+    bundle.is_fresh()
+    bundle._map()
+    return bundle
+
+
+def _refs(entries: Dict[str, Dict]) -> Iterable[ArrayRef]:
+    # Same order as the arrays were added: color, gray, mask per image.
+    for entry in entries.values():
+        for name in ("color", "gray", "mask"):
+            if entry.get(name):
+                yield entry[name]
+
+
+def _retire_blobs(config_path: Path, keep: str, retired: Dict[str, float]) -> Dict[str, float]:
+    """
+    Delete blobs replaced more than BLOB_GRACE seconds ago; returns the
+    replaced blobs still kept, with the time they were replaced.
+
+    Another process may have read the previous index without having mapped
+    its blob yet, so a replaced blob stays on disk for a while.
+    """
+    now = time.time()
+    kept: Dict[str, float] = {}
+    for blob in config_path.parent.glob(f"{config_path.stem}.bundle.*.bin"):
+        if blob.name == keep:
+            continue
+        since = float(retired.get(blob.name, now))
+        if now - since < BLOB_GRACE:
+            kept[blob.name] = since
+            continue
+        try:
+            blob.unlink()
+        except OSError:
+            # Still mapped by a running process (Windows); removed by a later rebuild.
+            kept[blob.name] = since
+    return kept
+
+
+def read_bundle(config_path: Path) -> Optional[TemplateBundle]:
+    try:
+        index = json.loads(index_path(config_path).read_text(encoding="utf-8"))
+        return TemplateBundle(config_path, index)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_bundle(config_path: Path | str, auto_build: Optional[bool] = None) -> Optional[TemplateBundle]:
+    """
+    The up-to-date bundle of a templates.yaml, rebuilding it when the sources
+    changed (auto_build defaults to AUTO_BUILD); None when there is none and
+    it cannot be built, e.g. in a read-only install.
+    """
+    config_path = Path(config_path)
+    if not config_path.exists():
+        return None
+    bundle = read_bundle(config_path)
+    if bundle is not None and bundle.is_fresh():
+        try:
+            # Map now, not on first use: a rebuild elsewhere eventually removes this blob.
+            bundle._map()
+            return bundle
+        except OSError:
+            pass
+    if not (AUTO_BUILD if auto_build is None else auto_build):
+        return None
+    try:
+        return compile_bundle(config_path, previous=bundle)
+    except Exception as exc:
+        log_store.log(f"[bundle] cannot compile {config_path}: {exc}", level="WARN")
+        return None
+
+
+def _all_configs() -> List[Path]:
+    configs = [get_templates_config_path()]
+    root = get_tasks_root()
+    if root.exists():
+        configs.extend(sorted(root.glob("*/templates.yaml")))
+    return [path for path in configs if path.exists()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile templates.yaml files into memory-mapped template bundles.")
+    parser.add_argument("configs", nargs="*", type=Path, help="templates.yaml files (default: assets and every task)")
+    parser.add_argument("--force", action="store_true", help="rebuild even when the bundle is up to date")
+    args = parser.parse_args(argv)
+    for config_path in args.configs or _all_configs():
+        bundle = None if args.force else read_bundle(config_path)
+        if bundle is not None and bundle.is_fresh():
+            print(f"up to date: {index_path(config_path)}")
+            continue
+        bundle = compile_bundle(config_path, previous=None if args.force else bundle)
+        print(f"compiled: {index_path(config_path)} ({len(bundle.images)} images)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
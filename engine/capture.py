@@ -1,19 +1,245 @@
 from __future__ import annotations
 
-from typing import Tuple
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import cv2
 import numpy as np
 from PIL import Image, ImageGrab
 
+from .frame import Frame, Region
 from .window import Rect, get_window_rect
 
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".webp", ".npy"}
+VIDEO_SUFFIXES = {".mp4", ".avi", ".mkv", ".mov", ".webm"}
+
+
+def region_union(regions: Optional[Sequence[Region]], window_size: Tuple[int, int]) -> Optional[Region]:
+    """
+    Bounding box of window-coordinate regions, clipped to the window.
+
+    None means the whole window: no regions were given, or they cover it.
+    """
+    if not regions:
+        return None
+    ww, wh = window_size
+    left = max(0, min(r[0] for r in regions))
+    top = max(0, min(r[1] for r in regions))
+    right = min(ww, max(r[0] + r[2] for r in regions))
+    bottom = min(wh, max(r[1] + r[3] for r in regions))
+    if right <= left or bottom <= top:
+        return None
+    if (left, top, right, bottom) == (0, 0, ww, wh):
+        return None
+    return left, top, right - left, bottom - top
+
+
+class CaptureBackend:
+    """
+    Source of window frames used by TaskBase and the screenshot API.
+
+    Backends with needs_window = False ignore the hwnd, so tasks can run
+    headless against recorded or synthetic frames.
+
+    grab() takes optional window-coordinate regions; only their bounding union
+    is captured and the returned Frame carries its origin.
+    """
+
+    needs_window = True
+
+    def grab(self, hwnd: Optional[int], regions: Optional[Sequence[Region]] = None) -> Frame:
+        raise NotImplementedError
+
+    def grab_newer(self, hwnd: Optional[int], after: float, regions: Optional[Sequence[Region]] = None) -> Frame:
+        """
+        Grab a frame captured after monotonic time `after` (e.g. the last click).
+
+        Synchronous backends capture on the call, so this is grab(); shared
+        backends override it to skip frames older than `after`.
+        """
+        return self.grab(hwnd, regions)
+
+    def window_rect(self, hwnd: Optional[int]) -> Rect:
+        return self.grab(hwnd).window_rect
+
+    def close(self) -> None:
+        pass
+
+
+class ScreenCaptureBackend(CaptureBackend):
+    """Grab the window area from the desktop with PIL.ImageGrab."""
+
+    def grab(self, hwnd: Optional[int], regions: Optional[Sequence[Region]] = None) -> Frame:
+        if not hwnd:
+            raise RuntimeError("Target window not found")
+        rect = get_window_rect(hwnd)
+        left, top, right, bottom = rect
+        area = region_union(regions, (right - left, bottom - top))
+        if area is None:
+            return Frame.from_image(ImageGrab.grab(bbox=rect), window_rect=rect)
+        x, y, w, h = area
+        image = ImageGrab.grab(bbox=(left + x, top + y, left + x + w, top + y + h))
+        return Frame.from_image(image, window_rect=rect, origin=(x, y))
+
+    def window_rect(self, hwnd: Optional[int]) -> Rect:
+        if not hwnd:
+            raise RuntimeError("Target window not found")
+        return get_window_rect(hwnd)
+
+
+class ArrayCaptureBackend(CaptureBackend):
+    """
+    Serve in-memory RGB (or gray) NumPy frames, one per grab.
+
+    When the frames are exhausted the last one is repeated, or playback
+    restarts when loop is set. push() appends frames while running.
+    """
+
+    needs_window = False
+
+    def __init__(self, frames: Sequence[np.ndarray] = (), loop: bool = False, origin: Tuple[int, int] = (0, 0)) -> None:
+        self._frames: List[np.ndarray] = list(frames)
+        self._loop = loop
+        self._origin = origin
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def push(self, frame: np.ndarray) -> None:
+        with self._lock:
+            self._frames.append(frame)
+
+    def _next(self) -> np.ndarray:
+        with self._lock:
+            if not self._frames:
+                raise RuntimeError("capture backend has no frames")
+            if self._index >= len(self._frames):
+                self._index = 0 if self._loop else len(self._frames) - 1
+            frame = self._frames[self._index]
+            self._index += 1
+            return frame
+
+    def grab(self, hwnd: Optional[int], regions: Optional[Sequence[Region]] = None) -> Frame:
+        arr = self._next()
+        h, w = arr.shape[:2]
+        x, y = self._origin
+        rect = (x, y, x + w, y + h)
+        area = region_union(regions, (w, h))
+        if area is None:
+            return Frame(rgb=arr, window_rect=rect)
+        ax, ay, aw, ah = area
+        return Frame(rgb=arr[ay : ay + ah, ax : ax + aw], window_rect=rect, origin=(ax, ay))
+
+    def window_rect(self, hwnd: Optional[int]) -> Rect:
+        with self._lock:
+            if not self._frames:
+                raise RuntimeError("capture backend has no frames")
+            h, w = self._frames[min(self._index, len(self._frames) - 1)].shape[:2]
+        x, y = self._origin
+        return x, y, x + w, y + h
+
+
+def _load_frame_file(path: Path) -> np.ndarray:
+    if path.suffix.lower() == ".npy":
+        return np.load(path)
+    with Image.open(path) as img:
+        return np.array(img.convert("RGB"))
+
+
+class ReplayCaptureBackend(ArrayCaptureBackend):
+    """
+    Replay recorded frames from a directory of images (sorted by name) or a video file.
+
+    Frames are decoded lazily and kept in memory, so a replay is deterministic
+    and each grab costs no decoding after the first pass.
+    """
+
+    def __init__(self, source: Path | str, loop: bool = False, origin: Tuple[int, int] = (0, 0)) -> None:
+        super().__init__(loop=loop, origin=origin)
+        self.source = Path(source)
+        if self.source.is_dir():
+            self._files = sorted(p for p in self.source.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+            self._video = None
+        elif self.source.suffix.lower() in VIDEO_SUFFIXES:
+            self._files = []
+            self._video = cv2.VideoCapture(str(self.source))
+        else:
+            self._files = [self.source]
+            self._video = None
+        self._exhausted = False
+
+    def _decode_more(self) -> bool:
+        if self._exhausted:
+            return False
+        if self._video is not None:
+            ok, bgr = self._video.read()
+            if not ok:
+                self._video.release()
+                self._exhausted = True
+                return False
+            self._frames.append(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+            return True
+        if len(self._frames) < len(self._files):
+            self._frames.append(_load_frame_file(self._files[len(self._frames)]))
+            return True
+        self._exhausted = True
+        return False
+
+    def _next(self) -> np.ndarray:
+        with self._lock:
+            if self._index >= len(self._frames):
+                self._decode_more()
+        return super()._next()
+
+    def window_rect(self, hwnd: Optional[int]) -> Rect:
+        with self._lock:
+            if not self._frames:
+                self._decode_more()
+        return super().window_rect(hwnd)
+
+    def close(self) -> None:
+        if self._video is not None:
+            self._video.release()
+
+
+def create_capture_backend(spec: Optional[Dict]) -> CaptureBackend:
+    """
+    Build a backend from a task config entry, e.g. {"type": "replay", "source": "recordings/", "loop": true}.
+    """
+    spec = spec or {}
+    kind = str(spec.get("type", "screen")).lower()
+    if kind == "screen":
+        return ScreenCaptureBackend()
+    if kind == "replay":
+        return ReplayCaptureBackend(spec["source"], loop=bool(spec.get("loop", False)))
+    if kind == "array":
+        return ArrayCaptureBackend(loop=bool(spec.get("loop", False)))
+    raise ValueError(f"unknown capture backend: {kind}")
+
+
+_backend: CaptureBackend = ScreenCaptureBackend()
+
+
+def get_capture_backend() -> CaptureBackend:
+    return _backend
+
+
+def set_capture_backend(backend: CaptureBackend) -> CaptureBackend:
+    """Replace the process-wide default backend; returns the previous one."""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
 
 def capture_window(hwnd: int) -> Image.Image:
-    rect = get_window_rect(hwnd)
-    left, top, right, bottom = rect
-    return ImageGrab.grab(bbox=(left, top, right, bottom))
+    return capture_frame(hwnd).image
 
 
 def capture_window_array(hwnd: int) -> Tuple[Image.Image, np.ndarray]:
-    image = capture_window(hwnd)
-    return image, np.array(image)
+    frame = capture_frame(hwnd)
+    return frame.image, frame.rgb
+
+
+def capture_frame(hwnd: int, regions: Optional[Sequence[Region]] = None) -> Frame:
+    """Capture the window (or the union of regions) once through the default backend."""
+    return _backend.grab(hwnd, regions)
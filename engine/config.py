@@ -22,6 +22,10 @@ def get_images_dir() -> Path:
     return get_assets_dir() / "images"
 
 
+def get_store_dir() -> Path:
+    return get_assets_dir() / "store"
+
+
 def get_templates_config_path() -> Path:
     return get_assets_dir() / "templates.yaml"
 
@@ -1,16 +1,53 @@
 from __future__ import annotations
 
+import asyncio
+import ctypes
+import hashlib
+import heapq
 import importlib.util
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import signal
 import threading
 import sys
-from dataclasses import dataclass
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field, fields, replace
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Callable, Dict, Optional
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
 
-from .config import get_scripts_dir
+from .async_task import AsyncTaskBase, AsyncTaskHandle, AsyncTaskLoop
+from .capture import CaptureBackend, ScreenCaptureBackend, create_capture_backend
+from .config import get_assets_dir, get_scripts_dir
+from .framebus import BusCaptureBackend, frame_hub
+from .input import input_dispatcher
 from .logging import log_store
-from .task_base import TaskBase
-from .window import TargetWindowConfig
+from .registry import template_registry
+from .task_base import TaskBase, TaskStopped
+from .window import TargetWindowConfig, find_window, find_windows
+
+# Size of the reusable worker pool for mode="process" tasks.
+PROCESS_WORKERS = 2
+# Stop events handed to worker processes; also the most process tasks started at once (queued ones included).
+PROCESS_STOP_SLOTS = 32
+# How often a worker process reports its CPU time while a task runs.
+CPU_REPORT_INTERVAL = 1.0
+# Minimum spacing of progress reports sent by a worker process.
+PROGRESS_REPORT_INTERVAL = 1.0
+# How long stop_task() waits for a task to wind down.
+STOP_JOIN_TIMEOUT = 2.0
+# Watchdog check period, and how long a "kill" waits after the stop request before forcing.
+WATCHDOG_INTERVAL = 0.5
+KILL_GRACE = 3.0
+WATCHDOG_ACTIONS = ("flag", "stop", "kill")
+# How often a multi-window task looks for windows that appeared or disappeared.
+FANOUT_POLL = 1.0
 
 
 @dataclass
@@ -22,12 +59,375 @@ class TaskDefinition:
     path: Optional[str] = None
     templates_path: Optional[str] = None
     target_window: Optional[TargetWindowConfig] = None
+    # Capture backend spec, e.g. {"type": "replay", "source": "recordings/"}; None = screen capture.
+    # {"share": true} reads the window through the shared frame bus (engine.framebus).
+    capture: Optional[Dict[str, Any]] = None
+    # "thread" runs in the API process; "process" runs in a pooled worker process (no shared GIL).
+    mode: str = "thread"
+    # Keep the task instance (templates decoded, window resolved) between runs instead of rebuilding it.
+    reuse_instance: bool = False
+    # Watchdog limits in seconds (None = unlimited): total run time, and time without
+    # progress (a click, a successful wait, a sleep or report_progress()).
+    max_runtime: Optional[float] = None
+    progress_timeout: Optional[float] = None
+    # What the watchdog does when a limit is exceeded: "flag", "stop" or "kill".
+    watchdog_action: str = "stop"
+    # Set on the per-window instances of a multi-window task: the id of that task.
+    group: Optional[str] = None
 
 
-class TaskExecutor:
+@dataclass
+class TaskRun:
+    """Status of the latest run of a task, reported by /api/tasks/{id}/status."""
+
+    task_id: str
+    # thread / async / process, or fanout for the supervisor of a multi-window task.
+    mode: str
+    status: str = "running"
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    # CPU seconds used by the task (its thread, or its worker process).
+    cpu_time: Optional[float] = None
+    pid: Optional[int] = None
+    error: Optional[str] = None
+    # Time from run_task() to the task's run() being called.
+    startup_ms: Optional[float] = None
+    # Wall-clock time of the task's last progress.
+    progress_at: Optional[float] = None
+    # Watchdog finding (e.g. "max_runtime 60s exceeded") and what was done: flagged/stopped/killed.
+    watchdog: Optional[str] = None
+    watchdog_action: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _execute(instance: TaskBase, task_def: TaskDefinition, on_focused: Optional[Callable[[], None]] = None) -> Optional[str]:
+    """Run a built task; returns the error message, or None on success."""
+    try:
+        if instance.target_window_config:
+            instance.ensure_window_focused()
+            if on_focused:
+                on_focused()
+        result = instance.run()
+        if inspect.iscoroutine(result):
+            # Async task outside the shared loop (process mode): give it a loop of its own.
+            asyncio.run(_run_coroutine(instance, result))
+        log_store.log(f"Task {task_def.id} finished", task_id=task_def.id)
+        return None
+    except TaskStopped:
+        log_store.log(f"Task {task_def.id} stopped", task_id=task_def.id)
+        return None
+    except Exception as exc:  # pragma: no cover - runtime feedback
+        log_store.log(f"Task {task_def.id} failed: {exc}", level="ERROR", task_id=task_def.id)
+        return str(exc)
+    finally:
+        instance.stop_capture_stream()
+        input_dispatcher.cancel(task_def.id)
+
+
+@dataclass
+class _CachedModule:
+    module: Any
+    stamp: Tuple[int, int]
+    digest: str
+
+
+class ModuleCache:
+    """
+    Task script modules executed once and reused while the file is unchanged.
+
+    Entries are validated by (mtime, size); when those change the content hash
+    decides whether the module really has to be executed again.
+    """
+
     def __init__(self) -> None:
-        self._threads: Dict[str, threading.Thread] = {}
+        self._entries: Dict[Tuple[Path, str], _CachedModule] = {}
+        self._lock = threading.Lock()
+        self._counters = {"module_hits": 0, "module_loads": 0, "module_reloads": 0}
+
+    def load(self, path: Path, module_name: str) -> Any:
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        key = (path, module_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.stamp == stamp:
+                self._counters["module_hits"] += 1
+                return entry.module
+        source = path.read_bytes()
+        digest = hashlib.blake2b(source, digest_size=16).hexdigest()
+        with self._lock:
+            if entry and entry.digest == digest:
+                # Touched but unchanged (e.g. saved again from the UI).
+                entry.stamp = stamp
+                self._counters["module_hits"] += 1
+                return entry.module
+        # 按文件路径加载，并用任务ID作模块名避免 main.py 同名冲突
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        if not spec or not spec.loader:
+            raise RuntimeError(f"无法加载任务脚本: {path}")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)  # type: ignore[arg-type]
+        with self._lock:
+            self._entries[key] = _CachedModule(module=module, stamp=stamp, digest=digest)
+            self._counters["module_reloads" if entry else "module_loads"] += 1
+        return module
+
+    def invalidate(self, path: Optional[Path] = None) -> None:
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == path]:
+                self._entries.pop(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, modules_cached=len(self._entries))
+
+
+module_cache = ModuleCache()
+
+
+async def _run_coroutine(instance: TaskBase, coro) -> None:
+    if isinstance(instance, AsyncTaskBase):
+        instance._bind_loop(asyncio.get_running_loop())
+    await coro
+
+
+# spawn everywhere: fork would copy the API server's threads and locks.
+_SPAWN = multiprocessing.get_context("spawn")
+
+_worker_events = None
+_worker_stop_events: List[Any] = []
+_worker_executor: Optional["TaskExecutor"] = None
+
+
+def _init_worker(events, stop_events) -> None:
+    """Pool initializer: forward this worker's log records to the API process, keep the stop events."""
+    global _worker_events, _worker_stop_events, _worker_executor
+    _worker_events = events
+    # Events cannot be pickled per task; they are inherited here and picked by slot.
+    _worker_stop_events = stop_events
+    # Kept for the worker's lifetime so warm instances survive between runs.
+    _worker_executor = TaskExecutor(share_capture=False)
+    log_store.add_sink(lambda record: events.put(("log", record)))
+
+
+def _progress_reporter(events, task_id: str) -> Callable[[float], None]:
+    last = [0.0]
+
+    def _report(at: float) -> None:
+        if at - last[0] >= PROGRESS_REPORT_INTERVAL:
+            last[0] = at
+            events.put(("progress", task_id, at))
+
+    return _report
+
+
+def _process_main(task_def: TaskDefinition, stop_slot: int, bus_name: Optional[str]) -> Dict[str, Any]:
+    """Entry point of a pooled worker process: build and run one task."""
+    events = _worker_events
+    started = time.process_time()
+    events.put(("start", task_def.id, os.getpid()))
+    done = threading.Event()
+
+    def _report_cpu() -> None:
+        while not done.wait(CPU_REPORT_INTERVAL):
+            try:
+                events.put(("cpu", task_def.id, time.process_time() - started))
+            except (EOFError, OSError):
+                # The API process's manager is gone; the task still stops through its event.
+                return
+
+    threading.Thread(target=_report_cpu, daemon=True).start()
+    error = None
+    try:
+        instance = _worker_executor._get_instance(task_def)
+        # Shared-memory event: stop_task() in the API process reaches the task without IPC round trips.
+        instance._stop_event = _worker_stop_events[stop_slot]
+        instance._progress_hook = _progress_reporter(events, task_def.id)
+        previous = instance.capture_backend
+        if bus_name:
+            instance.capture_backend = BusCaptureBackend(bus_name, should_stop=instance.should_stop)
+        try:
+            error = _execute(instance, task_def)
+        finally:
+            instance._progress_hook = None
+            if bus_name:
+                instance.capture_backend.close()
+                instance.capture_backend = previous
+    except Exception as exc:
+        log_store.log(f"Task {task_def.id} failed: {exc}", level="ERROR", task_id=task_def.id)
+        error = str(exc)
+    finally:
+        done.set()
+    return {"cpu_time": time.process_time() - started, "error": error}
+
+
+def instance_id(task_id: str, hwnd: int) -> str:
+    """Id of the per-window instance of a multi-window task; also its log task_id."""
+    return f"{task_id}@{hwnd}"
+
+
+class WindowFanOut:
+    """
+    Runs one task definition once per window matched by its multi selector.
+
+    Every FANOUT_POLL seconds the selector is re-evaluated: new windows get an
+    instance (task_id@hwnd, bound to that hwnd, sharing the script module and
+    decoded templates), instances whose window vanished are stopped. An
+    instance that finished is not restarted while its window stays open.
+    """
+
+    def __init__(
+        self,
+        executor: "TaskExecutor",
+        task_def: TaskDefinition,
+        finder: Optional[Callable[[TargetWindowConfig], List[int]]] = None,
+        poll: float = FANOUT_POLL,
+    ) -> None:
+        self.executor = executor
+        self.task_def = task_def
+        self.finder = finder or find_windows
+        self.poll = poll
+        self._children: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "WindowFanOut":
+        self._thread = threading.Thread(target=self._run, name=f"fanout-{self.task_def.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _child_def(self, hwnd: int) -> TaskDefinition:
+        tw = self.task_def.target_window
+        return replace(
+            self.task_def,
+            id=instance_id(self.task_def.id, hwnd),
+            name=f"{self.task_def.name} @{hwnd}",
+            group=self.task_def.id,
+            target_window=TargetWindowConfig(title_contains=tw.title_contains, process_name=tw.process_name, hwnd=hwnd),
+        )
+
+    def sync(self, hwnds: List[int]) -> None:
+        """Start instances for new windows and stop those whose window is gone."""
+        limit = self.task_def.target_window.max_windows
+        current = set(hwnds)
+        with self._lock:
+            gone = [hwnd for hwnd in self._children if hwnd not in current]
+            new = [hwnd for hwnd in hwnds if hwnd not in self._children]
+            for hwnd in gone:
+                child_id = self._children.pop(hwnd)
+                if self.executor.is_running(child_id):
+                    log_store.log(f"Window {hwnd} closed, stopping {child_id}", task_id=self.task_def.id)
+                    self.executor._request_stop(child_id)
+            if limit:
+                new = new[: max(0, limit - len(self._children))]
+            for hwnd in new:
+                child = self._child_def(hwnd)
+                self._children[hwnd] = child.id
+                try:
+                    self.executor.run_task(child)
+                except Exception as exc:
+                    log_store.log(f"Failed to start {child.id}: {exc}", level="ERROR", task_id=self.task_def.id)
+
+    def _run(self) -> None:
+        error = None
+        try:
+            while not self._stop.is_set():
+                try:
+                    hwnds = self.finder(self.task_def.target_window)
+                except Exception as exc:
+                    log_store.log(f"Window lookup failed: {exc}", level="WARN", task_id=self.task_def.id)
+                else:
+                    self.sync(hwnds)
+                self._stop.wait(self.poll)
+        except Exception as exc:  # pragma: no cover - runtime feedback
+            error = str(exc)
+        finally:
+            for child_id in self.instances().values():
+                self.executor._request_stop(child_id)
+            for child_id in self.instances().values():
+                handle = self.executor._threads.get(child_id)
+                if handle is not None:
+                    handle.join(timeout=STOP_JOIN_TIMEOUT)
+            run = self.executor._runs.get(self.task_def.id)
+            if run is not None:
+                self.executor._finish(run, error, None, self._stop.is_set())
+
+    def instances(self) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._children)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread:
+            self._thread.join(timeout)
+
+
+class TaskExecutor:
+    def __init__(self, share_capture: bool = False) -> None:
+        self._threads: Dict[str, threading.Thread | AsyncTaskHandle] = {}
         self._instances: Dict[str, TaskBase] = {}
+        # Opt-in for every task; a single task opts in with capture: {share: true}.
+        # Tasks sharing the capture read one frame bus per window (engine.framebus).
+        self.share_capture = share_capture
+        self._runs: Dict[str, TaskRun] = {}
+        self._defs: Dict[str, TaskDefinition] = {}
+        self._stop_events: Dict[str, Any] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._events = None
+        # multiprocessing Events inherited by every worker; _free_slots are the unused ones.
+        self._stop_slots: List[Any] = []
+        self._free_slots: List[int] = []
+        self._lock = threading.Lock()
+        # Single event loop shared by every AsyncTaskBase task.
+        self._async_loop = AsyncTaskLoop()
+        # task id -> (script module, instance, definition) kept for reuse_instance tasks.
+        self._warm: Dict[str, Tuple[Any, TaskBase, TaskDefinition]] = {}
+        self._watchdog: Optional[threading.Thread] = None
+        # task id -> monotonic time a "kill" asked the task to stop.
+        self._kill_pending: Dict[str, float] = {}
+        # Supervisors of multi-window tasks, by task id.
+        self._fanouts: Dict[str, "WindowFanOut"] = {}
+
+    def _shares_capture(self, task_def: TaskDefinition) -> bool:
+        """Whether task_def reads its window through the frame bus instead of grabbing it itself."""
+        spec = task_def.capture or {}
+        if str(spec.get("type", "screen")).lower() != "screen":
+            return False
+        return self.share_capture or bool(spec.get("share"))
+
+    def _attach_frame_bus(
+        self, instance: TaskBase, task_def: TaskDefinition
+    ) -> Optional[Tuple[int, Optional[CaptureBackend]]]:
+        backend = instance._backend()
+        hwnd = instance.hwnd
+        if not self._shares_capture(task_def) or not hwnd or not backend.needs_window or isinstance(backend, BusCaptureBackend):
+            return None
+        previous = instance.capture_backend
+        bus = frame_hub.acquire(hwnd, backend)
+        instance.capture_backend = BusCaptureBackend(bus.name, should_stop=instance.should_stop)
+        return hwnd, previous
+
+    @staticmethod
+    def _detach_frame_bus(instance: TaskBase, shared: Optional[Tuple[int, Optional[CaptureBackend]]]) -> None:
+        if not shared:
+            return
+        instance.capture_backend.close()
+        # Restore the task's own backend, a reused instance may run again later.
+        instance.capture_backend = shared[1]
+        frame_hub.release(shared[0])
 
     def _build_instance(self, task_def: TaskDefinition) -> TaskBase:
         module_path = Path(task_def.script)
@@ -37,15 +437,8 @@ class TaskExecutor:
             else:
                 module_path = get_scripts_dir() / module_path
         log_store.log(f"[executor] load script: {module_path}", level="TEST", task_id=task_def.id)
-
-        module_name = f"tasks.{task_def.id}"
-        # 按文件路径加载，并用任务ID作模块名避免 main.py 同名冲突
-        spec = importlib.util.spec_from_file_location(module_name, module_path)
-        if not spec or not spec.loader:
-            raise RuntimeError(f"无法加载任务脚本: {module_path}")
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)  # type: ignore[arg-type]
+        # Instances of a multi-window task share one module.
+        module = module_cache.load(module_path, f"tasks.{task_def.group or task_def.id}")
         cls_or_func = getattr(module, task_def.entry)
 
         template_path = None
@@ -58,51 +451,840 @@ class TaskExecutor:
             template_path = Path(task_def.path) / "templates.yaml"
 
         if isinstance(cls_or_func, type):
-            return cls_or_func(
+            instance = cls_or_func(
+                target_window=task_def.target_window,
+                template_config_path=template_path,
+                task_id=task_def.id,
+            )
+        elif inspect.iscoroutinefunction(cls_or_func):
+            class AsyncFuncTask(AsyncTaskBase):
+                async def run(self, context=None):
+                    return await cls_or_func(self, context=context)
+
+            instance = AsyncFuncTask(
                 target_window=task_def.target_window,
                 template_config_path=template_path,
                 task_id=task_def.id,
             )
-        if isinstance(cls_or_func, Callable):
+        elif isinstance(cls_or_func, Callable):
             class FuncTask(TaskBase):
                 def run(self, context=None):
                     return cls_or_func(self, context=context)
 
-            return FuncTask(
+            instance = FuncTask(
                 target_window=task_def.target_window,
                 template_config_path=template_path,
                 task_id=task_def.id,
             )
-        raise RuntimeError(f"{task_def.entry} is not callable or class")
+        else:
+            raise RuntimeError(f"{task_def.entry} is not callable or class")
+        spec = {k: v for k, v in (task_def.capture or {}).items() if k != "share"}
+        if spec:
+            source = spec.get("source")
+            if source and not Path(source).is_absolute() and task_def.path:
+                spec["source"] = str(Path(task_def.path) / source)
+            instance.capture_backend = create_capture_backend(spec)
+        instance._script_module = module
+        return instance
 
-    def run_task(self, task_def: TaskDefinition) -> threading.Thread:
+    def _take_warm(self, task_def: TaskDefinition) -> Optional[TaskBase]:
+        """The warm instance of task_def when neither its script nor its definition changed."""
+        warm = self._warm.get(task_def.id)
+        if not warm or (warm[1] is self._instances.get(task_def.id) and self.is_running(task_def.id)):
+            # A reuse_instance task still running keeps its instance; resetting it would detach stop_task.
+            return None
+        del self._warm[task_def.id]
+        module, instance, cached_def = warm
+        try:
+            current = module_cache.load(Path(module.__file__), f"tasks.{task_def.group or task_def.id}")
+        except OSError:
+            current = None
+        # reuse_instance only decides whether the instance is kept after this run.
+        if current is module and replace(cached_def, reuse_instance=task_def.reuse_instance) == task_def:
+            instance.reset_for_run()
+            return instance
+        return None
+
+    def _get_instance(self, task_def: TaskDefinition) -> TaskBase:
+        """
+        Build the task, or hand out its warm instance: the one kept by
+        reuse_instance, or the one prepared by warm_up() (used once).
+        """
+        instance = self._take_warm(task_def) or self._build_instance(task_def)
+        if task_def.reuse_instance:
+            self._warm[task_def.id] = (instance._script_module, instance, task_def)
+        return instance
+
+    def warm_up(self, task_def: TaskDefinition) -> TaskBase:
+        """
+        Build an instance ahead of the next run and decode its template images.
+
+        The next run_task of an unchanged definition uses it even without
+        reuse_instance; with reuse_instance it is kept for later runs too.
+        Raises RuntimeError while the task is running.
+        """
+        if self.is_running(task_def.id):
+            raise RuntimeError(f"task {task_def.id} is running")
+        instance = self._take_warm(task_def) or self._build_instance(task_def)
+        self._warm[task_def.id] = (instance._script_module, instance, task_def)
+        template_registry.preload(instance.template_config_path)
+        return instance
+
+    def run_task(self, task_def: TaskDefinition):
+        """
+        Start a task. Returns a thread, or a thread-like AsyncTaskHandle for
+        AsyncTaskBase tasks, which all share one event loop. A task whose
+        target_window has multi set returns its WindowFanOut.
+        """
+        if task_def.mode not in ("thread", "process"):
+            raise ValueError(f"unknown task mode: {task_def.mode}")
+        if task_def.watchdog_action not in WATCHDOG_ACTIONS:
+            raise ValueError(f"unknown watchdog action: {task_def.watchdog_action}")
+        if task_def.target_window and task_def.target_window.multi:
+            return self._run_fanout(task_def)
         log_store.log(f"Starting task {task_def.id}: {task_def.name}", task_id=task_def.id)
-        task_instance = self._build_instance(task_def)
+        requested = time.perf_counter()
+        self._defs[task_def.id] = task_def
+        self._kill_pending.pop(task_def.id, None)
+        if task_def.max_runtime or task_def.progress_timeout:
+            self._ensure_watchdog()
+        if task_def.mode == "process":
+            return self._run_in_process(task_def)
+        if self.is_running(task_def.id) and task_def.reuse_instance:
+            raise RuntimeError(f"task {task_def.id} is already running")
+        task_instance = self._get_instance(task_def)
         self._instances[task_def.id] = task_instance
+        self._stop_events.pop(task_def.id, None)
+        if isinstance(task_instance, AsyncTaskBase):
+            return self._run_on_loop(task_instance, task_def, requested)
+        run = self._runs[task_def.id] = TaskRun(task_id=task_def.id, mode="thread", pid=os.getpid())
 
         def _runner():
+            shared = []
+            started = time.thread_time()
+            run.startup_ms = round((time.perf_counter() - requested) * 1000, 2)
             try:
-                if task_instance.target_window_config:
-                    task_instance.ensure_window_focused()
-                task_instance.run()
+                error = _execute(task_instance, task_def, lambda: shared.append(self._attach_frame_bus(task_instance, task_def)))
+            finally:
+                self._detach_frame_bus(task_instance, shared[0] if shared else None)
+            self._finish(run, error, time.thread_time() - started, task_instance.should_stop())
+
+        thread = threading.Thread(target=_runner, daemon=True)
+        thread.start()
+        self._threads[task_def.id] = thread
+        return thread
+
+    def _run_on_loop(self, instance: AsyncTaskBase, task_def: TaskDefinition, requested: float):
+        run = self._runs[task_def.id] = TaskRun(task_id=task_def.id, mode="async", pid=os.getpid())
+
+        async def _main():
+            run.startup_ms = round((time.perf_counter() - requested) * 1000, 2)
+            instance._bind_loop(asyncio.get_running_loop())
+            shared = None
+            error = None
+            try:
+                if instance.target_window_config:
+                    await instance._blocking(instance.ensure_window_focused)
+                    shared = await instance._blocking(self._attach_frame_bus, instance, task_def)
+                await instance.run()
                 log_store.log(f"Task {task_def.id} finished", task_id=task_def.id)
+            except (TaskStopped, asyncio.CancelledError):
+                # CancelledError: the watchdog killed the task.
+                log_store.log(f"Task {task_def.id} stopped", task_id=task_def.id)
             except Exception as exc:  # pragma: no cover - runtime feedback
                 log_store.log(f"Task {task_def.id} failed: {exc}", level="ERROR", task_id=task_def.id)
+                error = str(exc)
+            finally:
+                instance.stop_capture_stream()
+                input_dispatcher.cancel(task_def.id)
+                self._detach_frame_bus(instance, shared)
+            # CPU time is not attributable per task on a shared loop.
+            self._finish(run, error, None, instance.should_stop())
 
-        thread = threading.Thread(target=_runner, daemon=True)
+        handle = self._async_loop.submit(_main())
+        self._threads[task_def.id] = handle
+        return handle
+
+    def _finish(self, run: TaskRun, error: Optional[str], cpu_time: Optional[float], stopped: bool) -> None:
+        run.finished_at = time.time()
+        if cpu_time is not None:
+            run.cpu_time = round(cpu_time, 3)
+        run.error = error
+        if run.watchdog_action == "killed":
+            run.status = "killed"
+        else:
+            run.status = "failed" if error else "stopped" if stopped else "finished"
+        self._kill_pending.pop(run.task_id, None)
+
+    # Process mode
+    def _ensure_pool(self, dedicated_stop: Optional[Any] = None) -> ProcessPoolExecutor:
+        """
+        The shared worker pool, or with dedicated_stop (the run's stop event)
+        a one-worker pool of its own for a single run, which the caller shuts
+        down afterwards.
+        """
+        with self._lock:
+            if self._manager is None:
+                self._manager = _SPAWN.Manager()
+                self._events = self._manager.Queue()
+                threading.Thread(target=self._drain_events, args=(self._events,), daemon=True).start()
+            if not self._stop_slots:
+                self._stop_slots = [_SPAWN.Event() for _ in range(PROCESS_STOP_SLOTS)]
+                self._free_slots = list(range(PROCESS_STOP_SLOTS))
+            if dedicated_stop is not None:
+                initargs = (self._events, [dedicated_stop])
+                return ProcessPoolExecutor(max_workers=1, mp_context=_SPAWN, initializer=_init_worker, initargs=initargs)
+            initargs = (self._events, self._stop_slots)
+            if self._pool is None:
+                # Also recreated after a worker crashed (the old pool is broken then).
+                self._pool = ProcessPoolExecutor(
+                    max_workers=PROCESS_WORKERS, mp_context=_SPAWN, initializer=_init_worker, initargs=initargs
+                )
+            return self._pool
+
+    def _take_stop_slot(self) -> int:
+        with self._lock:
+            if not self._free_slots:
+                raise RuntimeError(f"more than {PROCESS_STOP_SLOTS} process tasks at once")
+            slot = self._free_slots.pop()
+        self._stop_slots[slot].clear()
+        return slot
+
+    def _drain_events(self, events) -> None:
+        """Apply log records and CPU reports sent by worker processes."""
+        while True:
+            try:
+                item = events.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            kind = item[0]
+            if kind == "log":
+                log_store.append(item[1])
+            elif kind in ("start", "cpu", "progress"):
+                run = self._runs.get(item[1])
+                if run is None or run.mode != "process" or run.finished_at is not None:
+                    continue
+                if kind == "start":
+                    run.pid = item[2]
+                elif kind == "cpu":
+                    run.cpu_time = round(item[2], 3)
+                else:
+                    run.progress_at = item[2]
+
+    def _shared_bus_for(self, task_def: TaskDefinition) -> Optional[int]:
+        """Window a process task can read through the frame bus, published from this process."""
+        if not self._shares_capture(task_def) or not task_def.target_window:
+            return None
+        try:
+            return find_window(task_def.target_window)
+        except Exception:
+            return None
+
+    def _run_in_process(self, task_def: TaskDefinition) -> threading.Thread:
+        # A task the watchdog may kill gets a worker of its own: killing a
+        # shared worker would break the pool under every other process task.
+        dedicated = task_def.watchdog_action == "kill" and bool(task_def.max_runtime or task_def.progress_timeout)
+        if dedicated:
+            # Its own event too: a worker killed inside Event.wait() may leave the event's lock held.
+            slot, stop_event = 0, _SPAWN.Event()
+            pool = self._ensure_pool(stop_event)
+        else:
+            pool = self._ensure_pool()
+            slot = self._take_stop_slot()
+            stop_event = self._stop_slots[slot]
+        self._stop_events[task_def.id] = stop_event
+        self._instances.pop(task_def.id, None)
+        run = self._runs[task_def.id] = TaskRun(task_id=task_def.id, mode="process")
+
+        def _supervise():
+            hwnd = self._shared_bus_for(task_def)
+            bus_name = frame_hub.acquire(hwnd, ScreenCaptureBackend()).name if hwnd else None
+            try:
+                result = pool.submit(_process_main, task_def, slot, bus_name).result()
+                error, cpu_time = result["error"], result["cpu_time"]
+            except BrokenProcessPool as exc:
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                if run.watchdog_action == "killed":
+                    error, cpu_time = None, run.cpu_time
+                else:
+                    log_store.log(f"Task {task_def.id} failed: {exc}", level="ERROR", task_id=task_def.id)
+                    error, cpu_time = str(exc) or "worker process died", None
+            except Exception as exc:
+                # Pickling errors or a crashed worker (BrokenProcessPool).
+                log_store.log(f"Task {task_def.id} failed: {exc}", level="ERROR", task_id=task_def.id)
+                error, cpu_time = str(exc), None
+            finally:
+                if hwnd:
+                    frame_hub.release(hwnd)
+                if dedicated:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            stopped = run.watchdog_action == "killed" or stop_event.is_set()
+            self._finish(run, error, cpu_time, stopped)
+            with self._lock:
+                # A later stop_task must not set an event the slot's next run uses.
+                if self._stop_events.get(task_def.id) is stop_event:
+                    del self._stop_events[task_def.id]
+                if not dedicated:
+                    self._free_slots.append(slot)
+
+        thread = threading.Thread(target=_supervise, daemon=True)
         thread.start()
         self._threads[task_def.id] = thread
         return thread
 
-    def stop_task(self, task_id: str) -> bool:
+    def _run_fanout(self, task_def: TaskDefinition) -> "WindowFanOut":
+        if self.is_running(task_def.id):
+            raise RuntimeError(f"task {task_def.id} is already running")
+        log_store.log(f"Starting task {task_def.id} on every matching window", task_id=task_def.id)
+        self._defs[task_def.id] = task_def
+        self._runs[task_def.id] = TaskRun(task_id=task_def.id, mode="fanout", pid=os.getpid())
+        fanout = self._fanouts[task_def.id] = WindowFanOut(self, task_def)
+        self._threads[task_def.id] = fanout
+        return fanout.start()
+
+    def _request_stop(self, task_id: str) -> bool:
+        fanout = self._fanouts.get(task_id)
+        if fanout is not None and fanout.is_alive():
+            fanout.stop()
+            return True
         task = self._instances.get(task_id)
-        if not task:
+        stop_event = self._stop_events.get(task_id)
+        if task:
+            task.request_stop()
+        elif stop_event is not None:
+            stop_event.set()
+        else:
+            return False
+        return True
+
+    def stop_task(self, task_id: str, timeout: float = STOP_JOIN_TIMEOUT) -> bool:
+        """
+        Ask a task to stop and wait up to timeout for it.
+
+        Engine waits (sleep, polling, captures, matching, click pauses) notice
+        the stop within STOP_POLL; only a script's own blocking code can take
+        longer, which the watchdog's "kill" action covers.
+        """
+        if not self._request_stop(task_id):
             return False
-        task.request_stop()
         thread = self._threads.get(task_id)
         if thread and thread.is_alive():
-            thread.join(timeout=1.0)
+            thread.join(timeout=timeout)
+            if thread.is_alive():
+                log_store.log(f"Task {task_id} did not stop within {timeout}s", level="WARN", task_id=task_id)
         return True
 
+    # Watchdog
+    def _ensure_watchdog(self) -> None:
+        with self._lock:
+            if self._watchdog is None or not self._watchdog.is_alive():
+                self._watchdog = threading.Thread(target=self._watch, name="task-watchdog", daemon=True)
+                self._watchdog.start()
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(WATCHDOG_INTERVAL)
+            for task_id in list(self._runs):
+                try:
+                    self.check_watchdog(task_id)
+                except Exception as exc:  # pragma: no cover - keep watching the other tasks
+                    log_store.log(f"[watchdog] {task_id}: {exc}", level="ERROR", task_id=task_id)
+
+    def _progress_at(self, run: TaskRun) -> float:
+        instance = self._instances.get(run.task_id)
+        if run.mode != "process" and instance is not None:
+            run.progress_at = instance._progress_at
+        return max(run.started_at, run.progress_at or 0.0)
+
+    def check_watchdog(self, task_id: str, now: Optional[float] = None) -> Optional[str]:
+        """Apply the task's watchdog limits to its current run; returns the finding, if any."""
+        run, task_def = self._runs.get(task_id), self._defs.get(task_id)
+        if run is None or task_def is None or run.finished_at is not None or not self.is_running(task_id):
+            return None
+        if run.mode == "fanout":
+            # Each window instance is watched on its own.
+            return None
+        now = time.time() if now is None else now
+        if task_id in self._kill_pending:
+            if time.monotonic() - self._kill_pending[task_id] >= KILL_GRACE:
+                self._kill_pending.pop(task_id)
+                self._force_kill(task_id, run)
+            return run.watchdog
+        if run.watchdog:
+            return run.watchdog
+        reason = None
+        if task_def.max_runtime and now - run.started_at > task_def.max_runtime:
+            reason = f"max_runtime {task_def.max_runtime:g}s exceeded"
+        elif task_def.progress_timeout and now - self._progress_at(run) > task_def.progress_timeout:
+            reason = f"no progress for {task_def.progress_timeout:g}s"
+        if reason is None:
+            return None
+        run.watchdog = reason
+        action = task_def.watchdog_action
+        log_store.log(f"[watchdog] Task {task_id}: {reason} ({action})", level="WARN", task_id=task_id)
+        if action == "flag":
+            run.watchdog_action = "flagged"
+            return reason
+        run.watchdog_action = "stopped"
+        self._request_stop(task_id)
+        if action == "kill":
+            self._kill_pending[task_id] = time.monotonic()
+        return reason
+
+    def _force_kill(self, task_id: str, run: TaskRun) -> None:
+        """Last resort for a task that ignored its stop request for KILL_GRACE seconds."""
+        handle = self._threads.get(task_id)
+        if handle is None or not handle.is_alive():
+            return
+        run.watchdog_action = "killed"
+        log_store.log(f"[watchdog] Task {task_id} ignored the stop request, killing it", level="WARN", task_id=task_id)
+        if isinstance(handle, AsyncTaskHandle):
+            handle.future.cancel()
+        elif run.mode == "process":
+            # Tasks with the kill action run in a dedicated worker, nothing else runs in it.
+            if run.pid:
+                os.kill(run.pid, signal.SIGTERM)
+        elif handle.ident is not None:
+            # Raised in the thread at its next bytecode; a call stuck in C code returns first.
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(handle.ident), ctypes.py_object(TaskStopped))
+
+    def is_running(self, task_id: str) -> bool:
+        thread = self._threads.get(task_id)
+        return bool(thread and thread.is_alive())
+
+    def running_definitions(self) -> List[TaskDefinition]:
+        return [self._defs[task_id] for task_id in list(self._threads) if self.is_running(task_id) and task_id in self._defs]
+
+    def status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        run = self._runs.get(task_id)
+        if not run:
+            return None
+        if run.finished_at is None:
+            self._progress_at(run)
+        data = run.to_dict()
+        data["running"] = self.is_running(task_id)
+        fanout = self._fanouts.get(task_id)
+        if fanout is not None:
+            data["instances"] = {
+                str(hwnd): self.status(child_id) for hwnd, child_id in fanout.instances().items() if child_id in self._runs
+            }
+        return data
+
+    def shutdown(self) -> None:
+        """Stop worker processes and the async task loop; running thread tasks are left alone."""
+        with self._lock:
+            pool, manager, events = self._pool, self._manager, self._events
+            self._pool = self._manager = self._events = None
+        for stop_event in self._stop_events.values():
+            try:
+                stop_event.set()
+            except Exception:
+                pass
+        self._async_loop.stop()
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if events is not None:
+            try:
+                events.put(None)
+            except (EOFError, OSError):
+                # The manager process is already gone.
+                pass
+        if manager:
+            manager.shutdown()
+
+
+# Scheduler
+SCHEDULER_TICK = 0.5
+# Runs of one schedule queued at most by the "run_all" misfire policy.
+MAX_CATCHUP = 10
+TRIGGERS = ("interval", "cron")
+MISFIRE_POLICIES = ("run_once", "skip", "run_all")
+
+# minute, hour, day of month, month, day of week (0 or 7 = Sunday)
+_CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_cron_field(text: str, lo: int, hi: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        step = 1
+        has_step = "/" in part
+        if has_step:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"invalid cron step: {step_text}")
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = hi if has_step else start
+        if start < lo or end > hi or start > end:
+            raise ValueError(f"cron field out of range: {text}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """Standard five-field cron expression evaluated in local time."""
+
+    def __init__(self, expr: str) -> None:
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, dows = (
+            _parse_cron_field(text, lo, hi) for text, (lo, hi) in zip(parts, _CRON_RANGES)
+        )
+        self.weekdays = frozenset(d % 7 for d in dows)
+        # Like cron: when both day fields are restricted, either may match.
+        self._any_day = parts[2] != "*" and parts[4] != "*"
+
+    def _day_ok(self, dt: datetime) -> bool:
+        dom = dt.day in self.days
+        dow = (dt.weekday() + 1) % 7 in self.weekdays
+        return dom or dow if self._any_day else dom and dow
+
+    def next_after(self, ts: float) -> float:
+        dt = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+                dt = dt.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_ok(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+            elif dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError(f"cron expression never fires: {self.expr!r}")
+
+
+@dataclass
+class Schedule:
+    id: str
+    task_id: str
+    trigger: str = "interval"
+    # Seconds between runs for interval triggers.
+    interval: float = 60.0
+    cron: Optional[str] = None
+    # Higher runs first when several runs wait for the same window or slot.
+    priority: int = 0
+    # What to do with runs missed by more than misfire_grace seconds (server down, window busy).
+    misfire: str = "run_once"
+    misfire_grace: float = 30.0
+    enabled: bool = True
+    next_run: Optional[float] = None
+    last_run: Optional[float] = None
+    last_status: Optional[str] = None
+
+    def validate(self) -> None:
+        if self.trigger not in TRIGGERS:
+            raise ValueError(f"unknown trigger: {self.trigger}")
+        if self.misfire not in MISFIRE_POLICIES:
+            raise ValueError(f"unknown misfire policy: {self.misfire}")
+        if self.trigger == "cron":
+            CronExpression(self.cron or "")
+        elif self.interval <= 0:
+            raise ValueError("interval must be positive")
+
+    def next_after(self, ts: float) -> float:
+        if self.trigger == "cron":
+            return CronExpression(self.cron or "").next_after(ts)
+        return ts + self.interval
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Schedule":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+def window_keys(task_def: TaskDefinition) -> List[str]:
+    """
+    Identities of the windows a task drives, for per-window concurrency limits.
+
+    Selectors resolve to the handles they match (every match for a multi
+    selector), so tasks bound by hwnd and by title to the same window count
+    against each other. The selector itself is the key while nothing matches.
+    """
+    tw = task_def.target_window
+    if not tw or not (tw.hwnd or tw.title_contains or tw.process_name):
+        return []
+    try:
+        hwnds = find_windows(tw)
+    except Exception:
+        hwnds = []
+    hwnds = hwnds[: tw.max_windows or None] if tw.multi else hwnds[:1]
+    if hwnds:
+        return [f"hwnd:{hwnd}" for hwnd in hwnds]
+    if tw.hwnd:
+        return [f"hwnd:{tw.hwnd}"]
+    return [f"{tw.process_name or ''}|{tw.title_contains or ''}"]
+
+
+class TaskScheduler:
+    """
+    Starts tasks from interval/cron schedules through a TaskExecutor.
+
+    Due runs enter a priority queue; a run starts only while the global and
+    per-window limits allow it, otherwise it waits in the queue; a run that
+    waited past misfire_grace is dropped under the "skip" policy. Tasks
+    started by hand are not limited, but occupy slots scheduled runs wait for.
+    Schedules persist to assets/schedules.json.
+    """
+
+    def __init__(
+        self,
+        task_executor: TaskExecutor,
+        path: Optional[Path] = None,
+        max_running: int = 4,
+        max_per_window: int = 1,
+    ) -> None:
+        self.executor = task_executor
+        self.path = path
+        self.max_running = max_running
+        self.max_per_window = max_per_window
+        self._resolver: Optional[Callable[[str], Optional[TaskDefinition]]] = None
+        self._schedules: Dict[str, Schedule] = {}
+        # (-priority, due, seq, schedule id, task definition)
+        self._pending: List[Tuple[int, float, int, str, TaskDefinition]] = []
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _schedules_path(self) -> Path:
+        return self.path or get_assets_dir() / "schedules.json"
+
+    def load(self) -> None:
+        path = self._schedules_path()
+        if not path.exists():
+            return
+        try:
+            items = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as exc:
+            log_store.log(f"[scheduler] failed to read {path}: {exc}", level="ERROR")
+            return
+        with self._lock:
+            self._schedules = {}
+            for item in items:
+                try:
+                    sched = Schedule.from_dict(item)
+                    sched.validate()
+                except Exception as exc:
+                    log_store.log(f"[scheduler] skip invalid schedule {item.get('id')}: {exc}", level="WARN")
+                    continue
+                self._schedules[sched.id] = sched
+
+    def _save(self) -> None:
+        path = self._schedules_path()
+        data = [s.to_dict() for s in self._schedules.values()]
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as exc:
+            log_store.log(f"[scheduler] failed to save {path}: {exc}", level="ERROR")
+
+    def start(self, resolver: Callable[[str], Optional[TaskDefinition]]) -> None:
+        """Load schedules and start ticking; resolver turns a task id into a TaskDefinition."""
+        self._resolver = resolver
+        self.load()
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(SCHEDULER_TICK):
+            try:
+                self.tick()
+            except Exception as exc:  # pragma: no cover - keep the scheduler alive
+                log_store.log(f"[scheduler] tick failed: {exc}", level="ERROR")
+
+    # Schedules
+    def list(self) -> List[Schedule]:
+        with self._lock:
+            return list(self._schedules.values())
+
+    def upsert(self, schedule: Schedule) -> Schedule:
+        schedule.validate()
+        with self._lock:
+            old = self._schedules.get(schedule.id)
+            if old and old.trigger == schedule.trigger and old.interval == schedule.interval and old.cron == schedule.cron:
+                schedule.next_run = old.next_run
+                schedule.last_run, schedule.last_status = old.last_run, old.last_status
+            else:
+                schedule.next_run = None
+            self._schedules[schedule.id] = schedule
+            self._save()
+        return schedule
+
+    def remove(self, schedule_id: str) -> bool:
+        with self._lock:
+            if self._schedules.pop(schedule_id, None) is None:
+                return False
+            self._pending = [item for item in self._pending if item[3] != schedule_id]
+            heapq.heapify(self._pending)
+            self._save()
+        return True
+
+    def run_now(self, schedule_id: str) -> bool:
+        """Queue one run immediately, still subject to the concurrency limits."""
+        with self._lock:
+            sched = self._schedules.get(schedule_id)
+            if not sched:
+                return False
+            return self._enqueue(sched, time.time())
+
+    def set_limits(self, max_running: Optional[int] = None, max_per_window: Optional[int] = None) -> None:
+        with self._lock:
+            if max_running is not None:
+                self.max_running = max(1, int(max_running))
+            if max_per_window is not None:
+                self.max_per_window = max(1, int(max_per_window))
+
+    # Dispatch
+    def _enqueue(self, sched: Schedule, due: float) -> bool:
+        task_def = self._resolver(sched.task_id) if self._resolver else None
+        if task_def is None:
+            sched.last_status = "missing_task"
+            log_store.log(f"[scheduler] task {sched.task_id} of schedule {sched.id} not found", level="WARN")
+            return False
+        heapq.heappush(self._pending, (-sched.priority, due, next(self._seq), sched.id, task_def))
+        return True
+
+    def _is_pending(self, schedule_id: str) -> bool:
+        return any(item[3] == schedule_id for item in self._pending)
+
+    def _pending_count(self, schedule_id: str) -> int:
+        return sum(1 for item in self._pending if item[3] == schedule_id)
+
+    def _collect_due(self, sched: Schedule, now: float) -> None:
+        if sched.next_run is None:
+            sched.next_run = sched.next_after(now)
+            return
+        missed: List[float] = []
+        due = sched.next_run
+        while due <= now:
+            missed.append(due)
+            due = sched.next_after(due)
+            if len(missed) > 10000:
+                due = sched.next_after(now)
+                break
+        if not missed:
+            return
+        sched.next_run = due
+        on_time = now - missed[-1] <= sched.misfire_grace
+        if sched.misfire == "run_all":
+            # Counts runs still queued too, so a schedule firing faster than
+            # its window frees up cannot grow the queue without bound.
+            runs = max(0, min(len(missed), MAX_CATCHUP - self._pending_count(sched.id)))
+        elif sched.misfire == "run_once" or on_time:
+            # A run still waiting in the queue covers the new one.
+            runs = 0 if self._is_pending(sched.id) else 1
+        else:
+            runs = 0
+        if not on_time:
+            log_store.log(
+                f"[scheduler] schedule {sched.id} missed {len(missed)} run(s), policy {sched.misfire}", level="WARN"
+            )
+            if not runs:
+                sched.last_status = "misfired"
+        for due_at in missed[-runs:] if runs else []:
+            self._enqueue(sched, due_at)
+
+    def tick(self, now: Optional[float] = None) -> List[str]:
+        """Queue due runs and start whatever the limits allow; returns started task ids."""
+        now = time.time() if now is None else now
+        started: List[str] = []
+        with self._lock:
+            dirty = False
+            for sched in self._schedules.values():
+                if sched.enabled:
+                    before = (sched.next_run, sched.last_status)
+                    self._collect_due(sched, now)
+                    dirty = dirty or before != (sched.next_run, sched.last_status)
+            running = self.executor.running_definitions()
+            # A multi-window supervisor is counted through its per-window instances.
+            busy = Counter(
+                key for d in running if not (d.target_window and d.target_window.multi) for key in window_keys(d)
+            )
+            total = len(running)
+            waiting = []
+            while self._pending and total < self.max_running:
+                item = heapq.heappop(self._pending)
+                sched = self._schedules.get(item[3])
+                if sched and now - item[1] > sched.misfire_grace and sched.misfire == "skip":
+                    # Waited in the queue past the grace period (window or slots busy).
+                    log_store.log(f"[scheduler] schedule {sched.id} run waited too long, skipped", level="WARN")
+                    sched.last_status = "misfired"
+                    dirty = True
+                    continue
+                # Run the task as it is defined now, not as it was when queued.
+                task_def = self._resolver(item[4].id) if self._resolver else item[4]
+                if task_def is None:
+                    if sched:
+                        sched.last_status = "missing_task"
+                        dirty = True
+                    continue
+                keys = window_keys(task_def)
+                if self.executor.is_running(task_def.id) or any(busy[key] >= self.max_per_window for key in keys):
+                    waiting.append(item)
+                    continue
+                try:
+                    self.executor.run_task(task_def)
+                    status = "started"
+                except Exception as exc:
+                    log_store.log(f"[scheduler] failed to start {task_def.id}: {exc}", level="ERROR", task_id=task_def.id)
+                    status = "failed"
+                if sched:
+                    sched.last_run, sched.last_status = now, status
+                    dirty = True
+                if status == "started":
+                    started.append(task_def.id)
+                    busy.update(keys)
+                    total += 1
+            for item in waiting:
+                heapq.heappush(self._pending, item)
+            if dirty:
+                self._save()
+        return started
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = [
+                {"schedule_id": item[3], "task_id": item[4].id, "priority": -item[0], "due": item[1]}
+                for item in sorted(self._pending)
+            ]
+            return {
+                "max_running": self.max_running,
+                "max_per_window": self.max_per_window,
+                "running": [d.id for d in self.executor.running_definitions()],
+                "pending": pending,
+                "schedules": [s.to_dict() for s in self._schedules.values()],
+            }
+
 
 executor = TaskExecutor()
+scheduler = TaskScheduler(executor)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+Rect = Tuple[int, int, int, int]
+Region = Tuple[int, int, int, int]
+
+
+def frame_digest(area: np.ndarray) -> bytes:
+    """
+    Content hash of a (gray) frame or region.
+
+    Every pixel is hashed: a 1-px caret or cursor line must change the digest,
+    or match memos would return results for a frame that changed.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(area.shape).encode())
+    h.update(np.ascontiguousarray(area).data)
+    return h.digest()
+
+
+@dataclass(eq=False)
+class Frame:
+    """
+    One capture of the target window.
+
+    Holds the raw RGB buffer, the capture time (time.monotonic) and the window
+    rect in screen coordinates at capture time. Derived representations (gray,
+    downscaled, ROI views, digests, PIL image) are computed on first use and
+    memoized, so a frame is converted at most once per representation no
+    matter how many templates are matched against it. ROIs are NumPy views.
+
+    A region-only capture covers part of the window: origin is the window
+    coordinate of rgb[0, 0], and region arguments stay in window coordinates.
+    """
+
+    rgb: np.ndarray
+    window_rect: Rect = (0, 0, 0, 0)
+    timestamp: float = field(default_factory=time.monotonic)
+    origin: Tuple[int, int] = (0, 0)
+    _cache: Dict[Any, Any] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.window_rect == (0, 0, 0, 0):
+            h, w = self.rgb.shape[:2]
+            self.window_rect = (0, 0, w + self.origin[0], h + self.origin[1])
+
+    @classmethod
+    def from_image(
+        cls,
+        image: Image.Image,
+        window_rect: Optional[Rect] = None,
+        timestamp: Optional[float] = None,
+        origin: Tuple[int, int] = (0, 0),
+    ) -> "Frame":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        frame = cls(
+            rgb=np.asarray(image),
+            window_rect=window_rect or (0, 0, 0, 0),
+            timestamp=time.monotonic() if timestamp is None else timestamp,
+            origin=origin,
+        )
+        frame._cache["image"] = image
+        return frame
+
+    @classmethod
+    def wrap(cls, image: "Frame | Image.Image | np.ndarray") -> "Frame":
+        if isinstance(image, Frame):
+            return image
+        if isinstance(image, Image.Image):
+            return cls.from_image(image)
+        return cls(rgb=image)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Window (width, height)."""
+        left, top, right, bottom = self.window_rect
+        return right - left, bottom - top
+
+    @property
+    def gray(self) -> np.ndarray:
+        arr = self._cache.get("gray")
+        if arr is None:
+            arr = self.rgb if self.rgb.ndim == 2 else cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+            self._cache["gray"] = arr
+        return arr
+
+    @property
+    def image(self) -> Image.Image:
+        img = self._cache.get("image")
+        if img is None:
+            img = Image.fromarray(self.rgb)
+            self._cache["image"] = img
+        return img
+
+    @property
+    def is_partial(self) -> bool:
+        h, w = self.rgb.shape[:2]
+        return self.origin != (0, 0) or (w, h) != self.size
+
+    def covers(self, region: Optional[Region]) -> bool:
+        """Whether the captured pixels include the whole window-coordinate region."""
+        h, w = self.rgb.shape[:2]
+        ox, oy = self.origin
+        if not region:
+            return not self.is_partial
+        x, y, rw, rh = region
+        return x >= ox and y >= oy and x + rw <= ox + w and y + rh <= oy + h
+
+    def roi_with_offset(self, region: Optional[Region] = None) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        Gray view of a window-coordinate (x, y, w, h) region, clipped to the
+        captured pixels, plus the window coordinate of its top-left corner.
+        """
+        ox, oy = self.origin
+        if not region:
+            return self.gray, (ox, oy)
+        h, w = self.gray.shape[:2]
+        x, y, rw, rh = region
+        x0, y0 = max(x - ox, 0), max(y - oy, 0)
+        x1, y1 = min(x + rw - ox, w), min(y + rh - oy, h)
+        return self.gray[y0 : max(y0, y1), x0 : max(x0, x1)], (x0 + ox, y0 + oy)
+
+    def roi(self, region: Optional[Region] = None) -> np.ndarray:
+        """Gray view of a window-coordinate region; everything captured when None."""
+        return self.roi_with_offset(region)[0]
+
+    def downscaled(self, factor: int, region: Optional[Region] = None) -> np.ndarray:
+        """Gray ROI downscaled by an integer factor (INTER_AREA), memoized per (factor, region)."""
+        if factor <= 1:
+            return self.roi(region)
+        key = ("down", factor, region)
+        arr = self._cache.get(key)
+        if arr is None:
+            area = self.roi(region)
+            arr = cv2.resize(area, (area.shape[1] // factor, area.shape[0] // factor), interpolation=cv2.INTER_AREA)
+            self._cache[key] = arr
+        return arr
+
+    def digest(self, region: Optional[Region] = None) -> bytes:
+        key = ("digest", region)
+        value = self._cache.get(key)
+        if value is None:
+            value = frame_digest(self.roi(region))
+            self._cache[key] = value
+        return value
@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .capture import CaptureBackend, region_union
+from .frame import Frame, Rect, Region
+from .logging import log_store
+
+# Shared-memory layout:
+#   header | slot meta * slots | slot pixels * slots
+# Slots form a ring; slot (seq - 1) % slots holds frame `seq`. A slot is
+# consistent when its seq_begin == seq_end, written before/after the pixels.
+# When the window grows the frames move to a larger segment: the retired one
+# gets its name as "next segment", and the first segment, kept until close(),
+# always names the current one, so readers can attach by the first name.
+_MAGIC = b"WACBUS1\0"
+# magic, latest seq, generation, slots, (pad), slot capacity in bytes, last frame request (monotonic), next segment name
+_HEADER = struct.Struct("<8sQQIIQd64s")
+_HEADER_SIZE = 128
+# seq_begin, seq_end, timestamp, window rect (l, t, r, b), height, width, channels
+_SLOT = struct.Struct("<QQdiiiiIII")
+_SLOT_SIZE = 64
+_ALIGN = 64
+
+# Publisher polling step while no reader has requested a frame.
+IDLE_POLL = 0.005
+# Reader polling step while waiting for a new frame.
+READ_POLL = 0.002
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def bus_name(hwnd: Optional[int]) -> str:
+    return f"wac_{os.getpid()}_{hwnd or 0}"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Readers must not unlink the publisher's segment on exit (Python 3.13+).
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class _Segment:
+    """Typed accessors over one shared-memory segment."""
+
+    def __init__(self, shm: shared_memory.SharedMemory) -> None:
+        self.shm = shm
+        self.buf = shm.buf
+        header = self.header()
+        if header[0] != _MAGIC:
+            raise RuntimeError(f"not a frame bus segment: {shm.name}")
+        self.slots = header[3]
+        self.capacity = header[5]
+
+    def header(self) -> tuple:
+        return _HEADER.unpack_from(self.buf, 0)
+
+    def seq(self) -> int:
+        return struct.unpack_from("<Q", self.buf, 8)[0]
+
+    def generation(self) -> int:
+        return struct.unpack_from("<Q", self.buf, 16)[0]
+
+    def next_name(self) -> str:
+        return self.header()[7].rstrip(b"\0").decode()
+
+    def requested(self) -> float:
+        return struct.unpack_from("<d", self.buf, 40)[0]
+
+    def request(self) -> None:
+        struct.pack_into("<d", self.buf, 40, time.monotonic())
+
+    def meta(self, idx: int) -> tuple:
+        return _SLOT.unpack_from(self.buf, _HEADER_SIZE + idx * _SLOT_SIZE)
+
+    def pixels(self, idx: int, shape: Tuple[int, ...]) -> np.ndarray:
+        offset = _HEADER_SIZE + self.slots * _SLOT_SIZE + idx * self.capacity
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.buf, offset=offset)
+
+    def close(self) -> None:
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Zero-copy frames still reference the mapping; it goes away with them.
+            pass
+
+
+class FrameBus:
+    """
+    Publishes the newest capture of one window into shared memory.
+
+    Tasks in threads or worker processes attach a FrameBusReader by name and
+    read frames zero-copy, so the window is grabbed once per request no
+    matter how many tasks watch it. Grabbing is on demand: the publisher
+    grabs only when a reader requested a frame newer than the last grab,
+    at most `fps` times per second, and idles otherwise.
+    """
+
+    def __init__(
+        self,
+        backend: CaptureBackend,
+        hwnd: Optional[int],
+        fps: float = 15.0,
+        slots: int = 4,
+        name: Optional[str] = None,
+    ) -> None:
+        self.backend = backend
+        self.hwnd = hwnd
+        self.fps = max(0.1, float(fps))
+        self.slots = max(2, int(slots))
+        self._base_name = name or bus_name(hwnd)
+        # First segment, the one readers attach to by name; self._segment is the current one.
+        self._base: Optional[_Segment] = None
+        self._segment: Optional[_Segment] = None
+        self._seq = 0
+        self._published = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def name(self) -> str:
+        """Name of the first segment; readers follow resizes from there."""
+        return self._base_name
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _create(self, capacity: int, generation: int) -> _Segment:
+        name = self._base_name if generation == 0 else f"{self._base_name}_{generation}"
+        size = _HEADER_SIZE + self.slots * _SLOT_SIZE + self.slots * capacity
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, self._seq, generation, self.slots, 0, capacity, 0.0, b"")
+        for idx in range(self.slots):
+            _SLOT.pack_into(shm.buf, _HEADER_SIZE + idx * _SLOT_SIZE, 0, 0, 0.0, 0, 0, 0, 0, 0, 0, 0)
+        return _Segment(shm)
+
+    def _ensure_capacity(self, nbytes: int) -> _Segment:
+        seg = self._segment
+        if seg is not None and seg.capacity >= nbytes:
+            return seg
+        generation = seg.generation() + 1 if seg is not None else 0
+        new = self._create(_aligned(nbytes), generation)
+        if seg is None:
+            self._base = new
+        else:
+            # Window grew: point readers at the larger segment, carrying over a pending request.
+            struct.pack_into("<d", new.buf, 40, seg.requested())
+            struct.pack_into("64s", seg.buf, 48, new.shm.name.encode())
+            struct.pack_into("<Q", seg.buf, 16, generation)
+            if seg is not self._base:
+                struct.pack_into("64s", self._base.buf, 48, new.shm.name.encode())
+                seg.close()
+                seg.shm.unlink()
+        self._segment = new
+        return new
+
+    def publish(self, frame: Frame, timestamp: Optional[float] = None) -> int:
+        """Copy a frame into the next slot; returns its sequence number."""
+        src = np.ascontiguousarray(frame.rgb, dtype=np.uint8)
+        if src.ndim == 2:
+            src = src[:, :, None]
+        h, w, c = src.shape
+        ts = frame.timestamp if timestamp is None else timestamp
+        with self._lock:
+            seg = self._ensure_capacity(src.nbytes)
+            seq = self._seq + 1
+            idx = (seq - 1) % seg.slots
+            base = _HEADER_SIZE + idx * _SLOT_SIZE
+            struct.pack_into("<Q", seg.buf, base, seq)
+            np.copyto(seg.pixels(idx, (h, w, c)), src)
+            left, top, right, bottom = frame.window_rect
+            _SLOT.pack_into(seg.buf, base, seq, seq, ts, left, top, right, bottom, h, w, c)
+            struct.pack_into("<Q", seg.buf, 8, seq)
+            self._seq = seq
+            self._published += 1
+        return seq
+
+    def start(self) -> "FrameBus":
+        if self.running:
+            return self
+        with self._lock:
+            if self._segment is None:
+                # Allocate up front so readers can attach before the first frame.
+                left, top, right, bottom = self.backend.window_rect(self.hwnd)
+                self._ensure_capacity(max(1, (right - left) * (bottom - top) * 3))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"framebus-{self.hwnd}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        period = 1.0 / self.fps
+        failures = 0
+        # Start of the last successful grab; requests older than it are served.
+        served = 0.0
+        while not self._stop.is_set():
+            seg = self._segment
+            if seg is None or seg.requested() <= served:
+                self._stop.wait(IDLE_POLL)
+                continue
+            if self._stop.wait(max(0.0, served + period - time.monotonic())):
+                break
+            started = time.monotonic()
+            try:
+                self.publish(self.backend.grab(self.hwnd), started)
+                failures = 0
+                served = started
+            except Exception as exc:
+                failures += 1
+                if failures == 1:
+                    log_store.log(f"[framebus] grab failed for window {self.hwnd}: {exc}", level="WARN")
+                self._stop.wait(min(2.0, period * (2 ** min(failures, 5))))
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+
+    def close(self) -> None:
+        self.stop()
+        with self._lock:
+            seg, base = self._segment, self._base
+            self._segment = self._base = None
+        for segment in (seg, base) if seg is not base else (seg,):
+            if segment is not None:
+                segment.close()
+                segment.shm.unlink()
+
+    def stats(self) -> Dict[str, int]:
+        return {"seq": self._seq, "published": self._published}
+
+
+class FrameBusReader:
+    """
+    Zero-copy subscriber of a FrameBus, usable from any thread or process.
+
+    Frames returned with copy=False are views into the shared ring and stay
+    intact until `slots - 1` newer frames were published; valid(seq) tells
+    whether that happened. Pass copy=True to keep a frame longer.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._base = self._segment = _Segment(_attach(name))
+
+    def _follow(self) -> _Segment:
+        seg = self._segment
+        while seg.next_name():
+            # The first segment names the current one, however many resizes happened since.
+            try:
+                new = _Segment(_attach(self._base.next_name()))
+            except FileNotFoundError:
+                # Resized again between reading the name and attaching.
+                time.sleep(READ_POLL)
+                continue
+            if seg is not self._base:
+                seg.close()
+            seg = self._segment = new
+        return seg
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the newest published frame (0 before the first)."""
+        return self._follow().seq()
+
+    def valid(self, seq: int) -> bool:
+        """Whether frame `seq` is still intact in the ring."""
+        seg = self._follow()
+        if not seq:
+            return False
+        meta = seg.meta((seq - 1) % seg.slots)
+        return meta[0] == meta[1] == seq
+
+    def read(self, copy: bool = False) -> Optional[Tuple[int, Frame]]:
+        """Newest frame and its sequence number, or None before the first frame."""
+        seg = self._follow()
+        for _ in range(3):
+            seq = seg.seq()
+            if not seq:
+                return None
+            idx = (seq - 1) % seg.slots
+            meta = seg.meta(idx)
+            if meta[0] != seq or meta[1] != seq:
+                # Slot is being rewritten; the header will move on shortly.
+                time.sleep(READ_POLL)
+                continue
+            _, _, ts, left, top, right, bottom, h, w, c = meta
+            rgb = seg.pixels(idx, (h, w, c))
+            rgb = rgb[:, :, 0] if c == 1 else rgb
+            if copy:
+                rgb = rgb.copy()
+                if not self.valid(seq):
+                    continue
+            else:
+                rgb.flags.writeable = False
+            return seq, Frame(rgb=rgb, window_rect=(left, top, right, bottom), timestamp=ts)
+        return None
+
+    def wait_newer(
+        self,
+        after_seq: int = 0,
+        after: float = 0.0,
+        timeout: float = 1.0,
+        copy: bool = False,
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> Optional[Tuple[int, Frame]]:
+        """
+        Block until a frame newer than after_seq and captured after monotonic
+        time `after` exists; None on timeout or once should_stop returns True.
+
+        A frame another reader already caused is returned as is; otherwise
+        the publisher is asked for a fresh grab.
+        """
+        deadline = time.monotonic() + timeout
+        requested = False
+        while True:
+            item = self.read(copy)
+            if item is not None and item[0] > after_seq and item[1].timestamp > after:
+                return item
+            if not requested:
+                self._follow().request()
+                requested = True
+            if time.monotonic() >= deadline or (should_stop and should_stop()):
+                return None
+            time.sleep(READ_POLL)
+
+    def close(self) -> None:
+        if self._segment is not self._base:
+            self._segment.close()
+        self._base.close()
+
+
+class BusCaptureBackend(CaptureBackend):
+    """
+    Capture backend reading frames published by a FrameBus.
+
+    Every grab returns a frame not returned before, so tasks sharing a window
+    never do more work than the bus fps. The bus carries whole-window frames;
+    grabs with regions get a zero-copy crop to their union, with its origin.
+    """
+
+    def __init__(self, name: str, timeout: float = 2.0, should_stop: Optional[Callable[[], bool]] = None) -> None:
+        self.reader = FrameBusReader(name)
+        self.timeout = timeout
+        # The owning task's stop flag: a stopped task gives up waiting for the next frame.
+        self.should_stop = should_stop
+        self._last_seq = 0
+
+    def grab_newer(self, hwnd: Optional[int], after: float, regions: Optional[Sequence[Region]] = None) -> Frame:
+        item = self.reader.wait_newer(self._last_seq, after, timeout=self.timeout, should_stop=self.should_stop)
+        if item is None:
+            raise RuntimeError(f"frame bus {self.reader.name} published no new frame within {self.timeout}s")
+        self._last_seq = item[0]
+        frame = item[1]
+        height, width = frame.rgb.shape[:2]
+        area = region_union(regions, (width, height))
+        if area is None:
+            return frame
+        x, y, w, h = area
+        rgb = frame.rgb[y : y + h, x : x + w]
+        return Frame(rgb=rgb, window_rect=frame.window_rect, timestamp=frame.timestamp, origin=(x, y))
+
+    def grab(self, hwnd: Optional[int], regions: Optional[Sequence[Region]] = None) -> Frame:
+        return self.grab_newer(hwnd, 0.0, regions)
+
+    def window_rect(self, hwnd: Optional[int]) -> Rect:
+        item = self.reader.read() or self.reader.wait_newer(timeout=self.timeout)
+        if item is None:
+            raise RuntimeError(f"frame bus {self.reader.name} has no frame yet")
+        return item[1].window_rect
+
+    def close(self) -> None:
+        self.reader.close()
+
+
+class FrameBusHub:
+    """Reference-counted FrameBus per window for the tasks of one TaskExecutor process."""
+
+    def __init__(self) -> None:
+        self._buses: Dict[int, Tuple[FrameBus, int]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, hwnd: int, backend: CaptureBackend, fps: float = 15.0) -> FrameBus:
+        with self._lock:
+            bus, refs = self._buses.get(hwnd, (None, 0))
+            if bus is None:
+                bus = FrameBus(backend, hwnd, fps=fps).start()
+            self._buses[hwnd] = (bus, refs + 1)
+            return bus
+
+    def release(self, hwnd: int) -> None:
+        with self._lock:
+            bus, refs = self._buses.get(hwnd, (None, 0))
+            if bus is None:
+                return
+            if refs > 1:
+                self._buses[hwnd] = (bus, refs - 1)
+                return
+            self._buses.pop(hwnd)
+        bus.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {str(hwnd): dict(bus.stats(), subscribers=refs) for hwnd, (bus, refs) in self._buses.items()}
+
+
+frame_hub = FrameBusHub()
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+
+from .vision import MatchResult
+
+Rect = Tuple[int, int, int, int]
+RelativeRect = Tuple[float, float, float, float]
+
+# Recent hits remembered per template.
+HISTORY_SIZE = 20
+# Hot-zone margin around the hits, as a fraction of the template size.
+ZONE_MARGIN = 0.5
+# Hits needed before a tighter search_region is suggested to Template Studio.
+SUGGEST_MIN_HITS = 3
+
+
+def _config_key(config_path: Optional[Path]) -> str:
+    if not config_path:
+        return ""
+    return os.path.normcase(os.path.abspath(str(config_path)))
+
+
+def _intersect(a: Rect, b: Rect) -> Optional[Rect]:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return x1, y1, x2 - x1, y2 - y1
+
+
+class HotZoneTracker:
+    """
+    Remembers where each template was found and proposes a tight search
+    rectangle around recent hits.
+
+    Hits are stored relative to the window size so the zones survive resizes.
+    Matching tries the hot-zone first and falls back to the configured
+    search_region on a miss.
+    """
+
+    def __init__(self, history: int = HISTORY_SIZE) -> None:
+        self._history = history
+        self._hits: Dict[Tuple[str, str], Deque[RelativeRect]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"zone_hits": 0, "zone_misses": 0}
+
+    @staticmethod
+    def _key(template) -> Tuple[str, str]:
+        return _config_key(template.config_path), template.key
+
+    def record(self, template, result: Optional[MatchResult], window_size: Tuple[int, int]) -> None:
+        if result is None or not window_size[0] or not window_size[1]:
+            return
+        x, y, w, h = result.rect
+        ww, wh = window_size
+        rel = (x / ww, y / wh, w / ww, h / wh)
+        with self._lock:
+            hits = self._hits.setdefault(self._key(template), deque(maxlen=self._history))
+            hits.append(rel)
+
+    def count(self, hit: bool) -> None:
+        with self._lock:
+            self._counters["zone_hits" if hit else "zone_misses"] += 1
+
+    def _bounds(self, key: Tuple[str, str]) -> Optional[RelativeRect]:
+        with self._lock:
+            hits = list(self._hits.get(key) or ())
+        if not hits:
+            return None
+        left = min(h[0] for h in hits)
+        top = min(h[1] for h in hits)
+        right = max(h[0] + h[2] for h in hits)
+        bottom = max(h[1] + h[3] for h in hits)
+        # Widest template seen, used for the margin.
+        mw = max(h[2] for h in hits) * ZONE_MARGIN
+        mh = max(h[3] for h in hits) * ZONE_MARGIN
+        return left - mw, top - mh, right - left + 2 * mw, bottom - top + 2 * mh
+
+    def zone(self, template, window_size: Tuple[int, int], region: Optional[Rect]) -> Optional[Rect]:
+        """Absolute hot-zone for template, clipped to its configured region; None if unknown."""
+        bounds = self._bounds(self._key(template))
+        if bounds is None:
+            return None
+        ww, wh = window_size
+        zone = (int(bounds[0] * ww), int(bounds[1] * wh), int(round(bounds[2] * ww)), int(round(bounds[3] * wh)))
+        zone = _intersect(zone, region or (0, 0, ww, wh))
+        if zone is None or zone == region:
+            return None
+        return zone
+
+    def suggest(self, config_path: Optional[Path]) -> Dict[str, Dict[str, float]]:
+        """Relative search_region suggestions for templates with enough hit history."""
+        ckey = _config_key(config_path)
+        with self._lock:
+            keys = [key for key, hits in self._hits.items() if key[0] == ckey and len(hits) >= SUGGEST_MIN_HITS]
+        result: Dict[str, Dict[str, float]] = {}
+        for key in keys:
+            bounds = self._bounds(key)
+            if bounds is None:
+                continue
+            x = min(max(bounds[0], 0.0), 1.0)
+            y = min(max(bounds[1], 0.0), 1.0)
+            result[key[1]] = {
+                "type": "relative",
+                "x": x,
+                "y": y,
+                "width": min(bounds[0] + bounds[2], 1.0) - x,
+                "height": min(bounds[1] + bounds[3], 1.0) - y,
+            }
+        return result
+
+    def reset(self, config_path: Optional[Path] = None, key: Optional[str] = None) -> None:
+        with self._lock:
+            if config_path is None:
+                self._hits.clear()
+                return
+            ckey = _config_key(config_path)
+            for k in [k for k in self._hits if k[0] == ckey and (key is None or k[1] == key)]:
+                self._hits.pop(k)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            data = dict(self._counters)
+            data["templates_tracked"] = len(self._hits)
+        return data
+
+
+hot_zones = HotZoneTracker()
@@ -1,15 +1,32 @@
 from __future__ import annotations
 
+import itertools
 import random
+import threading
 import time
-from dataclasses import dataclass
-from typing import Tuple
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
-import pyautogui
+try:
+    import pyautogui
+except Exception:  # pragma: no cover - no desktop session (headless CI)
+    pyautogui = None
+else:
+    pyautogui.FAILSAFE = False
 
+from .logging import log_store
 from .window import Rect, map_window_to_screen
 
-pyautogui.FAILSAFE = False
+# How often a caller blocked on an input future re-checks its stop flag.
+INPUT_POLL = 0.1
+
+
+def _require_pyautogui():
+    if pyautogui is None:
+        raise RuntimeError("pyautogui is unavailable: a desktop session is required for mouse/keyboard input")
+    return pyautogui
 
 
 @dataclass
@@ -38,29 +55,345 @@ def pick_point(rect: Tuple[int, int, int, int], mode: str = "center", padding: C
     return x + w // 2, y + h // 2
 
 
+@dataclass(eq=False)
+class InputAction:
+    """One queued mouse/keyboard action; kind names the InputBackend method that performs it."""
+
+    kind: str
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    task_id: Optional[str] = None
+    # Minimum time between the starts of two actions of the same task (rate limit).
+    min_gap: float = 0.0
+    # Pause after this action before the same task's next action runs.
+    settle: float = 0.0
+    seq: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: Future = field(default_factory=Future, repr=False)
+
+
+class InputBackend:
+    """
+    Performs input actions. InputDispatcher calls it from its single thread,
+    so implementations never see two actions at once.
+    """
+
+    def perform(self, action: InputAction) -> None:
+        getattr(self, action.kind)(*action.args, **action.kwargs)
+
+    def click(self, point: Tuple[int, int], button: str = "left", clicks: int = 1, interval: float = 0.15) -> None:
+        raise NotImplementedError
+
+    def drag(self, start: Tuple[int, int], end: Tuple[int, int], duration: float = 0.3) -> None:
+        raise NotImplementedError
+
+    def type_text(self, text: str, interval: float = 0.02) -> None:
+        raise NotImplementedError
+
+    def hotkey(self, *keys: str, interval: float = 0.02) -> None:
+        raise NotImplementedError
+
+
+class PyAutoGuiBackend(InputBackend):
+    """Real mouse and keyboard through pyautogui (needs a desktop session)."""
+
+    def click(self, point: Tuple[int, int], button: str = "left", clicks: int = 1, interval: float = 0.15) -> None:
+        _require_pyautogui().click(x=point[0], y=point[1], button=button, clicks=clicks, interval=interval)
+
+    def drag(self, start: Tuple[int, int], end: Tuple[int, int], duration: float = 0.3) -> None:
+        _require_pyautogui().moveTo(start[0], start[1])
+        pyautogui.dragTo(end[0], end[1], duration=duration, button="left")
+
+    def type_text(self, text: str, interval: float = 0.02) -> None:
+        _require_pyautogui().write(text, interval=interval)
+
+    def hotkey(self, *keys: str, interval: float = 0.02) -> None:
+        _require_pyautogui().hotkey(*keys, interval=interval)
+
+
+@dataclass
+class RecordedInput:
+    kind: str
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    task_id: Optional[str]
+    enqueued_at: float
+    started_at: float
+    finished_at: float
+
+
+class RecordingInputBackend(InputBackend):
+    """
+    Headless stand-in that records every action with its task and timing.
+
+    latency simulates how long a real action occupies the mouse/keyboard, so
+    ordering and throughput can be tested and benchmarked without a desktop.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self._events: List[RecordedInput] = []
+        self._lock = threading.Lock()
+
+    def perform(self, action: InputAction) -> None:
+        started = time.monotonic()
+        if self.latency > 0:
+            time.sleep(self.latency)
+        event = RecordedInput(
+            kind=action.kind,
+            args=action.args,
+            kwargs=dict(action.kwargs),
+            task_id=action.task_id,
+            enqueued_at=action.enqueued_at,
+            started_at=started,
+            finished_at=time.monotonic(),
+        )
+        with self._lock:
+            self._events.append(event)
+
+    @property
+    def events(self) -> List[RecordedInput]:
+        with self._lock:
+            return list(self._events)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+
+
+def create_input_backend(spec: Optional[Dict]) -> InputBackend:
+    """Build a backend from a config entry, e.g. {"type": "recording", "latency": 0.01}."""
+    spec = spec or {}
+    kind = str(spec.get("type", "pyautogui")).lower()
+    if kind == "pyautogui":
+        return PyAutoGuiBackend()
+    if kind == "recording":
+        return RecordingInputBackend(latency=float(spec.get("latency", 0.0)))
+    raise ValueError(f"unknown input backend: {kind}")
+
+
+class InputDispatcher:
+    """
+    The only owner of the physical mouse and keyboard in a process.
+
+    Tasks submit actions and get a Future back; one thread performs them in
+    submission order, so actions of concurrent tasks never interleave. A task
+    whose rate limit (min_gap) or settle pause is not over yet is skipped
+    rather than waited for, so it never holds up the other tasks.
+
+    A future's result is the monotonic time the action finished.
+    """
+
+    def __init__(self, backend: Optional[InputBackend] = None) -> None:
+        self._backend = backend
+        self._queues: Dict[Optional[str], Deque[InputAction]] = {}
+        # Earliest monotonic time each task may run its next action; only
+        # tasks with queued actions or a pause not over yet have an entry.
+        self._next_at: Dict[Optional[str], float] = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"performed": 0, "failed": 0, "cancelled": 0}
+        self._max_wait = 0.0
+
+    @property
+    def backend(self) -> InputBackend:
+        if self._backend is None:
+            self._backend = PyAutoGuiBackend()
+        return self._backend
+
+    def set_backend(self, backend: InputBackend) -> Optional[InputBackend]:
+        """Replace the backend for subsequent actions; returns the previous one."""
+        with self._cond:
+            previous, self._backend = self._backend, backend
+        return previous
+
+    def submit(
+        self,
+        kind: str,
+        *args,
+        task_id: Optional[str] = None,
+        min_gap: float = 0.0,
+        settle: float = 0.0,
+        **kwargs,
+    ) -> Future:
+        action = InputAction(
+            kind=kind, args=args, kwargs=kwargs, task_id=task_id, min_gap=min_gap, settle=settle, seq=next(self._seq)
+        )
+        with self._cond:
+            self._queues.setdefault(task_id, deque()).append(action)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="input-dispatcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return action.future
+
+    def cancel(self, task_id: Optional[str]) -> int:
+        """Drop the queued (not yet started) actions and the rate-limit state of a task; returns how many."""
+        with self._cond:
+            queue = self._queues.pop(task_id, None)
+            self._next_at.pop(task_id, None)
+        count = 0
+        for action in queue or ():
+            if action.future.cancel():
+                count += 1
+        with self._cond:
+            self._counters["cancelled"] += count
+        return count
+
+    def _pick(self, now: float) -> Tuple[Optional[InputAction], Optional[float]]:
+        """Oldest action whose task may act now, else the time until one may."""
+        best: Optional[InputAction] = None
+        wake: Optional[float] = None
+        for task_id, queue in list(self._queues.items()):
+            if not queue:
+                del self._queues[task_id]
+                continue
+            ready_at = self._next_at.get(task_id, 0.0)
+            if ready_at > now:
+                wake = ready_at - now if wake is None else min(wake, ready_at - now)
+            elif best is None or queue[0].seq < best.seq:
+                best = queue[0]
+        if best is not None:
+            self._queues[best.task_id].popleft()
+        # Forget drained tasks whose pause is over, so finished (e.g. task@hwnd) ids do not pile up.
+        for task_id in [t for t, at in self._next_at.items() if at <= now and t not in self._queues]:
+            del self._next_at[task_id]
+        return best, wake
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                action, wake = self._pick(time.monotonic())
+                while action is None:
+                    self._cond.wait(wake)
+                    action, wake = self._pick(time.monotonic())
+                backend = self.backend
+            if not action.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._counters["cancelled"] += 1
+                continue
+            started = time.monotonic()
+            try:
+                backend.perform(action)
+            except Exception as exc:
+                log_store.log(f"[input] {action.kind} failed: {exc}", level="ERROR", task_id=action.task_id)
+                action.future.set_exception(exc)
+                outcome = "failed"
+            else:
+                outcome = "performed"
+            finished = time.monotonic()
+            with self._cond:
+                self._counters[outcome] += 1
+                self._max_wait = max(self._max_wait, started - action.enqueued_at)
+                if action.task_id in self._queues:
+                    # Not set for a task cancelled while this action ran.
+                    self._next_at[action.task_id] = max(started + action.min_gap, finished + action.settle)
+            if outcome == "performed":
+                action.future.set_result(finished)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = sum(len(q) for q in self._queues.values())
+            return dict(self._counters, queued=queued, max_wait_ms=round(self._max_wait * 1000, 2))
+
+
+input_dispatcher = InputDispatcher()
+
+
+def get_input_backend() -> InputBackend:
+    return input_dispatcher.backend
+
+
+def set_input_backend(backend: InputBackend) -> Optional[InputBackend]:
+    """Replace the process-wide input backend (e.g. RecordingInputBackend for headless runs)."""
+    return input_dispatcher.set_backend(backend)
+
+
 def click_screen(point: Tuple[int, int], button: str = "left", clicks: int = 1, interval: float = 0.15) -> None:
-    pyautogui.click(x=point[0], y=point[1], button=button, clicks=clicks, interval=interval)
+    input_dispatcher.submit("click", point, button=button, clicks=clicks, interval=interval).result()
 
 
 def drag_screen(start: Tuple[int, int], end: Tuple[int, int], duration: float = 0.3) -> None:
-    pyautogui.moveTo(start[0], start[1])
-    pyautogui.dragTo(end[0], end[1], duration=duration, button="left")
+    input_dispatcher.submit("drag", start, end, duration=duration).result()
 
 
 def type_text(text: str, interval: float = 0.02) -> None:
-    pyautogui.write(text, interval=interval)
+    input_dispatcher.submit("type_text", text, interval=interval).result()
 
 
 def hotkey(*keys: str, interval: float = 0.02) -> None:
-    pyautogui.hotkey(*keys, interval=interval)
+    input_dispatcher.submit("hotkey", *keys, interval=interval).result()
 
 
 class InputController:
-    def __init__(self, rect_provider):
+    """
+    Window-relative input for one task, performed through the input dispatcher.
+
+    max_actions_per_sec rate-limits this task's actions (0 = unlimited). The
+    submit_* methods return the dispatcher Future at once; the blocking ones
+    wait for it and then pause for interval.
+    """
+
+    def __init__(
+        self,
+        rect_provider,
+        wait: Optional[Callable[[float], object]] = None,
+        task_id: Optional[str] = None,
+        max_actions_per_sec: float = 0.0,
+        dispatcher: Optional[InputDispatcher] = None,
+    ):
         self._rect_provider = rect_provider
+        # Pause after a click; TaskBase passes a stop-aware wait so a stop is not held up here.
+        self._wait = wait or time.sleep
+        self.task_id = task_id
+        self.max_actions_per_sec = max_actions_per_sec
+        self._dispatcher = dispatcher or input_dispatcher
 
-    def to_screen(self, window_point: Tuple[int, int]) -> Tuple[int, int]:
-        return map_window_to_screen(window_point, self._rect_provider)
+    def to_screen(self, window_point: Tuple[int, int], window_rect: Rect | None = None) -> Tuple[int, int]:
+        provider = (lambda: window_rect) if window_rect else self._rect_provider
+        return map_window_to_screen(window_point, provider)
+
+    def submit(self, kind: str, *args, settle: float = 0.0, **kwargs) -> Future:
+        min_gap = 1.0 / self.max_actions_per_sec if self.max_actions_per_sec > 0 else 0.0
+        return self._dispatcher.submit(kind, *args, task_id=self.task_id, min_gap=min_gap, settle=settle, **kwargs)
+
+    def result(self, future: Future) -> float:
+        """Wait for an action; a stop raised by the wait callback cancels it if it has not started."""
+        while True:
+            try:
+                return future.result(timeout=INPUT_POLL)
+            except FutureTimeout:
+                try:
+                    self._wait(0)
+                except BaseException:
+                    future.cancel()
+                    raise
+
+    def submit_click_point(
+        self,
+        point: Tuple[int, int],
+        button: str = "left",
+        clicks: int = 1,
+        interval: float = 0.2,
+        window_rect: Rect | None = None,
+    ) -> Future:
+        """Queue a click at a window-coordinate point; the task's next action waits interval after it."""
+        screen_point = self.to_screen(point, window_rect)
+        return self.submit("click", screen_point, button=button, clicks=clicks, interval=interval, settle=interval)
+
+    def submit_click_rect(
+        self,
+        rect: Tuple[int, int, int, int],
+        mode: str = "center",
+        padding: ClickPadding | None = None,
+        button: str = "left",
+        clicks: int = 1,
+        interval: float = 0.2,
+        window_rect: Rect | None = None,
+    ) -> Future:
+        point = pick_point(rect, mode=mode, padding=padding)
+        return self.submit_click_point(point, button=button, clicks=clicks, interval=interval, window_rect=window_rect)
 
     def click_rect(
         self,
@@ -70,15 +403,21 @@ class InputController:
         button: str = "left",
         clicks: int = 1,
         interval: float = 0.2,
+        window_rect: Rect | None = None,
     ) -> Tuple[int, int]:
+        """Click inside a window-coordinate rect; window_rect skips re-querying the window position."""
         point = pick_point(rect, mode=mode, padding=padding)
-        screen_point = self.to_screen(point)
-        click_screen(screen_point, button=button, clicks=clicks, interval=interval)
-        time.sleep(interval)
-        return screen_point
+        return self.click_point(point, button=button, clicks=clicks, interval=interval, window_rect=window_rect)
 
-    def click_point(self, point: Tuple[int, int], button: str = "left", clicks: int = 1, interval: float = 0.2) -> Tuple[int, int]:
-        screen_point = self.to_screen(point)
-        click_screen(screen_point, button=button, clicks=clicks, interval=interval)
-        time.sleep(interval)
+    def click_point(
+        self,
+        point: Tuple[int, int],
+        button: str = "left",
+        clicks: int = 1,
+        interval: float = 0.2,
+        window_rect: Rect | None = None,
+    ) -> Tuple[int, int]:
+        screen_point = self.to_screen(point, window_rect)
+        self.result(self.submit("click", screen_point, button=button, clicks=clicks, interval=interval, settle=interval))
+        self._wait(interval)
         return screen_point
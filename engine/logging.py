@@ -3,7 +3,7 @@ from __future__ import annotations
 import threading
 import time
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 
 @dataclass
@@ -19,6 +19,7 @@ class LogStore:
         self._max = max_records
         self._records: List[LogRecord] = []
         self._lock = threading.Lock()
+        self._sinks: List[Callable[[LogRecord], None]] = []
 
     def clear(self) -> None:
         with self._lock:
@@ -30,6 +31,17 @@ class LogStore:
             # Keep memory bounded.
             if len(self._records) > self._max:
                 self._records = self._records[-self._max :]
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink(record)
+            except Exception:
+                pass
+
+    def add_sink(self, sink: Callable[[LogRecord], None]) -> None:
+        """Also pass every appended record to sink, e.g. to forward logs out of a worker process."""
+        with self._lock:
+            self._sinks.append(sink)
 
     def log(self, message: str, level: str = "INFO", task_id: Optional[str] = None) -> None:
         self.append(LogRecord(level=level, message=message, task_id=task_id))
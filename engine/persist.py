@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .frame import Frame
+from .logging import log_store
+
+CODECS = {"png": ".png", "webp": ".webp", "npy": ".npy"}
+DEFAULT_CODEC = "png"
+# zlib level 1 is several times faster than PIL's default (6) for ~10% larger files.
+PNG_COMPRESS_LEVEL = 1
+# Bounding box of the preview written next to each screenshot.
+THUMBNAIL_SIZE = (320, 320)
+PERSIST_WORKERS = 2
+# Finished jobs remembered for polling.
+MAX_FINISHED_JOBS = 256
+
+
+def thumbnail_path(path: Path) -> Path:
+    return path.with_name(f"{path.stem}.thumb.jpg")
+
+
+def _rgb_array(image) -> np.ndarray:
+    if isinstance(image, Frame):
+        return image.rgb
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+    return np.asarray(image)
+
+
+def encode_image(rgb: np.ndarray, path: Path, codec: str, compress_level: int = PNG_COMPRESS_LEVEL) -> None:
+    """Write an RGB array with the given codec; the file appears atomically."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    if codec == "npy":
+        with open(tmp, "wb") as fh:
+            np.save(fh, np.ascontiguousarray(rgb))
+    else:
+        img = Image.fromarray(rgb)
+        if codec == "webp":
+            img.save(tmp, format="WEBP", lossless=True, method=0)
+        else:
+            img.save(tmp, format="PNG", compress_level=compress_level)
+    os.replace(tmp, path)
+
+
+def write_thumbnail(rgb: np.ndarray, path: Path, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Path:
+    thumb = Image.fromarray(rgb).convert("RGB")
+    thumb.thumbnail(size, Image.BILINEAR)
+    target = thumbnail_path(path)
+    tmp = target.with_name(f".{target.name}.tmp")
+    thumb.save(tmp, format="JPEG", quality=80)
+    os.replace(tmp, target)
+    return target
+
+
+@dataclass
+class PersistJob:
+    id: str
+    path: Path
+    thumbnail: Optional[Path]
+    status: str = "pending"
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    future: Optional[Future] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "path": str(self.path),
+            "thumbnail": str(self.thumbnail) if self.thumbnail else None,
+            "error": self.error,
+            "elapsed": round((self.finished_at or time.time()) - self.created_at, 3),
+        }
+
+
+class ImagePersister:
+    """
+    Encodes screenshots on a small worker pool so request handlers return at once.
+
+    save() returns a PersistJob whose status the UI polls; readers of a file
+    that is still being written call wait() (load_image() does it for them).
+    """
+
+    def __init__(self, workers: int = PERSIST_WORKERS) -> None:
+        self._workers = workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._jobs: Dict[str, PersistJob] = {}
+        self._pending: Dict[Path, PersistJob] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="persist")
+            return self._pool
+
+    def save(
+        self,
+        image,
+        path: Path,
+        codec: Optional[str] = None,
+        compress_level: int = PNG_COMPRESS_LEVEL,
+        thumbnail: bool = True,
+    ) -> PersistJob:
+        """
+        Queue an image (Frame, PIL image or RGB array) for writing.
+
+        The codec defaults to the path suffix; a mismatching suffix is replaced.
+        """
+        codec = (codec or path.suffix.lstrip(".") or DEFAULT_CODEC).lower()
+        if codec not in CODECS:
+            raise ValueError(f"unsupported codec: {codec}")
+        path = Path(path).with_suffix(CODECS[codec])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Keep a reference to the pixels only; a PIL image may be closed by the caller.
+        rgb = _rgb_array(image)
+        job = PersistJob(id=uuid.uuid4().hex, path=path, thumbnail=thumbnail_path(path) if thumbnail else None)
+        pool = self._get_pool()
+        # Register the job together with its future: wait() must never see a
+        # pending write it cannot wait for. _run unregisters under the same
+        # lock, so it cannot finish before the job is registered.
+        with self._lock:
+            job.future = pool.submit(self._run, job, rgb, codec, compress_level)
+            self._jobs[job.id] = job
+            self._pending[path] = job
+            self._prune()
+        return job
+
+    def _run(self, job: PersistJob, rgb: np.ndarray, codec: str, compress_level: int) -> None:
+        try:
+            encode_image(rgb, job.path, codec, compress_level)
+            job.status = "saved"
+            if job.thumbnail:
+                write_thumbnail(rgb, job.path)
+            job.status = "done"
+        except Exception as exc:
+            job.status = "failed"
+            job.error = str(exc)
+            log_store.log(f"[persist] failed to write {job.path}: {exc}", level="ERROR")
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._pending.get(job.path) is job:
+                    self._pending.pop(job.path)
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        for job in sorted(finished, key=lambda j: j.finished_at or 0)[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self._jobs.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[PersistJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, path: Path, timeout: Optional[float] = 10.0) -> bool:
+        """Block until a pending write of path finished; True when nothing is pending (anymore)."""
+        with self._lock:
+            job = self._pending.get(Path(path))
+        if job is None or job.future is None:
+            return True
+        try:
+            job.future.result(timeout=timeout)
+        except Exception:
+            return False
+        # The image itself is readable once "saved", even if the thumbnail failed.
+        return job.status in ("saved", "done")
+
+
+persister = ImagePersister()
+
+
+def load_image(path: Path, timeout: Optional[float] = 10.0) -> Image.Image:
+    """Open a persisted screenshot (PNG/WebP/.npy), waiting for a pending write of it first."""
+    path = Path(path)
+    persister.wait(path, timeout=timeout)
+    if path.suffix.lower() == ".npy":
+        return Image.fromarray(np.load(path))
+    return Image.open(path)
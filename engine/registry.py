@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .config import get_templates_config_path
+from .logging import log_store
+from .vision import scale_mask, scale_template
+
+FileStamp = Tuple[int, int]
+
+
+def _stat(path: Path) -> Optional[FileStamp]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    # Cached arrays are shared between tasks, guard against in-place edits.
+    arr.flags.writeable = False
+    return arr
+
+
+@dataclass
+class CachedImage:
+    color: np.ndarray
+    gray: np.ndarray
+    stamp: FileStamp
+    # Derived from the alpha channel when the image has transparency.
+    mask: Optional[np.ndarray] = None
+    scaled: Dict[float, np.ndarray] = field(default_factory=dict)
+    masks: Dict[Tuple[bool, Tuple[int, int]], np.ndarray] = field(default_factory=dict)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        h, w = self.gray.shape[:2]
+        return w, h
+
+    def gray_at(self, scale: float) -> np.ndarray:
+        """Gray template resized to scale, memoized for the lifetime of this entry."""
+        scale = round(float(scale), 4)
+        arr = self.scaled.get(scale)
+        if arr is None:
+            arr = scale_template(self.gray, scale)
+            self.scaled[scale] = _readonly(arr) if arr is not self.gray else arr
+        return arr
+
+    def mask_sized(self, size: Tuple[int, int], from_gray: bool = False) -> Optional[np.ndarray]:
+        """
+        Match mask resized to (width, height), memoized per size.
+
+        from_gray treats this image as an explicit mask file (bright = compare);
+        otherwise the alpha-derived mask is used, if any.
+        """
+        key = (from_gray, size)
+        arr = self.masks.get(key)
+        if arr is not None:
+            return arr
+        if from_gray:
+            base = np.where(self.gray > 127, 255, 0).astype(np.uint8)
+        else:
+            base = self.mask
+        if base is None:
+            return None
+        arr = scale_mask(base, size)
+        if arr is not self.mask:
+            arr = _readonly(arr)
+        self.masks[key] = arr
+        return arr
+
+
+@dataclass
+class _CachedConfig:
+    templates: Dict
+    stamp: FileStamp
+
+
+def decode_pil(img: Image.Image) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Convert a PIL image into (RGB, gray, alpha mask) arrays."""
+    mask = None
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        alpha = np.array(img.convert("RGBA"))[:, :, 3]
+        if alpha.min() < 255:
+            mask = np.where(alpha > 0, 255, 0).astype(np.uint8)
+    color = np.array(img.convert("RGB"))
+    gray = cv2.cvtColor(color, cv2.COLOR_RGB2GRAY)
+    return color, gray, mask
+
+
+def decode_image(path: Path) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Decode an image file into (RGB, gray, alpha mask) arrays."""
+    # PIL handles non-ASCII paths on Windows, cv2.imread does not.
+    with Image.open(path) as img:
+        return decode_pil(img)
+
+
+class TemplateRegistry:
+    """
+    Process-wide cache of parsed templates.yaml files and decoded template images.
+
+    Entries are validated against the file's (mtime, size) on every lookup, so
+    edits made by Template Studio are picked up without re-parsing unchanged files.
+
+    With use_bundles, configs are read from their compiled bundle
+    (engine.bundle, rebuilt when stale) and images unchanged since the bundle
+    was verified are memory-mapped from it instead of being decoded.
+
+    Images with identical pixels share one set of arrays and scaled/mask
+    memos, keyed by their content digest (engine.store), whether they are
+    referenced from the image store or duplicated in several task folders.
+    """
+
+    def __init__(self, use_bundles: bool = True) -> None:
+        self.use_bundles = use_bundles
+        self._configs: Dict[Path, _CachedConfig] = {}
+        self._images: Dict[Path, CachedImage] = {}
+        # image path -> (bundle holding its arrays, file stamp the bundle was verified against)
+        self._bundled: Dict[Path, Tuple[Any, FileStamp]] = {}
+        # content digest -> an entry holding those pixels, while any path still uses it
+        self._shared: "weakref.WeakValueDictionary[str, CachedImage]" = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+        self._counters: Dict[str, int] = {
+            "config_hits": 0,
+            "config_misses": 0,
+            "config_reloads": 0,
+            "image_hits": 0,
+            "image_misses": 0,
+            "image_reloads": 0,
+            "image_mapped": 0,
+            "image_shared": 0,
+        }
+
+    @staticmethod
+    def _normalize(path: Path | str | os.PathLike | None) -> Path:
+        if path is None:
+            return get_templates_config_path()
+        return Path(path)
+
+    def _load(self, path: Path) -> Dict:
+        from .bundle import load_bundle
+        from .templates import load_templates, templates_from_data
+
+        bundle = load_bundle(path) if self.use_bundles else None
+        if bundle is None:
+            return load_templates(path)
+        with self._lock:
+            for image_path, stamp in bundle.verified.items():
+                self._bundled[image_path] = (bundle, stamp)
+        return templates_from_data(bundle.data, path)
+
+    def templates(self, config_path: Path | str | os.PathLike | None = None) -> Dict:
+        """Return the templates defined in config_path, parsing it only when it changed."""
+        path = self._normalize(config_path)
+        stamp = _stat(path)
+        with self._lock:
+            cached = self._configs.get(path)
+            if stamp is None:
+                self._configs.pop(path, None)
+                return {}
+            if cached and cached.stamp == stamp:
+                self._counters["config_hits"] += 1
+                return cached.templates
+            self._counters["config_reloads" if cached else "config_misses"] += 1
+        templates = self._load(path)
+        with self._lock:
+            self._configs[path] = _CachedConfig(templates=templates, stamp=stamp)
+        if cached:
+            log_store.log(f"[registry] reload templates: {path}", level="INFO")
+        return templates
+
+    def image(self, path: Path | str | os.PathLike) -> CachedImage:
+        """Return decoded color/gray arrays for an image, decoding it only when it changed."""
+        path = Path(path)
+        stamp = _stat(path)
+        if stamp is None:
+            with self._lock:
+                self._images.pop(path, None)
+            raise FileNotFoundError(f"template image not found: {path}")
+        with self._lock:
+            cached = self._images.get(path)
+            if cached and cached.stamp == stamp:
+                self._counters["image_hits"] += 1
+                return cached
+            self._counters["image_reloads" if cached else "image_misses"] += 1
+            bundled = self._bundled.get(path)
+        digest = None
+        if bundled and bundled[1] == stamp:
+            color, gray, mask = bundled[0].arrays(path)
+            digest = bundled[0].images[path].pixels or None
+            with self._lock:
+                self._counters["image_mapped"] += 1
+        else:
+            color, gray, mask = decode_image(path)
+        digest = digest or self._digest(path, color, mask)
+        with self._lock:
+            shared = self._shared.get(digest)
+            if shared is not None:
+                self._counters["image_shared"] += 1
+                entry = CachedImage(
+                    color=shared.color,
+                    gray=shared.gray,
+                    stamp=stamp,
+                    mask=shared.mask,
+                    scaled=shared.scaled,
+                    masks=shared.masks,
+                )
+            else:
+                entry = CachedImage(
+                    color=_readonly(color),
+                    gray=_readonly(gray),
+                    stamp=stamp,
+                    mask=_readonly(mask) if mask is not None else None,
+                )
+            self._shared[digest] = entry
+            self._images[path] = entry
+        return entry
+
+    @staticmethod
+    def _digest(path: Path, color: np.ndarray, mask: Optional[np.ndarray]) -> str:
+        from .store import image_digest, image_store
+
+        # Store objects are named by their digest, no need to hash them again.
+        return image_store.digest_of(path) or image_digest(color, mask)
+
+    def preload(self, config_path: Path | str | os.PathLike | None = None) -> int:
+        """Parse a templates file and decode all of its images ahead of the first match."""
+        loaded = 0
+        for tpl in self.templates(config_path).values():
+            try:
+                self.image(tpl.file)
+                loaded += 1
+            except Exception:
+                continue
+        return loaded
+
+    def invalidate(self, path: Path | str | os.PathLike | None = None) -> None:
+        """Drop a cached config/image, or everything when path is None."""
+        with self._lock:
+            if path is None:
+                self._configs.clear()
+                self._images.clear()
+                self._bundled.clear()
+                self._shared.clear()
+                return
+            p = Path(path)
+            self._configs.pop(p, None)
+            self._images.pop(p, None)
+            self._bundled.pop(p, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            data = dict(self._counters)
+            data["configs_cached"] = len(self._configs)
+            data["images_cached"] = len(self._images)
+            data["images_distinct"] = len(self._shared)
+        return data
+
+
+class ScaleCache:
+    """
+    Learned template scales per (window size, template file).
+
+    Persisted as JSON next to the templates.yaml the template came from, so a
+    scale found once survives restarts and later checks run a single-scale match.
+    """
+
+    def __init__(self) -> None:
+        self._files: Dict[Path, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_path(config_path: Path) -> Path:
+        return config_path.with_name(f"{config_path.stem}.scales.json")
+
+    @staticmethod
+    def entry_key(window_size: Tuple[int, int], template_file: Path, base_dir: Path) -> str:
+        try:
+            name = Path(template_file).relative_to(base_dir).as_posix()
+        except ValueError:
+            name = Path(template_file).as_posix()
+        return f"{window_size[0]}x{window_size[1]}|{name}"
+
+    def _entries(self, path: Path) -> Dict[str, float]:
+        entries = self._files.get(path)
+        if entries is None:
+            entries = {}
+            if path.exists():
+                try:
+                    entries = {k: float(v) for k, v in json.loads(path.read_text(encoding="utf-8")).items()}
+                except Exception:
+                    entries = {}
+            self._files[path] = entries
+        return entries
+
+    def get(self, config_path: Path, window_size: Tuple[int, int], template_file: Path) -> Optional[float]:
+        path = self.cache_path(config_path)
+        key = self.entry_key(window_size, template_file, config_path.parent)
+        with self._lock:
+            return self._entries(path).get(key)
+
+    def put(self, config_path: Path, window_size: Tuple[int, int], template_file: Path, scale: float) -> None:
+        path = self.cache_path(config_path)
+        key = self.entry_key(window_size, template_file, config_path.parent)
+        with self._lock:
+            entries = self._entries(path)
+            if entries.get(key) == scale:
+                return
+            entries[key] = scale
+            self._write(path, entries)
+
+    def forget(self, config_path: Path, template_file: Path) -> None:
+        """Drop learned scales of a template for every window size, e.g. after it was re-cropped."""
+        path = self.cache_path(config_path)
+        suffix = "|" + self.entry_key((0, 0), template_file, config_path.parent).split("|", 1)[1]
+        with self._lock:
+            entries = self._entries(path)
+            stale = [key for key in entries if key.endswith(suffix)]
+            if not stale:
+                return
+            for key in stale:
+                entries.pop(key)
+            self._write(path, entries)
+
+    @staticmethod
+    def _write(path: Path, entries: Dict[str, float]) -> None:
+        try:
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(entries, indent=2, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+template_registry = TemplateRegistry()
+scale_cache = ScaleCache()
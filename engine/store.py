@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import yaml
+from PIL import Image
+
+from .config import get_assets_dir, get_store_dir, get_tasks_root, get_templates_config_path
+from .logging import log_store
+from .persist import PNG_COMPRESS_LEVEL, PersistJob, persister, thumbnail_path
+from .registry import decode_pil
+
+# templates.yaml values of this form (file/mask/base) name a store object.
+REF_PREFIX = "blake2b:"
+DIGEST_SIZE = 16
+SUFFIXES = (".png", ".webp", ".npy", ".jpg", ".jpeg", ".bmp")
+# Unreferenced objects younger than this are kept: a base is uploaded before
+# any template referencing it is saved.
+GC_GRACE = 24 * 3600.0
+# Screenshot/upload names written before the store existed (base_<...>).
+LEGACY_BASE_PATTERN = "base_*"
+
+
+def image_digest(color: np.ndarray, mask: Optional[np.ndarray] = None) -> str:
+    """
+    BLAKE2b digest of decoded pixels (RGB plus alpha mask), independent of
+    the file format, so a PNG crop and a lossless WebP of it are one object.
+    """
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    h.update(repr(color.shape).encode())
+    h.update(np.ascontiguousarray(color, dtype=np.uint8).data)
+    if mask is not None:
+        h.update(b"mask")
+        h.update(np.ascontiguousarray(mask, dtype=np.uint8).data)
+    return h.hexdigest()
+
+
+def ref(digest: str) -> str:
+    return f"{REF_PREFIX}{digest}"
+
+
+def parse_ref(value) -> Optional[str]:
+    """The digest of a blake2b:<digest> reference, None for plain paths."""
+    if isinstance(value, str) and value.startswith(REF_PREFIX):
+        return value[len(REF_PREFIX) :].strip().lower()
+    return None
+
+
+def _is_digest(name: str) -> bool:
+    return len(name) == DIGEST_SIZE * 2 and all(c in "0123456789abcdef" for c in name)
+
+
+def _write_atomic(path: Path, content: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def resolve_configs() -> Tuple[List[Path], List[str]]:
+    """
+    Every templates.yaml in use, resolved like the task API resolves a task:
+    the assets config, tasks.json entries with their own path/templates_path
+    and the templates: name of each task.yaml. Also returns the files that
+    could not be read; their tasks may reference images not counted here.
+    """
+    root = get_tasks_root()
+    problems: List[str] = []
+    # (task folder, templates path from tasks.json)
+    tasks: List[Tuple[Path, Optional[str]]] = []
+    tasks_json = get_assets_dir() / "tasks.json"
+    if tasks_json.exists():
+        try:
+            entries = json.loads(tasks_json.read_bytes().decode("utf-8-sig"))
+            for entry in entries:
+                tasks.append((Path(entry.get("path") or root / entry.get("id", "")), entry.get("templates_path")))
+        except (OSError, ValueError, TypeError, AttributeError):
+            problems.append(str(tasks_json))
+    if root.exists():
+        tasks.extend((sub, None) for sub in sorted(root.iterdir()) if (sub / "task.yaml").exists())
+    configs = [get_templates_config_path()]
+    for task_dir, templates_path in tasks:
+        task_yaml = task_dir / "task.yaml"
+        if task_yaml.exists():
+            try:
+                data = yaml.safe_load(task_yaml.read_text(encoding="utf-8")) or {}
+                templates_path = task_dir / data.get("templates", "templates.yaml")
+            except (OSError, ValueError, TypeError, AttributeError, yaml.YAMLError):
+                problems.append(str(task_yaml))
+                continue
+        configs.append(Path(templates_path or task_dir / "templates.yaml"))
+    unique: Dict[Path, Path] = {}
+    for path in configs:
+        if path.exists():
+            unique.setdefault(path.resolve(), path)
+    return list(unique.values()), problems
+
+
+class ImageStore:
+    """
+    Content-addressed template and base images under assets/store.
+
+    Objects live at <root>/<first two hex digits>/<digest><suffix>, where the
+    digest is image_digest() of the decoded pixels. templates.yaml entries
+    reference them as blake2b:<digest>, so a crop or base shared by several
+    tasks is stored once, and objects are immutable: a re-cropped template
+    gets a new digest instead of overwriting a file other tasks may use.
+    Objects no templates.yaml references any more are removed by gc().
+    """
+
+    def __init__(self, root: Optional[Path] = None) -> None:
+        self._root = root
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        return self._root or get_store_dir()
+
+    def _shard(self, digest: str) -> Path:
+        return self.root / digest[:2]
+
+    def path(self, digest: str) -> Optional[Path]:
+        """The stored file of digest, or None when there is none."""
+        shard = self._shard(digest)
+        for suffix in SUFFIXES:
+            candidate = shard / f"{digest}{suffix}"
+            if candidate.exists():
+                return candidate
+        return None
+
+    def resolve(self, digest: str) -> Path:
+        """
+        Path of a referenced object; a missing one resolves to where its PNG
+        would be, so loading it fails like any missing template image.
+        """
+        return self.path(digest) or self._shard(digest) / f"{digest}.png"
+
+    def digest_of(self, path: Path | str) -> Optional[str]:
+        """Digest of a file inside the store, None for any other path."""
+        path = Path(path)
+        if not _is_digest(path.stem) or path.parent.name != path.stem[:2]:
+            return None
+        try:
+            return path.stem if path.parent.parent.resolve() == self.root.resolve() else None
+        except OSError:
+            return None
+
+    def put_image(self, img: Image.Image) -> Tuple[str, Path]:
+        """Store a PIL image as PNG; returns (digest, path), reusing an identical object."""
+        color, _, mask = decode_pil(img)
+        digest = image_digest(color, mask)
+        existing = self.path(digest)
+        if existing is not None:
+            return digest, existing
+        target = self._shard(digest) / f"{digest}.png"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+        _write_atomic(target, buf.getvalue())
+        return digest, target
+
+    def put_bytes(self, content: bytes, suffix: str = ".png") -> Tuple[str, Path]:
+        """Store an encoded image file as is (e.g. an upload); it is decoded once for its digest."""
+        with Image.open(io.BytesIO(content)) as img:
+            color, _, mask = decode_pil(img)
+        digest = image_digest(color, mask)
+        existing = self.path(digest)
+        if existing is not None:
+            return digest, existing
+        suffix = suffix.lower() if suffix.lower() in SUFFIXES else ".png"
+        target = self._shard(digest) / f"{digest}{suffix}"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(target, content)
+        return digest, target
+
+    def put_file(self, path: Path) -> Tuple[str, Path]:
+        return self.put_bytes(Path(path).read_bytes(), Path(path).suffix)
+
+    def put_frame(
+        self,
+        frame,
+        codec: Optional[str] = None,
+        compress_level: int = PNG_COMPRESS_LEVEL,
+        thumbnail: bool = True,
+    ) -> Tuple[str, Path, Optional[PersistJob]]:
+        """
+        Store a captured Frame, encoding it on the persister pool.
+
+        Returns (digest, path, job); job is None when the same pixels are
+        already stored and nothing has to be written.
+        """
+        digest = image_digest(frame.rgb)
+        existing = self.path(digest)
+        if existing is not None:
+            return digest, existing, None
+        target = self._shard(digest) / digest
+        job = persister.save(frame, target, codec=codec, compress_level=compress_level, thumbnail=thumbnail)
+        return digest, job.path, job
+
+    def objects(self) -> Iterator[Tuple[str, Path]]:
+        if not self.root.exists():
+            return
+        for shard in sorted(self.root.iterdir()):
+            if not shard.is_dir():
+                continue
+            for path in sorted(shard.iterdir()):
+                # Skips thumbnails (<digest>.thumb.jpg) and in-flight .tmp files.
+                if path.suffix.lower() in SUFFIXES and _is_digest(path.stem):
+                    yield path.stem, path
+
+    def referenced(self, configs: Iterable[Path]) -> Tuple[Set[str], Set[Path]]:
+        """
+        Digests and plain file paths referenced by file/mask/base entries of
+        the configs; raises ValueError when one of them cannot be read.
+        """
+        digests: Set[str] = set()
+        paths: Set[Path] = set()
+        for config_path in configs:
+            for value in _image_values(_read_config(config_path, strict=True)):
+                digest = parse_ref(value)
+                if digest:
+                    digests.add(digest)
+                    continue
+                path = Path(value)
+                path = path if path.is_absolute() else config_path.parent / path
+                digest = self.digest_of(path)
+                if digest:
+                    digests.add(digest)
+                else:
+                    paths.add(path.resolve())
+        return digests, paths
+
+    def gc(
+        self,
+        configs: Optional[Iterable[Path]] = None,
+        grace: float = GC_GRACE,
+        dry_run: bool = False,
+        legacy: bool = False,
+    ) -> Dict:
+        """
+        Remove store objects that no templates.yaml references and that are
+        older than grace seconds. legacy also removes the timestamped base_*
+        screenshots/uploads in the images folders next to the configs under
+        the same rules.
+
+        configs defaults to resolve_configs(). Nothing is removed, and
+        RuntimeError is raised, when any task's config cannot be read, since
+        the images it references would look unreferenced.
+        """
+        problems: List[str] = []
+        if configs is None:
+            configs, problems = resolve_configs()
+        configs = list(configs)
+        try:
+            digests, paths = self.referenced(configs)
+        except ValueError as exc:
+            problems.append(str(exc))
+        if problems:
+            log_store.log(f"[store] gc refused, unreadable configs: {problems}", level="WARN")
+            raise RuntimeError(f"cannot resolve every templates.yaml, nothing removed: {', '.join(problems)}")
+        cutoff = time.time() - grace
+        candidates: List[Path] = []
+        kept = 0
+        for digest, path in self.objects():
+            if digest in digests:
+                kept += 1
+            elif _mtime(path) < cutoff and persister.wait(path, timeout=0):
+                candidates.append(path)
+        if legacy:
+            for path in _legacy_bases(configs):
+                if path.resolve() not in paths and _mtime(path) < cutoff and persister.wait(path, timeout=0):
+                    candidates.append(path)
+        freed = 0
+        removed: List[str] = []
+        with self._lock:
+            for path in candidates:
+                size = _size(path)
+                if not dry_run:
+                    try:
+                        path.unlink()
+                    except OSError:
+                        continue
+                    thumbnail_path(path).unlink(missing_ok=True)
+                freed += size
+                removed.append(str(path))
+        if removed and not dry_run:
+            log_store.log(f"[store] gc removed {len(removed)} images, {freed} bytes", level="INFO")
+        return {"removed": removed, "freed_bytes": freed, "kept": kept, "dry_run": dry_run}
+
+    def import_config(self, config_path: Path) -> int:
+        """
+        Move the images of a templates.yaml into the store, rewriting its
+        file/mask entries to blake2b: references. Original files are left in
+        place. Returns the number of rewritten entries.
+        """
+        data = _read_config(config_path)
+        changed = 0
+        for definition in (data.get("templates") or {}).values():
+            if not isinstance(definition, dict):
+                continue
+            for field in ("file", "mask"):
+                value = definition.get(field)
+                if not value or parse_ref(value):
+                    continue
+                path = Path(value)
+                path = path if path.is_absolute() else config_path.parent / path
+                if not path.exists():
+                    continue
+                digest = self.digest_of(path) or self.put_file(path)[0]
+                definition[field] = ref(digest)
+                changed += 1
+        if changed:
+            _write_atomic(config_path, yaml.safe_dump(data, allow_unicode=True).encode("utf-8"))
+        return changed
+
+    def stats(self) -> Dict:
+        count = 0
+        size = 0
+        for _, path in self.objects():
+            count += 1
+            size += _size(path)
+        return {"root": str(self.root), "objects": count, "bytes": size}
+
+
+def _read_config(path: Path, strict: bool = False) -> Dict:
+    try:
+        data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+        if not isinstance(data, dict):
+            raise ValueError("not a mapping")
+        return data
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, yaml.YAMLError) as exc:
+        if strict:
+            raise ValueError(f"{path}: {exc}") from exc
+        return {}
+
+
+def _image_values(data: Dict) -> Iterator[str]:
+    templates = data.get("templates") or {}
+    if not isinstance(templates, dict):
+        return
+    for definition in templates.values():
+        if not isinstance(definition, dict):
+            continue
+        for field in ("file", "mask", "base"):
+            value = definition.get(field)
+            if isinstance(value, str) and value:
+                yield value
+
+
+def _legacy_bases(configs: Iterable[Path]) -> Iterator[Path]:
+    dirs: Dict[Path, Path] = {}
+    for config_path in configs:
+        images = config_path.parent / "images"
+        for folder in (images, images / "base_uploads"):
+            dirs.setdefault(folder.resolve(), folder)
+    for folder in dirs.values():
+        if not folder.is_dir():
+            continue
+        for path in sorted(folder.glob(LEGACY_BASE_PATTERN)):
+            if path.is_file() and path.suffix.lower() in SUFFIXES and not path.name.endswith(".thumb.jpg"):
+                yield path
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return time.time()
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+image_store = ImageStore()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Content-addressed template image store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    gc_parser = commands.add_parser("gc", help="remove images no templates.yaml references")
+    gc_parser.add_argument("--dry-run", action="store_true", help="only list what would be removed")
+    gc_parser.add_argument("--grace", type=float, default=GC_GRACE / 3600, help="keep images younger than this (hours)")
+    gc_parser.add_argument("--legacy", action="store_true", help="also remove unreferenced base_* files in images folders")
+    import_parser = commands.add_parser("import", help="move the images of templates.yaml files into the store")
+    import_parser.add_argument("configs", nargs="*", type=Path, help="templates.yaml files (default: assets and every task)")
+    commands.add_parser("stats", help="print object count and size")
+    args = parser.parse_args(argv)
+    if args.command == "gc":
+        try:
+            result = image_store.gc(grace=args.grace * 3600, dry_run=args.dry_run, legacy=args.legacy)
+        except RuntimeError as exc:
+            print(exc)
+            return 1
+        for path in result["removed"]:
+            print(("would remove: " if args.dry_run else "removed: ") + path)
+        print(f"{len(result['removed'])} images, {result['freed_bytes']} bytes; {result['kept']} referenced objects kept")
+    elif args.command == "import":
+        for config_path in args.configs or resolve_configs()[0]:
+            print(f"{config_path}: {image_store.import_config(config_path)} entries")
+    else:
+        stats = image_store.stats()
+        print(f"{stats['root']}: {stats['objects']} objects, {stats['bytes']} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .capture import CaptureBackend
+from .frame import Frame, Rect
+from .logging import log_store
+
+
+class CaptureStream:
+    """
+    Continuous capture of one window into a fixed-size ring of preallocated frames.
+
+    A background thread grabs at up to `fps` and copies each capture into the
+    next ring slot, so readers get the newest frame without waiting on a grab.
+
+    Frames returned by latest()/wait_newer() are views into the ring: a slot
+    is overwritten after `size - 1` newer captures. Pass copy=True to keep a
+    frame longer than that (derived gray/ROI views already own their memory
+    once computed).
+    """
+
+    def __init__(
+        self,
+        backend: CaptureBackend,
+        hwnd: Optional[int],
+        fps: float = 15.0,
+        size: int = 4,
+        task_id: Optional[str] = None,
+    ) -> None:
+        self.backend = backend
+        self.hwnd = hwnd
+        self.fps = max(0.1, float(fps))
+        self.size = max(2, int(size))
+        self.task_id = task_id
+        self._slots: List[Optional[np.ndarray]] = [None] * self.size
+        self._meta: List[Optional[Tuple[int, float, Rect]]] = [None] * self.size
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    @property
+    def seq(self) -> int:
+        """Number of frames captured so far."""
+        with self._cond:
+            return self._seq
+
+    def start(self) -> "CaptureStream":
+        if self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.hwnd}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        period = 1.0 / self.fps
+        failures = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                # Stamp with the grab start so a frame is never considered newer than an
+                # action that happened while it was being captured.
+                self._publish(self.backend.grab(self.hwnd), started)
+                failures = 0
+            except Exception as exc:
+                failures += 1
+                if failures == 1:
+                    log_store.log(f"[capture] stream grab failed: {exc}", level="WARN", task_id=self.task_id)
+                # Back off while the window is gone instead of spinning.
+                self._stop.wait(min(2.0, period * (2 ** min(failures, 5))))
+                continue
+            self._stop.wait(max(0.0, period - (time.monotonic() - started)))
+
+    def _publish(self, frame: Frame, timestamp: float) -> None:
+        src = frame.rgb
+        with self._cond:
+            idx = self._seq % self.size
+            slot = self._slots[idx]
+            if slot is None or slot.shape != src.shape or slot.dtype != src.dtype:
+                # (Re)allocate the whole ring on first frame or window resize.
+                self._slots = [np.empty_like(src) for _ in range(self.size)]
+                self._meta = [None] * self.size
+                slot = self._slots[idx]
+            # Hide the slot from readers while it is being rewritten.
+            self._meta[idx] = None
+        np.copyto(slot, src)
+        with self._cond:
+            self._meta[idx] = (self._seq + 1, timestamp, frame.window_rect)
+            self._seq += 1
+            self._cond.notify_all()
+
+    def _newest(self, copy: bool) -> Optional[Frame]:
+        if not self._seq:
+            return None
+        idx = (self._seq - 1) % self.size
+        meta = self._meta[idx]
+        if meta is None:
+            return None
+        slot = self._slots[idx]
+        if copy:
+            rgb = slot.copy()
+        else:
+            rgb = slot.view()
+            rgb.flags.writeable = False
+        return Frame(rgb=rgb, window_rect=meta[2], timestamp=meta[1])
+
+    def latest(self, copy: bool = False) -> Optional[Frame]:
+        """Newest captured frame, or None before the first capture."""
+        with self._cond:
+            return self._newest(copy)
+
+    def wait_newer(self, after: float, timeout: float = 1.0, copy: bool = False) -> Optional[Frame]:
+        """Block until a frame captured after monotonic time `after` exists; None on timeout/stop."""
+
+        def _ready() -> bool:
+            if self._stop.is_set():
+                return True
+            frame = self._newest(copy=False)
+            return frame is not None and frame.timestamp > after
+
+        with self._cond:
+            if not self._cond.wait_for(_ready, timeout=timeout):
+                return None
+            frame = self._newest(copy)
+            if frame is None or frame.timestamp <= after:
+                return None
+            return frame
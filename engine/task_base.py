@@ -5,20 +5,66 @@ import inspect
 import threading
 import time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
 
 from PIL import Image
 
 from . import config
-from .capture import capture_window
-from .input import InputController
+from .capture import CaptureBackend, get_capture_backend
+from .frame import Frame
+from .input import InputController, input_dispatcher
 from .logging import log_store
-from .templates import Template, load_templates
+from .registry import template_registry
+from .stream import CaptureStream
+from .templates import Template, capture_regions, find_many
 from .vision import MatchResult
-from .window import TargetWindowConfig, activate_window, find_window, get_window_rect
+from .window import TargetWindowConfig, activate_window, find_window, get_window_rect, window_exists
+
+T = TypeVar("T")
+
+# Adaptive polling: back off while the frame is static, speed up once it changes.
+POLL_BACKOFF = 1.5
+POLL_MAX_FACTOR = 4.0
+POLL_MIN_FACTOR = 0.5
+# Longest any engine wait blocks before re-checking the stop flag.
+STOP_POLL = 0.1
+
+
+class TaskStopped(BaseException):
+    """
+    Raised inside a task once it has been asked to stop.
+
+    A BaseException so a script's `except Exception` does not swallow it; the
+    executor records the run as stopped, not failed.
+    """
+
+
+class PollPacer:
+    """Delay between polling ticks: grows while the frame stays identical, drops once it changes."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.delay = interval
+        self._last_digest: Optional[bytes] = None
+
+    def next_delay(self, digest: bytes) -> float:
+        if digest == self._last_digest:
+            self.delay = min(self.delay * POLL_BACKOFF, self.interval * POLL_MAX_FACTOR)
+        elif self._last_digest is not None:
+            self.delay = self.interval * POLL_MIN_FACTOR
+        self._last_digest = digest
+        return self.delay
 
 
 class TaskBase:
+    # Per-task capture budget; capture() never grabs faster than this.
+    max_fps: float = 10.0
+    # Checks grab only the union of the templates' search_regions instead of the whole window.
+    region_capture: bool = True
+    # Rate limit applied by the input dispatcher to this task's clicks (0 = unlimited).
+    max_actions_per_sec: float = 10.0
+
     def __init__(
         self,
         target_window: Optional[TargetWindowConfig] = None,
@@ -31,10 +77,49 @@ class TaskBase:
         self.target_window_config = target_window
         self.hwnd: Optional[int] = None
         self.template_config_path = template_config_path
-        self.templates: Dict[str, Template] = load_templates(template_config_path)
-        self._last_image: Optional[Image.Image] = None
-        self._input = InputController(self._get_window_rect)
+        # The registry's dict is shared by every task on the same config; each
+        # instance works on its own copy, refreshed when the registry reloads.
+        self._registry_templates: Dict[str, Template] = template_registry.templates(template_config_path)
+        self.templates: Dict[str, Template] = dict(self._registry_templates)
+        self._templates_source: Optional[Path] = None
+        self._last_frame: Optional[Frame] = None
+        self._last_capture_at = 0.0
+        # None follows the process-wide default (engine.capture.set_capture_backend).
+        self.capture_backend: Optional[CaptureBackend] = None
+        self._stream: Optional[CaptureStream] = None
+        # Monotonic time of the last input action; captures wait for a frame newer than it.
+        self._last_action_at = 0.0
+        self._input = InputController(
+            self._get_window_rect, wait=self._wait, task_id=task_id, max_actions_per_sec=self.max_actions_per_sec
+        )
+        # Clicks submitted with submit_click() that may still be queued or in flight.
+        self._pending_input: List[Future] = []
         self._stop_event = threading.Event()
+        # Wall-clock time of the last progress (click, successful wait, sleep, report_progress), for the watchdog.
+        self._progress_at = time.time()
+        # Called with each progress time; process workers forward it to the API process.
+        self._progress_hook: Optional[Callable[[float], None]] = None
+
+    def reset_for_run(self) -> None:
+        """
+        Prepare a finished instance for another run (TaskExecutor reuse_instance).
+
+        Templates and the resolved window are kept; per-run state is cleared.
+        """
+        self.stop_capture_stream()
+        self._stop_event = threading.Event()
+        self._last_frame = None
+        self._last_capture_at = 0.0
+        self._last_action_at = 0.0
+        self._pending_input = []
+        self._progress_at = time.time()
+        if self.hwnd and self._backend().needs_window:
+            try:
+                alive = window_exists(self.hwnd)
+            except Exception:
+                alive = False
+            if not alive:
+                self.hwnd = None
 
     def _infer_template_path_from_module(self) -> Optional[Path]:
         """Try to locate templates.yaml next to the task script when not provided."""
@@ -63,8 +148,11 @@ class TaskBase:
             raise RuntimeError("Target window not resolved")
         return get_window_rect(hwnd)
 
+    def _backend(self) -> CaptureBackend:
+        return self.capture_backend or get_capture_backend()
+
     def ensure_window_focused(self) -> None:
-        if not self.target_window_config:
+        if not self.target_window_config or not self._backend().needs_window:
             return
         hwnd = self._ensure_hwnd()
         if not hwnd:
@@ -72,28 +160,119 @@ class TaskBase:
         activate_window(hwnd)
 
     # Screenshots and template resolution
+    def capture(self, regions: Optional[Iterable] = None) -> Frame:
+        """
+        Capture the target window into a Frame shared by every match on it.
+
+        regions (window coordinates) limits the grab to their bounding union;
+        frames from a running capture stream always cover the whole window.
+        """
+        backend = self._backend()
+        hwnd = self.hwnd
+        if backend.needs_window:
+            hwnd = self._ensure_hwnd()
+            if not hwnd:
+                raise RuntimeError("Target window not found")
+        self._wait(self._capture_budget_wait())
+        frame = None
+        if self._stream and self._stream.running:
+            # Never act on a frame grabbed before the last click landed.
+            frame = self._stream_frame(self._last_action_at, timeout=1.0)
+        if frame is None:
+            try:
+                frame = backend.grab_newer(hwnd, self._last_action_at, list(regions) if regions else None)
+            except Exception:
+                # A grab cut short by a stop request surfaces as TaskStopped, not as a capture error.
+                self._checkpoint()
+                raise
+        self._last_frame = frame
+        self._last_capture_at = time.monotonic()
+        return self._last_frame
+
+    def _stream_frame(self, after: float, timeout: float) -> Optional[Frame]:
+        """CaptureStream.wait_newer in STOP_POLL slices so a stop is noticed while waiting."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._checkpoint()
+            remaining = deadline - time.monotonic()
+            frame = self._stream.wait_newer(after, timeout=min(STOP_POLL, max(0.0, remaining)))
+            if frame is not None or remaining <= STOP_POLL:
+                return frame
+
+    def _capture_budget_wait(self) -> float:
+        """Seconds until max_fps allows the next capture."""
+        if self.max_fps <= 0:
+            return 0.0
+        return max(0.0, self._last_capture_at + 1.0 / self.max_fps - time.monotonic())
+
+    def start_capture_stream(self, fps: float = 15.0, size: int = 4) -> CaptureStream:
+        """
+        Capture the window continuously in the background; capture() then
+        returns the newest ring-buffer frame instead of grabbing synchronously.
+        """
+        self.stop_capture_stream()
+        backend = self._backend()
+        hwnd = self._ensure_hwnd() if backend.needs_window else self.hwnd
+        self._stream = CaptureStream(backend, hwnd, fps=fps, size=size, task_id=self.task_id).start()
+        return self._stream
+
+    def stop_capture_stream(self) -> None:
+        if self._stream:
+            self._stream.stop()
+            self._stream = None
+
+    def wait_frame(self, after: Optional[float] = None, timeout: float = 2.0) -> Optional[Frame]:
+        """
+        Wait for a frame captured after monotonic time `after` (default: the last click).
+
+        Uses the capture stream when running, otherwise grabs synchronously.
+        """
+        after = self._last_action_at if after is None else after
+        if self._stream and self._stream.running:
+            frame = self._stream_frame(after, timeout)
+            if frame is not None:
+                self._last_frame = frame
+            return frame
+        self._wait(after - time.monotonic())
+        return self.capture()
+
+    def _capture_for(self, templates: Iterable[Template]) -> Frame:
+        """Capture just what matching templates needs: the union of their search regions."""
+        if not self.region_capture or (self._stream and self._stream.running):
+            return self.capture()
+        if self._last_frame is not None:
+            # The previous grab already resolved the window rect; no extra lookup per tick.
+            left, top, right, bottom = self._last_frame.window_rect
+        else:
+            backend = self._backend()
+            hwnd = self._ensure_hwnd() if backend.needs_window else self.hwnd
+            left, top, right, bottom = backend.window_rect(hwnd)
+        return self.capture(capture_regions(templates, (right - left, bottom - top)))
+
     def screenshot(self) -> Image.Image:
-        hwnd = self._ensure_hwnd()
-        if not hwnd:
-            raise RuntimeError("Target window not found")
-        self._last_image = capture_window(hwnd)
-        return self._last_image
+        return self.capture().image
+
+    @property
+    def _last_image(self) -> Optional[Image.Image]:
+        return self._last_frame.image if self._last_frame else None
 
     def resolve_template(self, template_or_key) -> Template:
-        # Always reload templates to reflect latest edits
+        # The registry re-parses templates.yaml only when it changed on disk,
+        # so edits from Template Studio are still picked up on the next check.
         cfg_path = self.template_config_path
         if not cfg_path or (isinstance(cfg_path, Path) and not cfg_path.exists()):
             inferred = self._infer_template_path_from_module()
             if inferred:
                 cfg_path = inferred
                 self.template_config_path = inferred
-        self.templates = load_templates(cfg_path)
-        # debug: log which config is used for matching
-        try:
+        if cfg_path != self._templates_source:
             path_str = str(cfg_path) if cfg_path else "(default assets)"
             self.log(f"加载模板配置: {path_str}", level="INFO")
-        except Exception:
-            pass
+            self._templates_source = cfg_path
+        templates = template_registry.templates(cfg_path)
+        if templates is not self._registry_templates:
+            self._registry_templates = templates
+            self.templates = dict(templates)
         if isinstance(template_or_key, Template):
             return template_or_key
         key = str(template_or_key)
@@ -103,40 +282,162 @@ class TaskBase:
 
     def _match(self, template: Template, threshold: Optional[float] = None) -> Optional[MatchResult]:
         # Always use最新截图避免旧图导致误判/重复点击
-        self.screenshot()
-        window_rect = self._get_window_rect()
-        w = window_rect[2] - window_rect[0]
-        h = window_rect[3] - window_rect[1]
-        tpl = template
-        tpl.threshold = threshold or tpl.threshold
-        return tpl.find(self._last_image, (w, h))
+        frame = self._capture_for([template])
+        # Templates are shared through the registry, never mutate them per call.
+        return self._checked(template.find(frame, frame.size, threshold=threshold, should_stop=self.should_stop))
+
+    def _match_many(self, templates: Iterable[Template], threshold: Optional[float], first_hit: bool) -> Dict[str, Optional[MatchResult]]:
+        templates = list(templates)
+        frame = self._capture_for(templates)
+        results = self._checked(
+            find_many(templates, frame, frame.size, threshold=threshold, first_hit=first_hit, should_stop=self.should_stop)
+        )
+        return {tpl.key: result for tpl, result in zip(templates, results)}
 
     # Public APIs for scripts
+    def match_many(
+        self, templates_or_keys: Iterable, threshold: Optional[float] = None, first_hit: bool = False
+    ) -> Dict[str, Optional[MatchResult]]:
+        """Match several templates against a single screenshot, keyed by template key."""
+        templates = [self.resolve_template(item) for item in templates_or_keys]
+        return self._match_many(templates, threshold, first_hit)
+
+    def appear_any(self, templates_or_keys: Iterable, threshold: Optional[float] = None) -> Optional[str]:
+        """Return the key of the first template found on one screenshot, or None."""
+        templates = [self.resolve_template(item) for item in templates_or_keys]
+        return self._best_key(self._match_many(templates, threshold, first_hit=True))
+
+    @staticmethod
+    def _best_key(results: Dict[str, Optional[MatchResult]]) -> Optional[str]:
+        hits = [(key, res) for key, res in results.items() if res is not None]
+        if not hits:
+            return None
+        return max(hits, key=lambda item: item[1].confidence)[0]
+
     def appear(self, template_or_key, threshold: Optional[float] = None) -> bool:
         template = self.resolve_template(template_or_key)
         return self._match(template, threshold) is not None
 
+    def find_all(
+        self, template_or_key, threshold: Optional[float] = None, max_results: Optional[int] = None
+    ) -> List[MatchResult]:
+        """Every occurrence of a template on a fresh screenshot, top-to-bottom."""
+        template = self.resolve_template(template_or_key)
+        frame = self._capture_for([template])
+        return self._checked(template.find_all(frame, frame.size, threshold=threshold, max_results=max_results))
+
+    def _poll(
+        self,
+        check: Callable[[Frame], Optional[T]],
+        timeout: float,
+        interval: float,
+        templates: Optional[Iterable[Template]] = None,
+    ) -> Optional[T]:
+        """
+        Capture once per tick and run check on the frame until it returns a value.
+        With templates, each tick grabs only their search regions.
+
+        The delay between ticks grows while the window content stays identical
+        and drops back below interval as soon as it changes. The loop uses a
+        monotonic clock and raises TaskStopped once the task is asked to stop.
+        """
+        deadline = time.monotonic() + timeout
+        pacer = PollPacer(interval)
+        templates = list(templates) if templates is not None else None
+        while True:
+            frame = self._capture_for(templates) if templates is not None else self.capture()
+            value = self._checked(check(frame))
+            if value:
+                self._mark_progress()
+                return value
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._wait(min(pacer.next_delay(frame.digest()), remaining))
+
+    # Public methods call these private helpers rather than each other, so
+    # AsyncTaskBase can make the public API awaitable without breaking them.
+    def _wait_match(
+        self, template: Template, timeout: float, interval: float, threshold: Optional[float] = None
+    ) -> Optional[MatchResult]:
+        return self._poll(
+            lambda frame: template.find(frame, frame.size, threshold=threshold, should_stop=self.should_stop),
+            timeout,
+            interval,
+            templates=[template],
+        )
+
+    def wait_match(
+        self, template_or_key, timeout: float = 10, interval: float = 0.5, threshold: Optional[float] = None
+    ) -> Optional[MatchResult]:
+        """Wait until the template appears and return its match (on self._last_frame)."""
+        return self._wait_match(self.resolve_template(template_or_key), timeout, interval, threshold)
+
     def wait_appear(self, template_or_key, timeout: float = 10, interval: float = 0.5, threshold: Optional[float] = None) -> bool:
-        start = time.time()
-        while time.time() - start <= timeout:
-            if self.should_stop():
-                return False
-            if self.appear(template_or_key, threshold=threshold):
-                return True
-            time.sleep(interval)
-            self.screenshot()
-        return False
+        return self._wait_match(self.resolve_template(template_or_key), timeout, interval, threshold) is not None
 
     def disappear(self, template_or_key, timeout: float = 10, interval: float = 0.5) -> bool:
-        start = time.time()
-        while time.time() - start <= timeout:
-            if self.should_stop():
-                return False
-            if not self.appear(template_or_key):
-                return True
-            time.sleep(interval)
-            self.screenshot()
-        return False
+        template = self.resolve_template(template_or_key)
+        return bool(
+            self._poll(
+                lambda frame: template.find(frame, frame.size, should_stop=self.should_stop) is None,
+                timeout,
+                interval,
+                templates=[template],
+            )
+        )
+
+    def _submit_click(self, template: Template, match: MatchResult, interval: float) -> Future:
+        # Never click for a task that was stopped while it was matching.
+        self._checkpoint()
+        future = self._input.submit_click_rect(
+            match.rect,
+            mode=template.click_mode,
+            padding=template.padding,
+            interval=interval,
+            window_rect=self._last_frame.window_rect if self._last_frame else None,
+        )
+        future.add_done_callback(self._input_done)
+        return future
+
+    def _input_done(self, future: Future) -> None:
+        # Runs on the dispatcher thread once the click happened.
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._last_action_at = max(self._last_action_at, future.result())
+        self._mark_progress()
+
+    def _click_match(self, template: Template, match: MatchResult, interval: float) -> None:
+        finished = self._input.result(self._submit_click(template, match, interval))
+        # Set here as well: waiters may wake before the done callback ran.
+        self._last_action_at = max(self._last_action_at, finished)
+        self._wait(interval)
+
+    def submit_click(
+        self, template_or_key, threshold: Optional[float] = None, interval: float = 0.2
+    ) -> Optional[Future]:
+        """
+        Match now and queue the click without waiting for it; None when not found.
+
+        The returned Future completes once the click happened, so the script can
+        capture or match elsewhere meanwhile. Captures only wait for clicks that
+        already happened; call wait_input() before checking the click's effect.
+        """
+        template = self.resolve_template(template_or_key)
+        match = self._match(template, threshold)
+        if not match:
+            self.log(f"未匹配到模板: {template.key}", level="WARN")
+            return None
+        future = self._submit_click(template, match, interval)
+        self._pending_input = [f for f in self._pending_input if not f.done()] + [future]
+        return future
+
+    def wait_input(self) -> None:
+        """Wait until every click queued with submit_click() was performed."""
+        pending, self._pending_input = self._pending_input, []
+        for future in pending:
+            if not future.cancelled():
+                self._input.result(future)
 
     def click_template(self, template_or_key, threshold: Optional[float] = None, interval: float = 0.2) -> bool:
         template = self.resolve_template(template_or_key)
@@ -144,12 +445,7 @@ class TaskBase:
         if not match:
             self.log(f"未匹配到模板: {template.key}", level="WARN")
             return False
-        self._input.click_rect(
-            match.rect,
-            mode=template.click_mode,
-            padding=template.padding,
-            interval=interval,
-        )
+        self._click_match(template, match, interval)
         return True
 
     def appear_then_click(
@@ -159,26 +455,60 @@ class TaskBase:
         interval: float = 0.5,
         threshold: Optional[float] = None,
     ) -> bool:
-        if not self.wait_appear(template_or_key, timeout=timeout, interval=interval, threshold=threshold):
+        template = self.resolve_template(template_or_key)
+        # Click the match found by the wait instead of matching a third time.
+        match = self._wait_match(template, timeout, interval, threshold)
+        if not match:
             return False
-        return self.click_template(template_or_key, threshold=threshold, interval=interval)
+        self._click_match(template, match, interval)
+        return True
 
     def read_text(self, _template_or_key) -> str:
         # OCR placeholder: in a real implementation, tie into OCR engine.
         return ""
 
     def sleep(self, sec: float) -> None:
-        time.sleep(sec)
+        """Sleep that ends with TaskStopped as soon as the task is stopped."""
+        # A deliberate sleep is not a stall: the watchdog's progress clock starts after it.
+        self._mark_progress(time.time() + max(0.0, sec))
+        self._wait(sec)
+
+    def report_progress(self) -> None:
+        """Tell the watchdog the task is alive, for long stretches without clicks or waits."""
+        self._mark_progress()
 
     def log(self, msg: str, level: str = "INFO") -> None:
         log_store.log(msg, level=level, task_id=self.task_id or self.__class__.__name__)
 
     def request_stop(self) -> None:
         self._stop_event.set()
+        if self.task_id:
+            # Clicks still queued for a stopped task must not happen.
+            input_dispatcher.cancel(self.task_id)
 
     def should_stop(self) -> bool:
         return self._stop_event.is_set()
 
+    # Stop handling: every engine wait goes through _wait, so a stop is noticed within STOP_POLL.
+    def _checkpoint(self) -> None:
+        if self._stop_event.is_set():
+            raise TaskStopped()
+
+    def _checked(self, value: T) -> T:
+        # Results computed while stopping may be partial (cancelled matches); never act on them.
+        self._checkpoint()
+        return value
+
+    def _wait(self, seconds: float) -> None:
+        if seconds > 0:
+            self._stop_event.wait(seconds)
+        self._checkpoint()
+
+    def _mark_progress(self, at: Optional[float] = None) -> None:
+        self._progress_at = time.time() if at is None else at
+        if self._progress_hook:
+            self._progress_hook(self._progress_at)
+
     # Entry point to override
     def run(self, context: Optional[Dict[str, Any]] = None) -> None:
         raise NotImplementedError("TaskBase subclasses must implement run()")
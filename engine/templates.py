@@ -2,16 +2,20 @@ from __future__ import annotations
 
 import os
 import random
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 import yaml
 from PIL import Image
 
 from .config import get_assets_dir, get_images_dir, get_templates_config_path
+from .hotzones import hot_zones
 from .input import ClickPadding, pick_point
-from .vision import MatchResult, match_template
+from .registry import CachedImage, scale_cache, template_registry
+from .store import image_store, parse_ref
+from .vision import MatchJob, MatchResult, match_many, match_template_all
 
 SearchRegion = Dict[str, float]
 
@@ -39,22 +43,135 @@ class Template:
     description: str = ""
     threshold: float = 0.85
     method: str = "TM_CCOEFF_NORMED"
+    # Coarse-to-fine downscale factor (1 = full resolution only, 2 or 4 for large search areas).
+    pyramid: int = 1
+    # Optional (min, max) scale range searched when the window size/DPI differs from the base image.
+    scale_range: Optional[Tuple[float, float]] = None
+    scale_step: float = 0.05
+    # Cap on hits returned by find_all (list templates).
+    max_results: int = 50
     search_region: Optional[SearchRegion] = None
     click_mode: str = "center"
     padding: ClickPadding = field(default_factory=ClickPadding)
+    # templates.yaml this template was loaded from; the learned scale cache lives next to it.
+    config_path: Optional[Path] = None
+    # Explicit mask image (white = compare, black = ignore); PNG alpha is used when absent.
+    mask_file: Optional[Path] = None
 
     def load_image(self) -> Image.Image:
         return _load_image(self.file)
 
-    def find(self, image, window_size: Tuple[int, int]) -> Optional[MatchResult]:
-        region = _region_to_absolute(self.search_region, window_size)
-        return match_template(
-            image=image,
-            template=self.load_image(),
-            threshold=self.threshold,
-            region=region,
+    def cached_image(self) -> CachedImage:
+        """Decoded arrays shared through the template registry."""
+        return template_registry.image(self.file)
+
+    def mask_at(self, scale: float = 1.0) -> Optional[np.ndarray]:
+        """Match mask sized like the template at scale, or None for a plain rectangular match."""
+        cached = self.cached_image()
+        template = cached.gray_at(scale)
+        size = (template.shape[1], template.shape[0])
+        if self.mask_file:
+            return template_registry.image(self.mask_file).mask_sized(size, from_gray=True)
+        return cached.mask_sized(size)
+
+    def scales(self) -> List[float]:
+        if not self.scale_range:
+            return [1.0]
+        lo, hi = sorted(self.scale_range)
+        step = max(self.scale_step, 0.01)
+        count = int(round((hi - lo) / step)) + 1
+        return [round(lo + i * step, 4) for i in range(count)]
+
+    def learned_scale(self, window_size: Tuple[int, int]) -> Optional[float]:
+        if not self.scale_range or not self.config_path:
+            return None
+        return scale_cache.get(self.config_path, window_size, self.file)
+
+    def learn(self, result: Optional[MatchResult], window_size: Tuple[int, int]) -> None:
+        """Remember the winning scale for this window size so later checks skip the scale search."""
+        if result is None or not self.scale_range or not self.config_path:
+            return
+        scale_cache.put(self.config_path, window_size, self.file, result.scale)
+
+    def match_job(
+        self, window_size: Tuple[int, int], threshold: Optional[float] = None, learned: bool = True
+    ) -> MatchJob:
+        """learned=False searches every scale even when a scale was learned for window_size."""
+        cached = self.cached_image()
+        job = MatchJob(
+            template=cached.gray,
+            threshold=threshold or self.threshold,
+            region=_region_to_absolute(self.search_region, window_size),
             method=self.method,
+            pyramid=self.pyramid,
+            mask=self.mask_at(1.0),
         )
+        if self.scale_range:
+            scale = self.learned_scale(window_size) if learned else None
+            if scale is None:
+                job.scales = self.scales()
+            else:
+                job.template = cached.gray_at(scale)
+                job.mask = self.mask_at(scale)
+                job.scale = scale
+        mask_stamp = template_registry.image(self.mask_file).stamp if self.mask_file else None
+        job.key = (
+            str(self.config_path),
+            self.key,
+            str(self.file),
+            cached.stamp,
+            job.threshold,
+            job.method,
+            job.pyramid,
+            job.scale,
+            tuple(job.scales) if job.scales else None,
+            str(self.mask_file) if self.mask_file else None,
+            mask_stamp,
+        )
+        return job
+
+    def find(
+        self,
+        image,
+        window_size: Tuple[int, int],
+        threshold: Optional[float] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> Optional[MatchResult]:
+        return find_many([self], image, window_size, threshold=threshold, should_stop=should_stop)[0]
+
+    def find_all(
+        self, image, window_size: Tuple[int, int], threshold: Optional[float] = None, max_results: Optional[int] = None
+    ) -> List[MatchResult]:
+        """Every occurrence above threshold, with overlapping hits suppressed."""
+        learned = self.learned_scale(window_size)
+        results: List[MatchResult] = []
+        if learned is not None or not self.scale_range:
+            results = self._find_all_at(image, window_size, learned or 1.0, threshold, max_results)
+        if not results and self.scale_range:
+            # No scale learned for this window yet, or an outdated one (DPI change,
+            # re-cropped template): search every scale, then collect at the best one.
+            best = match_many(image, [self.match_job(window_size, threshold, learned=False)])[0]
+            if best is not None:
+                self.learn(best, window_size)
+                results = self._find_all_at(image, window_size, best.scale, threshold, max_results)
+        return results
+
+    def _find_all_at(
+        self, image, window_size: Tuple[int, int], scale: float, threshold: Optional[float], max_results: Optional[int]
+    ) -> List[MatchResult]:
+        cached = self.cached_image()
+        results = match_template_all(
+            image,
+            cached.gray_at(scale),
+            threshold=threshold or self.threshold,
+            region=_region_to_absolute(self.search_region, window_size),
+            method=self.method,
+            max_results=max_results or self.max_results,
+            mask=self.mask_at(scale),
+        )
+        for result in results:
+            result.scale = scale
+        return results
 
     def coord(self, match_rect: Optional[Tuple[int, int, int, int]] = None) -> Tuple[int, int]:
         if not match_rect:
@@ -62,6 +179,71 @@ class Template:
         return pick_point(match_rect, mode=self.click_mode, padding=self.padding)
 
 
+def find_many(
+    templates: Iterable[Template],
+    image,
+    window_size: Tuple[int, int],
+    threshold: Optional[float] = None,
+    first_hit: bool = False,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> List[Optional[MatchResult]]:
+    """
+    Match templates against one image.
+
+    Each template is searched in its hot-zone (recent hit area) first; only
+    the misses are retried over the configured search_region. A miss at a
+    learned scale is retried over every scale, and a hit there replaces the
+    learned scale, so an outdated one cannot cause permanent misses. When
+    should_stop returns True, jobs still in flight are cancelled and the
+    results must not be trusted.
+    """
+    templates = list(templates)
+    jobs = [tpl.match_job(window_size, threshold) for tpl in templates]
+    zones = [hot_zones.zone(tpl, window_size, job.region) for tpl, job in zip(templates, jobs)]
+    first = [replace(job, region=zone) if zone else job for job, zone in zip(jobs, zones)]
+    results = match_many(image, first, first_hit=first_hit, should_stop=should_stop)
+    if should_stop and should_stop():
+        return results
+    short_circuited = first_hit and any(r is not None for r in results)
+    for result, zone in zip(results, zones):
+        # Jobs cancelled by the first-hit short circuit are not real misses.
+        if zone and (result is not None or not short_circuited):
+            hot_zones.count(result is not None)
+    if not short_circuited:
+        retry = [idx for idx, (res, zone) in enumerate(zip(results, zones)) if res is None and zone]
+        if retry:
+            for idx, res in zip(retry, match_many(image, [jobs[i] for i in retry], first_hit=first_hit, should_stop=should_stop)):
+                results[idx] = res
+        rescale = [
+            idx
+            for idx, (res, job) in enumerate(zip(results, jobs))
+            if res is None and job.scales is None and templates[idx].scale_range
+        ]
+        if rescale and not (should_stop and should_stop()):
+            retry_jobs = [templates[i].match_job(window_size, threshold, learned=False) for i in rescale]
+            for idx, res in zip(rescale, match_many(image, retry_jobs, first_hit=first_hit, should_stop=should_stop)):
+                results[idx] = res
+    for tpl, result in zip(templates, results):
+        tpl.learn(result, window_size)
+        hot_zones.record(tpl, result, window_size)
+    return results
+
+
+def capture_regions(templates: Iterable[Template], window_size: Tuple[int, int]) -> Optional[List[Tuple[int, int, int, int]]]:
+    """
+    Absolute search regions of templates, i.e. everything a check on them reads.
+
+    None when any template searches the whole window, so the full window must be captured.
+    """
+    regions = []
+    for tpl in templates:
+        region = _region_to_absolute(tpl.search_region, window_size)
+        if region is None:
+            return None
+        regions.append(region)
+    return regions or None
+
+
 class ImageTemplate(Template):
     pass
 
@@ -98,14 +280,35 @@ def _padding_from_dict(data: Dict) -> ClickPadding:
     )
 
 
-def template_from_definition(key: str, definition: Dict, assets_dir: Path | None = None) -> Template:
+def _scale_range_from_definition(match: Dict) -> Optional[Tuple[float, float]]:
+    raw = match.get("scale_range")
+    if not raw:
+        return None
+    lo, hi = (float(v) for v in raw)
+    return (lo, hi) if lo > 0 and hi > 0 else None
+
+
+def _image_path(value: str, assets_dir: Path) -> Path:
+    digest = parse_ref(value)
+    if digest:
+        return image_store.resolve(digest)
+    raw = Path(value)
+    # Always resolve relative to the templates.yaml folder (assets_dir)
+    # so per-task images (tasks/<id>/images/xxx.png) are respected.
+    return raw if raw.is_absolute() else Path(assets_dir) / raw
+
+
+def template_from_definition(
+    key: str, definition: Dict, assets_dir: Path | None = None, config_path: Path | None = None
+) -> Template:
     """
     Resolve template config to Template instance.
 
     If file is absolute, keep it; otherwise always resolve relative to the
     templates.yaml directory (assets_dir). The previous behavior forced
     paths like images/foo.png back to the global assets dir, causing task
-    templates to ignore updated images in their own folders.
+    templates to ignore updated images in their own folders. blake2b:<digest>
+    values of file/mask name an object of the image store (engine.store).
     """
     assets_dir = assets_dir or get_images_dir()
     clazz = definition.get("type", "click").lower()
@@ -118,13 +321,8 @@ def template_from_definition(key: str, definition: Dict, assets_dir: Path | None
         "list": ListTemplate,
     }
     cls = cls_map.get(clazz, Template)
-    raw_file = Path(definition["file"])
-    if raw_file.is_absolute():
-        file_path = raw_file
-    else:
-        # Always resolve relative to the templates.yaml folder (assets_dir)
-        # so per-task images (tasks/<id>/images/xxx.png) are respected.
-        file_path = Path(assets_dir) / raw_file
+    file_path = _image_path(definition["file"], assets_dir)
+    mask_file = _image_path(definition["mask"], assets_dir) if definition.get("mask") else None
     padding = _padding_from_dict(definition.get("click", {}).get("padding", {})) if definition.get("click") else ClickPadding()
     return cls(
         key=key,
@@ -132,9 +330,15 @@ def template_from_definition(key: str, definition: Dict, assets_dir: Path | None
         description=definition.get("description", ""),
         threshold=float(definition.get("match", {}).get("threshold", 0.85)),
         method=definition.get("match", {}).get("method", "TM_CCOEFF_NORMED"),
+        pyramid=max(1, int(definition.get("match", {}).get("pyramid", 1) or 1)),
+        scale_range=_scale_range_from_definition(definition.get("match", {})),
+        scale_step=float(definition.get("match", {}).get("scale_step", 0.05)),
+        max_results=int(definition.get("match", {}).get("max_results", 50)),
         search_region=definition.get("search_region"),
         click_mode=definition.get("click", {}).get("mode", "center"),
         padding=padding,
+        config_path=config_path,
+        mask_file=mask_file,
     )
 
 
@@ -145,10 +349,15 @@ def load_templates(config_path: Path | str | os.PathLike | None = None) -> Dict[
     if not path.exists():
         return {}
     data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    return templates_from_data(data, path)
+
+
+def templates_from_data(data: Dict, path: Path) -> Dict[str, Template]:
+    """Templates of an already parsed templates.yaml (e.g. from a compiled bundle index)."""
     templates: Dict[str, Template] = {}
     for key, definition in (data.get("templates") or {}).items():
         try:
-            templates[key] = template_from_definition(key, definition, assets_dir=path.parent)
+            templates[key] = template_from_definition(key, definition, assets_dir=path.parent, config_path=path)
         except Exception:
             # Skip malformed entries to avoid hard crashes.
             continue
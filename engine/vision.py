@@ -1,17 +1,43 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Optional, Tuple
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
 from PIL import Image
 
+from .frame import Frame
+
+ImageLike = Frame | Image.Image | np.ndarray
+
 
 @dataclass
 class MatchResult:
     rect: Tuple[int, int, int, int]
     confidence: float
+    scale: float = 1.0
+
+
+@dataclass
+class MatchJob:
+    template: Image.Image | np.ndarray
+    threshold: float = 0.8
+    region: Optional[Tuple[int, int, int, int]] = None
+    method: str = "TM_CCOEFF_NORMED"
+    pyramid: int = 1
+    # Candidate template scales; None means a single match at the template's own size.
+    scales: Optional[Sequence[float]] = None
+    # Scale the given template was already resized to, reported back in MatchResult.
+    scale: float = 1.0
+    # Identity of (template, match settings); jobs with a key are memoized per frame digest.
+    key: Optional[Hashable] = None
+    # uint8 mask (255 = compare, 0 = ignore) with the template's shape, or None.
+    mask: Optional[np.ndarray] = None
 
 
 METHODS = {
@@ -21,7 +47,9 @@ METHODS = {
 }
 
 
-def _to_gray(image: Image.Image | np.ndarray) -> np.ndarray:
+def _to_gray(image: ImageLike) -> np.ndarray:
+    if isinstance(image, Frame):
+        return image.gray
     if isinstance(image, Image.Image):
         image = np.array(image)
     if len(image.shape) == 3:
@@ -29,35 +57,127 @@ def _to_gray(image: Image.Image | np.ndarray) -> np.ndarray:
     return image
 
 
+def _score_map(area: np.ndarray, template: np.ndarray, cv_method: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Run matchTemplate and return scores where higher is always better."""
+    if mask is None:
+        res = cv2.matchTemplate(area, template, cv_method)
+    else:
+        res = cv2.matchTemplate(area, template, cv_method, mask=mask)
+    # For SQDIFF smaller is better; normalize logic for clarity.
+    if cv_method in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED):
+        res = 1 - res
+    if mask is not None:
+        # Masked normalization divides by zero on flat patches.
+        res = np.nan_to_num(res, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    return res
+
+
+def scale_mask(mask: Optional[np.ndarray], size: Tuple[int, int]) -> Optional[np.ndarray]:
+    """Resize a mask to (width, height) without blending ignored and compared pixels."""
+    if mask is None or (mask.shape[1], mask.shape[0]) == size:
+        return mask
+    return cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+
+
+def _best(scores: np.ndarray) -> Tuple[float, Tuple[int, int]]:
+    _, max_val, _, max_loc = cv2.minMaxLoc(scores)
+    return float(max_val), max_loc
+
+
+def _top_candidates(scores: np.ndarray, count: int) -> List[Tuple[int, int]]:
+    """Locations of the `count` strongest local maxima of a score map."""
+    peaks = scores >= cv2.dilate(scores, np.ones((3, 3), np.uint8))
+    ys, xs = np.nonzero(peaks)
+    if len(xs) > count:
+        values = scores[ys, xs]
+        keep = np.argpartition(values, -count)[-count:]
+        ys, xs = ys[keep], xs[keep]
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+# Below this size (after downscaling) a template carries too little detail
+# for the coarse pass to be trusted.
+MIN_PYRAMID_TEMPLATE = 8
+PYRAMID_CANDIDATES = 3
+
+
+def _search_area(image: ImageLike, region: Optional[Tuple[int, int, int, int]]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Gray search area and the window coordinate of its top-left corner."""
+    if isinstance(image, Frame):
+        return image.roi_with_offset(region)
+    source_arr = _to_gray(image)
+    if not region:
+        return source_arr, (0, 0)
+    x, y, w, h = region
+    return source_arr[y : y + h, x : x + w], (x, y)
+
+
+def _downscaled(image: ImageLike, area: np.ndarray, region: Optional[Tuple[int, int, int, int]], factor: int) -> np.ndarray:
+    # Frames memoize their downscaled views so several templates share one resize.
+    if isinstance(image, Frame):
+        return image.downscaled(factor, region)
+    return cv2.resize(area, (area.shape[1] // factor, area.shape[0] // factor), interpolation=cv2.INTER_AREA)
+
+
+def _locate(
+    area: np.ndarray,
+    template: np.ndarray,
+    cv_method: int,
+    pyramid: int = 1,
+    mask: Optional[np.ndarray] = None,
+    small_area: Optional[np.ndarray] = None,
+) -> Tuple[float, Tuple[int, int]]:
+    th, tw = template.shape[:2]
+    ah, aw = area.shape[:2]
+    factor = max(1, int(pyramid))
+    if factor == 1 or min(th, tw) // factor < MIN_PYRAMID_TEMPLATE:
+        return _best(_score_map(area, template, cv_method, mask))
+
+    # Coarse pass on a downscaled copy, then refine the strongest candidates
+    # at full resolution so the reported confidence keeps its meaning.
+    if small_area is None:
+        small_area = cv2.resize(area, (aw // factor, ah // factor), interpolation=cv2.INTER_AREA)
+    small_tpl = cv2.resize(template, (tw // factor, th // factor), interpolation=cv2.INTER_AREA)
+    small_mask = scale_mask(mask, (small_tpl.shape[1], small_tpl.shape[0]))
+    coarse = _score_map(small_area, small_tpl, cv_method, small_mask)
+    margin = factor * 2
+    best_val, best_loc = float("-inf"), (0, 0)
+    for cx, cy in _top_candidates(coarse, PYRAMID_CANDIDATES):
+        x0 = max(0, cx * factor - margin)
+        y0 = max(0, cy * factor - margin)
+        x1 = min(aw, cx * factor + tw + margin)
+        y1 = min(ah, cy * factor + th + margin)
+        val, loc = _best(_score_map(area[y0:y1, x0:x1], template, cv_method, mask))
+        if val > best_val:
+            best_val, best_loc = val, (loc[0] + x0, loc[1] + y0)
+    return best_val, best_loc
+
+
 def match_template(
-    image: Image.Image | np.ndarray,
+    image: ImageLike,
     template: Image.Image | np.ndarray,
     threshold: float = 0.8,
     region: Optional[Tuple[int, int, int, int]] = None,
     method: str = "TM_CCOEFF_NORMED",
+    pyramid: int = 1,
+    mask: Optional[np.ndarray] = None,
 ) -> Optional[MatchResult]:
-    source_arr = _to_gray(image)
-    template_arr = _to_gray(template)
+    """
+    Find the best match of template in image.
 
-    search_area = source_arr
-    offset_x = 0
-    offset_y = 0
-    if region:
-        x, y, w, h = region
-        offset_x, offset_y = x, y
-        search_area = source_arr[y : y + h, x : x + w]
+    pyramid > 1 enables a coarse-to-fine search: candidates are found on a
+    1/pyramid downscaled frame and template, then re-scored at full resolution.
+    mask limits the comparison to the template pixels where it is non-zero.
+    """
+    template_arr = _to_gray(template)
+    search_area, (offset_x, offset_y) = _search_area(image, region)
 
     cv_method = METHODS.get(method, cv2.TM_CCOEFF_NORMED)
-    res = cv2.matchTemplate(search_area, template_arr, cv_method)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-
-    # For SQDIFF smaller is better; normalize logic for clarity.
-    if cv_method in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED):
-        best_val = 1 - min_val
-        best_loc = min_loc
-    else:
-        best_val = max_val
-        best_loc = max_loc
+    small_area = None
+    factor = max(1, int(pyramid))
+    if factor > 1 and min(template_arr.shape[:2]) // factor >= MIN_PYRAMID_TEMPLATE:
+        small_area = _downscaled(image, search_area, region, factor)
+    best_val, best_loc = _locate(search_area, template_arr, cv_method, pyramid, mask, small_area)
 
     if best_val < threshold:
         return None
@@ -66,3 +186,287 @@ def match_template(
     h, w = template_arr.shape[:2]
     rect = (top_left[0], top_left[1], w, h)
     return MatchResult(rect=rect, confidence=float(best_val))
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, overlap: float = 0.3, max_results: Optional[int] = None) -> np.ndarray:
+    """
+    Greedy non-maximum suppression over (x, y, w, h) boxes.
+
+    Returns indices of the kept boxes, strongest first. Each round suppresses
+    every remaining box overlapping the current best by more than `overlap` IoU.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+    x1 = boxes[:, 0].astype(np.float64)
+    y1 = boxes[:, 1].astype(np.float64)
+    x2 = x1 + boxes[:, 2]
+    y2 = y1 + boxes[:, 3]
+    areas = boxes[:, 2].astype(np.float64) * boxes[:, 3]
+    order = np.argsort(scores)[::-1]
+    keep: List[int] = []
+    while order.size and (max_results is None or len(keep) < max_results):
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+        iw = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / (areas[best] + areas[rest] - inter)
+        order = rest[iou <= overlap]
+    return np.asarray(keep, dtype=np.intp)
+
+
+def match_template_all(
+    image: ImageLike,
+    template: Image.Image | np.ndarray,
+    threshold: float = 0.8,
+    region: Optional[Tuple[int, int, int, int]] = None,
+    method: str = "TM_CCOEFF_NORMED",
+    max_results: int = 50,
+    overlap: float = 0.3,
+    mask: Optional[np.ndarray] = None,
+) -> List[MatchResult]:
+    """
+    Find every occurrence of template above threshold.
+
+    Candidates are the local maxima of the score map; overlapping hits are
+    collapsed with NMS and at most max_results are kept. Results are ordered
+    top-to-bottom, left-to-right.
+    """
+    template_arr = _to_gray(template)
+    search_area, (offset_x, offset_y) = _search_area(image, region)
+
+    cv_method = METHODS.get(method, cv2.TM_CCOEFF_NORMED)
+    scores = _score_map(search_area, template_arr, cv_method, mask)
+    peaks = (scores >= threshold) & (scores >= cv2.dilate(scores, np.ones((3, 3), np.uint8)))
+    ys, xs = np.nonzero(peaks)
+    if not len(xs):
+        return []
+    th, tw = template_arr.shape[:2]
+    values = scores[ys, xs]
+    boxes = np.column_stack([xs, ys, np.full_like(xs, tw), np.full_like(xs, th)])
+    keep = nms(boxes, values, overlap=overlap, max_results=max_results)
+    keep = keep[np.lexsort((xs[keep], ys[keep]))]
+    return [
+        MatchResult(rect=(int(xs[i]) + offset_x, int(ys[i]) + offset_y, tw, th), confidence=float(values[i]))
+        for i in keep
+    ]
+
+
+def scale_template(template: np.ndarray, scale: float) -> np.ndarray:
+    if abs(scale - 1.0) < 1e-6:
+        return template
+    th, tw = template.shape[:2]
+    size = (max(1, int(round(tw * scale))), max(1, int(round(th * scale))))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(template, size, interpolation=interpolation)
+
+
+# Number of best-ranked scales re-scored at full resolution.
+SCALE_REFINE = 2
+
+
+def match_template_scales(
+    image: ImageLike,
+    template: Image.Image | np.ndarray,
+    scales: Sequence[float],
+    threshold: float = 0.8,
+    region: Optional[Tuple[int, int, int, int]] = None,
+    method: str = "TM_CCOEFF_NORMED",
+    pyramid: int = 1,
+    mask: Optional[np.ndarray] = None,
+) -> Optional[MatchResult]:
+    """
+    Search template over several scales.
+
+    Every scale is ranked on a downscaled search area; only the best
+    SCALE_REFINE scales are matched at full resolution. The winning scale is
+    reported in MatchResult.scale.
+    """
+    template_arr = _to_gray(template)
+    search_area, (offset_x, offset_y) = _search_area(image, region)
+    ah, aw = search_area.shape[:2]
+    th, tw = template_arr.shape[:2]
+    cv_method = METHODS.get(method, cv2.TM_CCOEFF_NORMED)
+
+    def _fits(tpl: np.ndarray, area: np.ndarray) -> bool:
+        return tpl.shape[0] <= area.shape[0] and tpl.shape[1] <= area.shape[1]
+
+    smallest = min(th, tw) * min(scales)
+    factor = next((f for f in (4, 2) if smallest / f >= MIN_PYRAMID_TEMPLATE), 1)
+    small_area = search_area
+    if factor > 1:
+        small_area = _downscaled(image, search_area, region, factor)
+    ranked: List[Tuple[float, float]] = []
+    for scale in scales:
+        small_tpl = scale_template(template_arr, scale / factor)
+        if not _fits(small_tpl, small_area):
+            continue
+        small_mask = scale_mask(mask, (small_tpl.shape[1], small_tpl.shape[0]))
+        val, _ = _best(_score_map(small_area, small_tpl, cv_method, small_mask))
+        ranked.append((val, scale))
+    ranked.sort(reverse=True)
+
+    best: Optional[Tuple[float, Tuple[int, int], float, Tuple[int, int]]] = None
+    for _, scale in ranked[:SCALE_REFINE]:
+        scaled = scale_template(template_arr, scale)
+        if not _fits(scaled, search_area):
+            continue
+        scaled_mask = scale_mask(mask, (scaled.shape[1], scaled.shape[0]))
+        val, loc = _locate(search_area, scaled, cv_method, pyramid, scaled_mask)
+        if best is None or val > best[0]:
+            best = (val, loc, scale, scaled.shape[:2])
+    if best is None or best[0] < threshold:
+        return None
+    val, loc, scale, (h, w) = best
+    return MatchResult(rect=(loc[0] + offset_x, loc[1] + offset_y, w, h), confidence=float(val), scale=scale)
+
+
+def run_match_job(image: ImageLike, job: MatchJob) -> Optional[MatchResult]:
+    if job.scales:
+        return match_template_scales(
+            image,
+            job.template,
+            job.scales,
+            threshold=job.threshold,
+            region=job.region,
+            method=job.method,
+            pyramid=job.pyramid,
+            mask=job.mask,
+        )
+    result = match_template(
+        image,
+        job.template,
+        threshold=job.threshold,
+        region=job.region,
+        method=job.method,
+        pyramid=job.pyramid,
+        mask=job.mask,
+    )
+    if result:
+        result.scale = job.scale
+    return result
+
+
+# cv2.matchTemplate releases the GIL, so a small shared pool scales across cores.
+MAX_MATCH_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# How often match_many re-checks should_stop while jobs are in flight.
+CANCEL_POLL = 0.05
+_match_pool: Optional[ThreadPoolExecutor] = None
+_match_pool_lock = threading.Lock()
+
+
+def get_match_pool() -> ThreadPoolExecutor:
+    global _match_pool
+    with _match_pool_lock:
+        if _match_pool is None:
+            _match_pool = ThreadPoolExecutor(max_workers=MAX_MATCH_WORKERS, thread_name_prefix="match")
+        return _match_pool
+
+
+_MISSING = object()
+
+
+class MatchMemo:
+    """
+    LRU memo of (job key, region, region digest) -> match result.
+
+    Polling loops re-check the same templates against frames that usually did
+    not change; those checks then cost a hash instead of a matchTemplate.
+    """
+
+    def __init__(self, max_entries: int = 512) -> None:
+        self._max = max_entries
+        self._entries: "OrderedDict[Hashable, Optional[MatchResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memo_avoided": 0, "memo_computed": 0}
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is _MISSING:
+                self._counters["memo_computed"] += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._counters["memo_avoided"] += 1
+        return replace(value) if value is not None else None
+
+    def put(self, key: Hashable, result: Optional[MatchResult]) -> None:
+        with self._lock:
+            self._entries[key] = replace(result) if result is not None else None
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            data = dict(self._counters)
+            data["memo_entries"] = len(self._entries)
+        return data
+
+
+match_memo = MatchMemo()
+
+
+def _run_job(frame: Frame, job: MatchJob) -> Optional[MatchResult]:
+    memo_key = None
+    if job.key is not None:
+        memo_key = (job.key, job.region, frame.digest(job.region))
+        cached = match_memo.get(memo_key)
+        if cached is not _MISSING:
+            return cached
+    result = run_match_job(frame, job)
+    if memo_key is not None:
+        match_memo.put(memo_key, result)
+    return result
+
+
+def match_many(
+    image: ImageLike,
+    jobs: Sequence[MatchJob],
+    first_hit: bool = False,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> List[Optional[MatchResult]]:
+    """
+    Run several template matches against one image.
+
+    The image is wrapped in a Frame so the gray conversion, region crops,
+    downscaled views and (for memoized jobs) region digests are computed once
+    and shared by every job. With first_hit the call returns as soon as any
+    job matches; jobs that did not finish by then report None. should_stop
+    is checked every CANCEL_POLL seconds; when it returns True the
+    remaining jobs are cancelled the same way.
+    """
+    frame = Frame.wrap(image)
+    # Convert once up front instead of racing the conversion in every worker.
+    frame.gray
+    results: List[Optional[MatchResult]] = [None] * len(jobs)
+    if should_stop and should_stop():
+        return results
+    if len(jobs) <= 1:
+        for idx, job in enumerate(jobs):
+            results[idx] = _run_job(frame, job)
+        return results
+
+    pool = get_match_pool()
+    pending = {pool.submit(_run_job, frame, job): idx for idx, job in enumerate(jobs)}
+    while pending:
+        done, _ = wait(list(pending), timeout=CANCEL_POLL if should_stop else None, return_when=FIRST_COMPLETED)
+        if should_stop and should_stop():
+            for future in pending:
+                future.cancel()
+            break
+        hit = False
+        for future in done:
+            idx = pending.pop(future)
+            results[idx] = future.result()
+            hit = hit or results[idx] is not None
+        if first_hit and hit:
+            for future in pending:
+                future.cancel()
+            break
+    return results
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
 import ctypes
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from typing import Callable, Dict, List, Optional, Tuple
 
 import psutil
@@ -11,92 +14,390 @@ try:
     import win32gui
     import win32process
 except ImportError as exc:  # pragma: no cover - runtime platform guard
-    raise RuntimeError("win32 APIs are required on Windows for window management") from exc
+    # Defer the failure to the first window call so headless capture backends
+    # (replay/in-memory frames) can still import the engine off Windows.
+    win32con = win32gui = win32process = None
+    _WIN32_IMPORT_ERROR: Optional[ImportError] = exc
+else:
+    _WIN32_IMPORT_ERROR = None
 
 
 Rect = Tuple[int, int, int, int]
 
+# The window index is re-enumerated when older than this; lookups in between
+# only re-validate the cached candidates.
+INDEX_TTL = 1.0
+# pid -> process name entries kept (LRU).
+PID_CACHE_SIZE = 256
+
+
+def _require_win32() -> None:
+    if _WIN32_IMPORT_ERROR is not None:
+        raise RuntimeError("win32 APIs are required on Windows for window management") from _WIN32_IMPORT_ERROR
+
 
 @dataclass
 class TargetWindowConfig:
     title_contains: Optional[str] = None
     process_name: Optional[str] = None
     hwnd: Optional[int] = None
-
-
-def _get_process_name(hwnd: int) -> str:
-    try:
-        _, pid = win32process.GetWindowThreadProcessId(hwnd)
-        return psutil.Process(pid).name()
-    except Exception:
-        return ""
+    # Selector mode: run one task instance per matching window (see TaskExecutor) instead of the first match.
+    multi: bool = False
+    max_windows: Optional[int] = None
 
 
 def _normalize_title(text: str) -> str:
     return text or ""
 
 
-def list_windows() -> List[Dict]:
-    windows: List[Dict] = []
+class WindowProvider:
+    """
+    Source of top-level windows and their properties.
 
-    def _enum_handler(hwnd: int, _: int) -> None:
-        if not win32gui.IsWindowVisible(hwnd):
-            return
-        title = win32gui.GetWindowText(hwnd)
-        if not title:
-            return
-        rect = win32gui.GetWindowRect(hwnd)
-        windows.append(
-            {
-                "hwnd": hwnd,
-                "title": title,
-                "process_name": _get_process_name(hwnd),
-                "rect": {"left": rect[0], "top": rect[1], "right": rect[2], "bottom": rect[3]},
-            }
-        )
+    WindowIndex builds lookups on these primitives, so the lookup logic runs
+    unchanged against the real desktop (Win32WindowProvider) or an in-memory
+    one (FakeWindowProvider).
+    """
 
-    win32gui.EnumWindows(_enum_handler, 0)
-    return windows
+    def enum_handles(self) -> List[int]:
+        """Visible top-level windows, in Z order (topmost first)."""
+        raise NotImplementedError
 
+    def is_window(self, hwnd: int) -> bool:
+        raise NotImplementedError
 
-def find_window(config: TargetWindowConfig) -> Optional[int]:
-    def _match(hwnd: int) -> bool:
-        title = _normalize_title(win32gui.GetWindowText(hwnd))
-        if config.title_contains and config.title_contains.lower() not in title.lower():
-            return False
-        if config.process_name:
-            return _get_process_name(hwnd).lower() == config.process_name.lower()
-        return True
+    def title(self, hwnd: int) -> str:
+        raise NotImplementedError
 
-    if config.hwnd:
-        return config.hwnd if win32gui.IsWindow(config.hwnd) else None
+    def pid(self, hwnd: int) -> int:
+        raise NotImplementedError
 
-    for info in list_windows():
-        if _match(info["hwnd"]):
-            return info["hwnd"]
-    return None
+    def process_name(self, pid: int) -> str:
+        raise NotImplementedError
 
+    def rect(self, hwnd: int) -> Rect:
+        raise NotImplementedError
 
-def activate_window(hwnd: int) -> None:
+    def activate(self, hwnd: int) -> None:
+        pass
+
+
+class Win32WindowProvider(WindowProvider):
+    def enum_handles(self) -> List[int]:
+        _require_win32()
+        handles: List[int] = []
+
+        def _enum_handler(hwnd: int, _: int) -> None:
+            if win32gui.IsWindowVisible(hwnd):
+                handles.append(hwnd)
+
+        win32gui.EnumWindows(_enum_handler, 0)
+        return handles
+
+    def is_window(self, hwnd: int) -> bool:
+        _require_win32()
+        return bool(win32gui.IsWindow(hwnd))
+
+    def title(self, hwnd: int) -> str:
+        _require_win32()
+        return win32gui.GetWindowText(hwnd)
+
+    def pid(self, hwnd: int) -> int:
+        _require_win32()
+        return win32process.GetWindowThreadProcessId(hwnd)[1]
+
+    def process_name(self, pid: int) -> str:
+        try:
+            return psutil.Process(pid).name()
+        except Exception:
+            return ""
+
+    def rect(self, hwnd: int) -> Rect:
+        _require_win32()
+        left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+        return left, top, right, bottom
+
+    def activate(self, hwnd: int) -> None:
+        """
+        Bring window to foreground without forcing resize/restore.
+        Only call SetForegroundWindow; if minimized, skip to avoid size changes.
+        """
+        try:
+            if win32gui.IsIconic(hwnd):  # minimized
+                return
+            ctypes.windll.user32.SetForegroundWindow(hwnd)
+        except Exception:
+            pass
+
+
+@dataclass
+class FakeWindow:
+    hwnd: int
+    title: str
+    pid: int = 1
+    process_name: str = "fake.exe"
+    rect: Rect = (0, 0, 800, 600)
+    visible: bool = True
+
+
+class FakeWindowProvider(WindowProvider):
     """
-    Bring window to foreground without forcing resize/restore.
-    Only call SetForegroundWindow; if minimized, skip to avoid size changes.
+    In-memory desktop for tests and benchmarks off Windows.
+
+    calls counts every primitive invoked, to measure how much work a lookup costs.
     """
-    try:
-        if win32gui.IsIconic(hwnd):  # minimized
-            return
-        ctypes.windll.user32.SetForegroundWindow(hwnd)
-    except Exception:
-        pass
+
+    def __init__(self, windows: Optional[List[FakeWindow]] = None) -> None:
+        self._windows: Dict[int, FakeWindow] = {}
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        for window in windows or []:
+            self.add(window)
+
+    def _count(self, name: str) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add(self, window: FakeWindow) -> FakeWindow:
+        with self._lock:
+            self._windows[window.hwnd] = window
+        return window
+
+    def remove(self, hwnd: int) -> None:
+        with self._lock:
+            self._windows.pop(hwnd, None)
+
+    def get(self, hwnd: int) -> Optional[FakeWindow]:
+        with self._lock:
+            return self._windows.get(hwnd)
+
+    def enum_handles(self) -> List[int]:
+        self._count("enum_handles")
+        with self._lock:
+            return [hwnd for hwnd, w in self._windows.items() if w.visible]
+
+    def is_window(self, hwnd: int) -> bool:
+        self._count("is_window")
+        return self.get(hwnd) is not None
+
+    def _require(self, hwnd: int) -> FakeWindow:
+        window = self.get(hwnd)
+        if window is None:
+            raise RuntimeError(f"invalid window handle: {hwnd}")
+        return window
+
+    def title(self, hwnd: int) -> str:
+        self._count("title")
+        window = self.get(hwnd)
+        return window.title if window else ""
+
+    def pid(self, hwnd: int) -> int:
+        self._count("pid")
+        return self._require(hwnd).pid
+
+    def process_name(self, pid: int) -> str:
+        self._count("process_name")
+        with self._lock:
+            return next((w.process_name for w in self._windows.values() if w.pid == pid), "")
+
+    def rect(self, hwnd: int) -> Rect:
+        self._count("rect")
+        return self._require(hwnd).rect
+
+
+@dataclass
+class WindowInfo:
+    hwnd: int
+    title: str
+    pid: int
+    process_name: str
+    rect: Optional[Rect] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict:
+        left, top, right, bottom = self.rect or (0, 0, 0, 0)
+        return {
+            "hwnd": self.hwnd,
+            "title": self.title,
+            "process_name": self.process_name,
+            "rect": {"left": left, "top": top, "right": right, "bottom": bottom},
+        }
+
+
+class WindowIndex:
+    """
+    Cached index of the titled, visible top-level windows.
+
+    refresh() is incremental: it enumerates handles and reads the title and
+    pid of each, but the process name only of windows it has not seen with
+    that pid before, with process names from a pid LRU. Lookups within
+    INDEX_TTL of the last refresh re-check just the cached candidates
+    (is_window, pid, title) instead of enumerating again, so a handle reused
+    by another process is never targeted. A pid leaves the LRU once none of
+    its windows is left, so a reused pid is never given a stale name.
+    """
+
+    def __init__(self, provider: WindowProvider, ttl: float = INDEX_TTL, pid_cache_size: int = PID_CACHE_SIZE) -> None:
+        self.provider = provider
+        self.ttl = ttl
+        self._pid_cache_size = pid_cache_size
+        self._pid_names: "OrderedDict[int, str]" = OrderedDict()
+        self._windows: Dict[int, WindowInfo] = {}
+        self._order: List[int] = []
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.RLock()
+        self._counters = {"refreshes": 0, "cache_lookups": 0, "pid_hits": 0, "pid_misses": 0}
+
+    def _process_name(self, pid: int) -> str:
+        name = self._pid_names.get(pid)
+        if name is not None:
+            self._pid_names.move_to_end(pid)
+            self._counters["pid_hits"] += 1
+            return name
+        self._counters["pid_misses"] += 1
+        name = self.provider.process_name(pid)
+        self._pid_names[pid] = name
+        while len(self._pid_names) > self._pid_cache_size:
+            self._pid_names.popitem(last=False)
+        return name
+
+    def refresh(self) -> List[WindowInfo]:
+        with self._lock:
+            windows: Dict[int, WindowInfo] = {}
+            order: List[int] = []
+            for hwnd in self.provider.enum_handles():
+                try:
+                    title = self.provider.title(hwnd)
+                    if not title:
+                        continue
+                    info = self._windows.get(hwnd)
+                    pid = self.provider.pid(hwnd)
+                    if info is None or info.pid != pid:
+                        # New window, or its handle was reused by another process.
+                        info = WindowInfo(hwnd=hwnd, title=title, pid=pid, process_name=self._process_name(pid))
+                    else:
+                        info.title = title
+                        # Rects move; read again on demand.
+                        info.rect = None
+                except Exception:
+                    # Window closed while enumerating.
+                    continue
+                windows[hwnd] = info
+                order.append(hwnd)
+            live_pids = {info.pid for info in windows.values()}
+            for pid in [pid for pid in self._pid_names if pid not in live_pids]:
+                del self._pid_names[pid]
+            self._windows, self._order = windows, order
+            self._refreshed_at = time.monotonic()
+            self._counters["refreshes"] += 1
+            return [windows[hwnd] for hwnd in order]
+
+    def _fresh(self) -> bool:
+        return self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.ttl
+
+    def windows(self, max_age: Optional[float] = None, with_rect: bool = False) -> List[WindowInfo]:
+        """Indexed windows in Z order, refreshed when older than max_age (default ttl)."""
+        with self._lock:
+            max_age = self.ttl if max_age is None else max_age
+            if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= max_age:
+                infos = self.refresh()
+            else:
+                infos = [self._windows[hwnd] for hwnd in self._order]
+            if with_rect:
+                for info in infos:
+                    if info.rect is None:
+                        try:
+                            info.rect = self.provider.rect(info.hwnd)
+                        except Exception:
+                            pass
+            return infos
+
+    def _still_matches(self, info: WindowInfo, config: TargetWindowConfig) -> bool:
+        try:
+            if not self.provider.is_window(info.hwnd) or self.provider.pid(info.hwnd) != info.pid:
+                return False
+            info.title = self.provider.title(info.hwnd)
+        except Exception:
+            return False
+        return bool(info.title) and _matches(info, config)
+
+    def find(self, config: TargetWindowConfig) -> List[int]:
+        """Handles of every indexed window matching config, in Z order."""
+        if config.hwnd:
+            # A bound handle is only re-validated, never looked up.
+            return [config.hwnd] if self.provider.is_window(config.hwnd) else []
+        with self._lock:
+            if self._fresh():
+                self._counters["cache_lookups"] += 1
+                hits = [
+                    hwnd
+                    for hwnd in self._order
+                    if _matches(self._windows[hwnd], config) and self._still_matches(self._windows[hwnd], config)
+                ]
+                if hits:
+                    return hits
+            return [info.hwnd for info in self.refresh() if _matches(info, config)]
+
+    def is_window(self, hwnd: int) -> bool:
+        return self.provider.is_window(hwnd)
+
+    def set_provider(self, provider: WindowProvider) -> WindowProvider:
+        with self._lock:
+            previous, self.provider = self.provider, provider
+            self._windows, self._order = {}, []
+            self._pid_names.clear()
+            self._refreshed_at = None
+        return previous
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, windows=len(self._windows), pids_cached=len(self._pid_names))
+
+
+def _matches(info: WindowInfo, config: TargetWindowConfig) -> bool:
+    title = _normalize_title(info.title)
+    if config.title_contains and config.title_contains.lower() not in title.lower():
+        return False
+    if config.process_name:
+        return info.process_name.lower() == config.process_name.lower()
+    return True
+
+
+window_index = WindowIndex(Win32WindowProvider())
+
+
+def get_window_provider() -> WindowProvider:
+    return window_index.provider
+
+
+def set_window_provider(provider: WindowProvider) -> WindowProvider:
+    """Replace the process-wide window provider (e.g. FakeWindowProvider off Windows); returns the previous one."""
+    return window_index.set_provider(provider)
+
+
+def list_windows(max_age: Optional[float] = None) -> List[Dict]:
+    """Titled visible windows with process name and rect; served from the index when younger than max_age."""
+    return [info.to_dict() for info in window_index.windows(max_age=max_age, with_rect=True)]
+
+
+def find_windows(config: TargetWindowConfig) -> List[int]:
+    """Every visible window matching the title/process filters, in Z order; just hwnd when one is bound."""
+    return window_index.find(config)
+
+
+def find_window(config: TargetWindowConfig) -> Optional[int]:
+    matches = find_windows(config)
+    return matches[0] if matches else None
+
+
+def activate_window(hwnd: int) -> None:
+    window_index.provider.activate(hwnd)
 
 
 def get_window_rect(hwnd: int) -> Rect:
-    left, top, right, bottom = win32gui.GetWindowRect(hwnd)
-    return left, top, right, bottom
+    return window_index.provider.rect(hwnd)
 
 
 def window_exists(hwnd: int) -> bool:
-    return win32gui.IsWindow(hwnd)
+    return window_index.is_window(hwnd)
 
 
 def map_window_to_screen(
@@ -30,6 +30,11 @@ echo [BUILD] copy frontend dist -> frontend/ ...
 if exist ..\frontend rmdir /S /Q ..\frontend
 xcopy ..\ui\dist ..\frontend /E /I /Y
 
+echo [BUILD] compile template bundles...
+pushd ..
+python -m engine.bundle
+popd
+
 echo [BUILD] pyinstaller backend (single exe)...
 pushd ..
 pyinstaller --onefile --name AutoClickFramework backend\run_app.py